@@ -1,16 +1,34 @@
 from django.contrib import admin
-from .models import Book, Quote, CachedVerse, SearchCache
+from django.utils import timezone
+from . import renditions
+from .models import Book, Quote, QuoteRange, QuoteRendition, CachedVerse, SearchCache, NegativeCache, CacheJob, Lease
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ('name', 'api_id', 'canonical_order')
     ordering = ('canonical_order',)
 
+class QuoteRangeInline(admin.TabularInline):
+    model = QuoteRange
+    extra = 0
+
 @admin.register(Quote)
 class QuoteAdmin(admin.ModelAdmin):
     list_display = ('book', 'reference', 'created_at')
     list_filter = ('book', 'created_at')
     ordering = ('book__canonical_order', 'reference')
+    inlines = [QuoteRangeInline]
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline range edits send no signal; the rendition carries the preview, stamp and ETag
+        renditions.refresh([form.instance.id])
+
+@admin.register(QuoteRendition)
+class QuoteRenditionAdmin(admin.ModelAdmin):
+    list_display = ('quote', 'verse_count', 'cached_count', 'missing_count', 'updated_at')
+    list_select_related = ('quote__book',)
+    ordering = ('-missing_count',)
 
 @admin.register(CachedVerse)
 class CachedVerseAdmin(admin.ModelAdmin):
@@ -21,5 +39,39 @@ class CachedVerseAdmin(admin.ModelAdmin):
 
 @admin.register(SearchCache)
 class SearchCacheAdmin(admin.ModelAdmin):
-    list_display = ('query', 'created_at')
-    ordering = ('-created_at',)
\ No newline at end of file
+    list_display = ('query', 'size', 'fetched_at', 'last_accessed', 'created_at')
+    ordering = ('-last_accessed',)
+
+class NegativeCacheActiveFilter(admin.SimpleListFilter):
+    title = 'status'
+    parameter_name = 'status'
+    
+    def lookups(self, request, model_admin):
+        return (('active', 'Active'), ('expired', 'Expired'))
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'active':
+            return queryset.filter(expires_at__gt=timezone.now())
+        if self.value() == 'expired':
+            return queryset.filter(expires_at__lte=timezone.now())
+        return queryset
+
+@admin.register(CacheJob)
+class CacheJobAdmin(admin.ModelAdmin):
+    list_display = ('quote', 'status', 'priority', 'attempts', 'run_after', 'leased_by', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('quote__reference', 'last_error')
+    ordering = ('-priority', 'run_after')
+
+@admin.register(Lease)
+class LeaseAdmin(admin.ModelAdmin):
+    list_display = ('key', 'owner', 'acquired_at', 'expires_at')
+    search_fields = ('key', 'owner')
+    ordering = ('-acquired_at',)
+
+@admin.register(NegativeCache)
+class NegativeCacheAdmin(admin.ModelAdmin):
+    list_display = ('key', 'reason', 'detail', 'is_active', 'expires_at', 'created_at')
+    list_filter = (NegativeCacheActiveFilter, 'reason')
+    search_fields = ('key',)
+    ordering = ('-created_at',)
@@ -4,4 +4,7 @@ class QuotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quotes'
     verbose_name = 'Words of Christ'
+    
+    def ready(self):
+        from . import receivers  # noqa: F401 - connects the signal handlers
     
\ No newline at end of file
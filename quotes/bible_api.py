@@ -1,12 +1,31 @@
 # ========== quotes/bible_api.py (HYBRID APPROACH) ==========
 import requests
-import json
 import re
+import time
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from .models import Book, CachedVerse, SearchCache
+from .models import Book, CachedVerse
+from .http import transport
+from . import search as local_search
+from . import renditions
+from . import search_cache
+from . import negative_cache
+from . import leases
+from .singleflight import flights
+from . import versification
+from .resilience import UpstreamUnavailable, remaining
+from .metrics import query_cost
 
 class BibleAPIClient:
+    # Map API.Bible book IDs to simple API book names
+    book_mapping = {book.api_id: book.slug for book in versification.BOOKS}
+    
+    # Book rows by api_id, loaded once per process
+    _books = {}
+    _books_loaded_at = float('-inf')
+    
     def __init__(self):
         # API.Bible for search
         self.api_bible_key = settings.API_BIBLE_KEY
@@ -20,14 +39,25 @@ class BibleAPIClient:
         # Simple Bible API for verses
         self.simple_bible_base_url = "https://cdn.jsdelivr.net/gh/wldeh/bible-api/bibles"
         self.bible_version = "en-kjv"
+        
+        # Shared pooled sessions (one handshake per host per worker)
+        self.http = transport
+        
+        # 'chapter' pulls the whole chapter once per missing verse, 'verse' one file per verse
+        self.fetch_mode = getattr(settings, 'BIBLE_FETCH_MODE', 'chapter')
+        
+        # With a local corpus imported (import_corpus), verses never leave the database
+        self.offline = getattr(settings, 'BIBLE_OFFLINE_CORPUS', False)
     
     def get_books(self):
         """Get all books from API.Bible"""
         url = f"{self.api_bible_base_url}/bibles/{self.bible_id}/books"
         try:
-            response = requests.get(url, headers=self.api_bible_headers, timeout=10)
+            response = self.http.get(url, headers=self.api_bible_headers)
             if response.status_code == 200:
                 return response.json().get('data', [])
+        except UpstreamUnavailable as e:
+            print(f"Skipped fetching books: {e}")
         except requests.RequestException as e:
             print(f"Error fetching books: {e}")
         return []
@@ -44,45 +74,65 @@ class BibleAPIClient:
                 'cached': True
             }
         except CachedVerse.DoesNotExist:
-            pass
+            if self.offline:
+                return None
+        
+        # Known misses cost no round trip
+        if negative_cache.check(f"verse:{verse_id}"):
+            return None
+        
+        # Concurrent requests for the same verse share one upstream fetch
+        try:
+            return flights.do(f"verse:{verse_id}", lambda: self._fetch_verse(verse_id), timeout=remaining())
+        except UpstreamUnavailable:
+            return None
+    
+    def _fetch_verse(self, verse_id):
+        """Fetch an uncached verse upstream (chapter or single-verse mode)"""
+        negative_key = f"verse:{verse_id}"
         
         # Parse verse ID to get book, chapter, verse for simple API
         try:
-            parts = verse_id.split('.')
-            if len(parts) < 3:
+            parsed = versification.parse_verse_id(verse_id)
+            if parsed is None:
                 return None
                 
-            book_api_id = parts[0]
-            chapter = parts[1]
-            verse_number = parts[2]
+            book_api_id, chapter, verse_number = parsed
             
-            # Map API.Bible book IDs to simple API book names
-            book_mapping = {
-                'MAT': 'matthew', 'MRK': 'mark', 'LUK': 'luke', 'JHN': 'john',
-                'ACT': 'acts', '1CO': '1-corinthians', '2CO': '2-corinthians',
-                'REV': 'revelation'
-            }
-            
-            book_name = book_mapping.get(book_api_id)
+            book_name = self.book_mapping.get(book_api_id)
             if not book_name:
                 print(f"Unknown book ID: {book_api_id}")
+                negative_cache.record(negative_key, 'unknown_book')
+                return None
+            
+            if self.fetch_mode == 'chapter':
+                verses = self.get_chapter(book_api_id, chapter)
+                for verse in verses:
+                    if verse['id'] == verse_id:
+                        return verse
+                # Only a chapter fetched just now or cached in full proves the verse does not exist;
+                # a partial cache (another worker holds the chapter lease) proves nothing
+                fetched = any(not verse.get('cached') for verse in verses)
+                complete = (book_api_id in versification.BY_API_ID
+                            and len(verses) >= versification.verse_count(book_api_id, chapter))
+                if verses and (fetched or complete):
+                    negative_cache.record(negative_key, 'not_found', 'missing from chapter')
                 return None
             
             # Fetch from simple Bible API
             url = f"{self.simple_bible_base_url}/{self.bible_version}/books/{book_name}/chapters/{chapter}/verses/{verse_number}.json"
             
-            response = requests.get(url, timeout=10)
+            response = self.http.get(url)
             if response.status_code == 200:
                 data = response.json()
                 verse_text = data.get('text', '').strip()
                 
                 if verse_text:
                     # Create reference string
-                    book_display_name = book_name.replace('-', ' ').title()
-                    reference = f"{book_display_name} {chapter}:{verse_number}"
+                    reference = versification.reference(book_api_id, chapter, verse_number)
                     
                     # Cache the verse
-                    self._cache_verse_simple(verse_id, book_api_id, int(chapter), int(verse_number), verse_text, reference)
+                    self._cache_verse_simple(verse_id, book_api_id, chapter, verse_number, verse_text, reference)
                     
                     return {
                         'id': verse_id,
@@ -92,9 +142,15 @@ class BibleAPIClient:
                     }
             else:
                 print(f"Failed to fetch verse {verse_id}: HTTP {response.status_code}")
+                negative_cache.record(
+                    negative_key, self._failure_reason(response.status_code), f"HTTP {response.status_code}"
+                )
                 
+        except UpstreamUnavailable:
+            raise
         except requests.RequestException as e:
             print(f"Error fetching verse {verse_id}: {e}")
+            negative_cache.record(negative_key, 'network', str(e))
         except ValueError as e:
             print(f"Error parsing verse ID {verse_id}: {e}")
         except Exception as e:
@@ -102,18 +158,229 @@ class BibleAPIClient:
         
         return None
     
+    def get_chapter(self, book_api_id, chapter):
+        """Fetch a whole chapter from the simple Bible API and bulk-cache its verses"""
+        if self.offline:
+            return []
+        
+        negative_key = f"chapter:{book_api_id}.{chapter}"
+        if negative_cache.check(negative_key):
+            return []
+        
+        # Concurrent misses anywhere in this chapter share one upstream fetch in this
+        # process, and the chapter lease extends that to every process on the database
+        try:
+            return flights.do(negative_key, lambda: self._fetch_chapter_leased(book_api_id, chapter), timeout=remaining())
+        except UpstreamUnavailable:
+            return []
+    
+    def _fetch_chapter_leased(self, book_api_id, chapter):
+        """Fetch a chapter while holding its lease; without the lease, serve what is cached"""
+        wait = getattr(settings, 'LEASE_WAIT', 5)
+        left = remaining()
+        if left is not None:
+            wait = min(wait, max(left, 0))
+        
+        with leases.hold(f"chapter:{book_api_id}.{chapter}", wait=wait) as held:
+            # Another worker may have cached the chapter while this one waited for the lease
+            cached = self._cached_chapter(book_api_id, chapter)
+            if not held or len(cached) >= versification.verse_count(book_api_id, chapter):
+                return cached
+            return self._fetch_chapter(book_api_id, chapter)
+    
+    def _cached_chapter(self, book_api_id, chapter):
+        """A chapter's cached verses, in the same shape _fetch_chapter returns"""
+        return [
+            {
+                'id': verse.verse_id,
+                'reference': verse.reference,
+                'text': verse.text,
+                'verse_number': verse.verse_number,
+                'cached': True
+            }
+            for verse in CachedVerse.objects.filter(
+                ordinal__range=versification.chapter_range(book_api_id, chapter)
+            ).order_by('ordinal').only('verse_id', 'reference', 'text', 'verse_number')
+        ]
+    
+    def resolve_ranges(self, ranges):
+        """Verse dicts keyed by ordinal for (start, end) ordinal ranges.
+
+        Cached verses come from a single query; each chapter that still has
+        gaps is then fetched upstream once (nothing is fetched offline).
+        """
+        ordinals = [ordinal for start, end in ranges for ordinal in range(start, end + 1)]
+        merged = versification.compact(ordinals)
+        if not merged:
+            return {}
+        
+        covered = Q()
+        for start, end in merged:
+            covered |= Q(ordinal__range=(start, end))
+        found = {
+            verse.ordinal: {
+                'id': verse.verse_id,
+                'reference': verse.reference,
+                'text': verse.text,
+                'verse_number': verse.verse_number,
+                'cached': True
+            }
+            for verse in CachedVerse.objects.filter(covered).only(
+                'verse_id', 'reference', 'text', 'verse_number', 'ordinal'
+            )
+        }
+        
+        missing_chapters = sorted({
+            versification.unpack(ordinal)[:2] for ordinal in ordinals if ordinal not in found
+        })
+        for book_api_id, chapter in missing_chapters:
+            for verse in self.get_chapter(book_api_id, chapter):
+                found[versification.pack(book_api_id, chapter, verse['verse_number'])] = verse
+        return found
+    
+    def _fetch_chapter(self, book_api_id, chapter):
+        """Download a chapter file, split it into verses and bulk-cache them"""
+        negative_key = f"chapter:{book_api_id}.{chapter}"
+        book_name = self.book_mapping.get(book_api_id)
+        if not book_name:
+            print(f"Unknown book ID: {book_api_id}")
+            negative_cache.record(negative_key, 'unknown_book')
+            return []
+        
+        url = f"{self.simple_bible_base_url}/{self.bible_version}/books/{book_name}/chapters/{chapter}.json"
+        try:
+            response = self.http.get(url)
+            if response.status_code != 200:
+                print(f"Failed to fetch chapter {book_api_id}.{chapter}: HTTP {response.status_code}")
+                negative_cache.record(
+                    negative_key, self._failure_reason(response.status_code), f"HTTP {response.status_code}"
+                )
+                return []
+            payload = response.json()
+        except UpstreamUnavailable:
+            raise
+        except requests.RequestException as e:
+            print(f"Error fetching chapter {book_api_id}.{chapter}: {e}")
+            negative_cache.record(negative_key, 'network', str(e))
+            return []
+        except ValueError as e:
+            print(f"Error parsing chapter {book_api_id}.{chapter}: {e}")
+            return []
+        
+        rows = payload.get('data', []) if isinstance(payload, dict) else payload
+        
+        # Split the chapter into verses (the CDN occasionally repeats a verse; keep the first)
+        verses = {}
+        for row in rows:
+            try:
+                verse_number = int(row.get('verse'))
+            except (AttributeError, TypeError, ValueError):
+                continue
+            verse_text = (row.get('text') or '').strip()
+            if not verse_text or verse_number in verses:
+                continue
+            verses[verse_number] = {
+                'id': f"{book_api_id}.{chapter}.{verse_number}",
+                'reference': versification.reference(book_api_id, chapter, verse_number),
+                'text': verse_text,
+                'verse_number': verse_number,
+                'cached': False
+            }
+        
+        results = [verses[number] for number in sorted(verses)]
+        if results:
+            self._cache_chapter_bulk(book_api_id, chapter, results)
+        return results
+    
+    def refresh_quotes_covering(self, ordinals):
+        """Refresh the renditions of the quotes containing verses upserted in bulk.
+
+        bulk_create sends no post_save, so the bulk paths call this; the new
+        rendition stamps retire the quotes' cached fragments and the
+        quotes_changed signal re-indexes them.
+        """
+        return len(renditions.refresh_covering(ordinals))
+    
     def search_verses(self, query, limit=20, offset=0, sort='canonical'):
-        """Search for verses using API.Bible search"""
-        # Check cache first
-        cache_key = f"{query}:{limit}:{offset}:{sort}"
+        """Search for verses: API.Bible (through the search cache), or the local FTS5 index offline.
+        
+        The local index only holds the verses cached so far, so online it is
+        just the fallback when upstream cannot answer, flagged as partial.
+        """
+        if self.offline:
+            local = local_search.search(query, limit=limit, offset=offset, sort=sort)
+            return local if local is not None else {'verses': [], 'total': 0, 'query': query}
+        
+        # Serve the page by slicing cached windows of results
+        size = search_cache.window_size()
+        verses = []
+        total = 0
+        api_query = query
+        start = (offset // size) * size
+        while start < offset + limit:
+            window = self._search_window(query, sort, start)
+            if window is None:
+                return self._partial_search(query, limit, offset, sort)
+            
+            total = window.get('total', 0)
+            api_query = window.get('query', query)
+            verses.extend(window.get('verses', []))
+            if start + size >= total:
+                break
+            start += size
+        
+        skip = offset - (offset // size) * size
+        return {
+            'verses': verses[skip:skip + limit],
+            'total': total,
+            'query': api_query
+        }
+    
+    def _partial_search(self, query, limit, offset, sort):
+        """Matches among the cached verses only, for when upstream search is unavailable"""
+        local = local_search.search(query, limit=limit, offset=offset, sort=sort)
+        if local is None:
+            local = {'verses': [], 'total': 0, 'query': query}
+        local['partial'] = True
+        return local
+    
+    def _search_window(self, query, sort, start):
+        """One window of search results: cached, stale-while-revalidate, or fetched now"""
+        key = search_cache.window_key(query, sort, start)
+        normalized = search_cache.normalize_query(query)
+        size = search_cache.window_size()
+        
+        results, state = search_cache.lookup(key)
+        if state == 'stale':
+            search_cache.refresh_in_background(
+                key, lambda: self._fetch_search(normalized, size, start, sort)
+            )
+        if results is not None:
+            return results
+        
+        negative_key = f"search:{key}"
+        if negative_cache.check(negative_key):
+            return None
+        
+        def fetch_and_store():
+            results = self._fetch_search(normalized, size, start, sort, negative_key)
+            if results is not None:
+                search_cache.store(key, results)
+            return results
+        
+        # Concurrent identical searches share one upstream call and one cache write
         try:
-            cached = SearchCache.objects.get(query=cache_key)
-            if cached.is_fresh():
-                return cached.get_results()
-        except SearchCache.DoesNotExist:
-            pass
+            results = flights.do(negative_key, fetch_and_store, timeout=remaining())
+        except UpstreamUnavailable:
+            results = None
         
-        # Fetch from API.Bible
+        if results is None:
+            # Upstream down or out of budget: an expired window beats no answer
+            results, _ = search_cache.lookup(key, allow_expired=True)
+        return results
+    
+    def _fetch_search(self, query, limit, offset, sort, negative_key=None):
+        """Fetch one page of results from API.Bible (None on failure, recorded under negative_key)"""
         url = f"{self.api_bible_base_url}/bibles/{self.bible_id}/search"
         params = {
             'query': query,
@@ -123,13 +390,14 @@ class BibleAPIClient:
         }
         
         try:
-            response = requests.get(url, headers=self.api_bible_headers, params=params, timeout=15)
+            response = self.http.get(url, headers=self.api_bible_headers, params=params, read_timeout=15)
             if response.status_code == 200:
                 data = response.json().get('data', {})
                 verses = data.get('verses', [])
                 
-                # Process and cache verses
+                # Process verses, then cache the whole page in one write
                 results = []
+                harvested = []
                 for verse_data in verses:
                     # Clean the text from search results (API.Bible returns HTML)
                     raw_text = verse_data.get('text', '')
@@ -144,20 +412,9 @@ class BibleAPIClient:
                     }
                     results.append(verse_info)
                     
-                    # Cache individual verse from search (using API.Bible format)
-                    self._cache_verse_from_search(verse_data, clean_text)
+                    harvested.append((verse_data, clean_text))
                 
-                # Cache search results
-                SearchCache.objects.update_or_create(
-                    query=cache_key,
-                    defaults={
-                        'results': json.dumps({
-                            'verses': results,
-                            'total': data.get('total', 0),
-                            'query': data.get('query', query)
-                        })
-                    }
-                )
+                self._cache_verses_from_search(harvested)
                 
                 return {
                     'verses': results,
@@ -166,13 +423,25 @@ class BibleAPIClient:
                 }
             else:
                 print(f"API.Bible search failed: HTTP {response.status_code}")
+                if negative_key:
+                    negative_cache.record(
+                        negative_key, self._failure_reason(response.status_code), f"HTTP {response.status_code}"
+                    )
                 
+        except UpstreamUnavailable:
+            raise
         except requests.RequestException as e:
             print(f"Error searching: {e}")
+            if negative_key:
+                negative_cache.record(negative_key, 'network', str(e))
         except Exception as e:
             print(f"Unexpected error searching: {e}")
         
-        return {'verses': [], 'total': 0, 'query': query}
+        return None
+    
+    def _failure_reason(self, status_code):
+        """Negative cache reason for a non-200 upstream response"""
+        return 'not_found' if status_code in (400, 404) else 'upstream_error'
     
     def clean_verse_text(self, html_content):
         """Extract clean text from HTML content (for API.Bible search results)"""
@@ -190,10 +459,22 @@ class BibleAPIClient:
         
         return clean_text
     
+    def get_book(self, book_api_id):
+        """Book for an API.Bible id from the in-process map (None if we do not have it)"""
+        book = self._books.get(book_api_id)
+        if book is None and book_api_id and time.monotonic() - self._books_loaded_at > 60:
+            # Reload at most once a minute: setup_bible may have added books since
+            BibleAPIClient._books = {book.api_id: book for book in Book.objects.all()}
+            BibleAPIClient._books_loaded_at = time.monotonic()
+            book = self._books.get(book_api_id)
+        return book
+    
     def _cache_verse_simple(self, verse_id, book_api_id, chapter, verse_number, text, reference):
         """Cache a verse from simple Bible API"""
         try:
-            book = Book.objects.get(api_id=book_api_id)
+            book = self.get_book(book_api_id)
+            if book is None:
+                raise Book.DoesNotExist
             CachedVerse.objects.update_or_create(
                 verse_id=verse_id,
                 defaults={
@@ -201,7 +482,8 @@ class BibleAPIClient:
                     'chapter': chapter,
                     'verse_number': verse_number,
                     'text': text,
-                    'reference': reference
+                    'reference': reference,
+                    'ordinal': versification.pack(book_api_id, chapter, verse_number)
                 }
             )
         except Book.DoesNotExist:
@@ -209,32 +491,77 @@ class BibleAPIClient:
         except Exception as e:
             print(f"Error caching verse: {e}")
     
-    def _cache_verse_from_search(self, verse_data, clean_text):
-        """Cache a verse from API.Bible search results"""
+    def _cache_chapter_bulk(self, book_api_id, chapter, verses):
+        """Upsert all verses of a chapter with one INSERT and re-index the quotes covering them"""
+        book = self.get_book(book_api_id)
+        if book is None:
+            print(f"Book not found: {book_api_id}")
+            return
+        
         try:
-            verse_id = verse_data.get('id')
-            reference = verse_data.get('reference', '')
-            book_id = verse_data.get('bookId')
-            
-            if verse_id and clean_text:
-                parts = verse_id.split('.')
-                if len(parts) >= 3:
-                    chapter = int(parts[1])
-                    verse_num = int(parts[2])
-                    
-                    try:
-                        book = Book.objects.get(api_id=book_id)
-                        CachedVerse.objects.update_or_create(
-                            verse_id=verse_id,
-                            defaults={
-                                'book': book,
-                                'chapter': chapter,
-                                'verse_number': verse_num,
-                                'text': clean_text,
-                                'reference': reference
-                            }
+            with transaction.atomic():
+                CachedVerse.objects.bulk_create(
+                    [
+                        CachedVerse(
+                            verse_id=verse['id'],
+                            book=book,
+                            chapter=chapter,
+                            verse_number=verse['verse_number'],
+                            text=verse['text'],
+                            reference=verse['reference'],
+                            ordinal=versification.pack(book_api_id, chapter, verse['verse_number'])
                         )
-                    except Book.DoesNotExist:
-                        print(f"Book not found: {book_id}")
+                        for verse in verses
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['verse_id'],
+                    update_fields=['text', 'reference', 'ordinal']
+                )
+                self.refresh_quotes_covering([
+                    versification.pack(book_api_id, chapter, verse['verse_number']) for verse in verses
+                ])
         except Exception as e:
-            print(f"Error caching search verse: {e}")
\ No newline at end of file
+            print(f"Error caching chapter {book_api_id}.{chapter}: {e}")
+    
+    def _cache_verses_from_search(self, harvested):
+        """Upsert a page of API.Bible search results in one transaction and one INSERT"""
+        with query_cost('search ingestion') as report:
+            verses = {}
+            skipped = 0
+            for verse_data, clean_text in harvested:
+                verse_id = verse_data.get('id') or ''
+                parsed = versification.parse_verse_id(verse_id)
+                book = self.get_book(verse_data.get('bookId'))
+                if not clean_text or parsed is None or book is None:
+                    skipped += 1
+                    continue
+                _, chapter, verse_number = parsed
+                
+                verses[verse_id] = CachedVerse(
+                    verse_id=verse_id,
+                    book=book,
+                    chapter=chapter,
+                    verse_number=verse_number,
+                    text=clean_text,
+                    reference=verse_data.get('reference', ''),
+                    ordinal=versification.ordinal_for_verse_id(verse_id)
+                )
+            
+            try:
+                if verses:
+                    with transaction.atomic():
+                        CachedVerse.objects.bulk_create(
+                            list(verses.values()),
+                            update_conflicts=True,
+                            unique_fields=['verse_id'],
+                            update_fields=['text', 'reference', 'ordinal']
+                        )
+                        self.refresh_quotes_covering(
+                            [verse.ordinal for verse in verses.values() if verse.ordinal is not None]
+                        )
+            except Exception as e:
+                print(f"Error caching search verses: {e}")
+            
+            report['verses'] = len(verses)
+            report['skipped'] = skipped
+        return report
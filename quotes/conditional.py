@@ -0,0 +1,119 @@
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from .models import QuoteRendition
+
+DEFAULT_MAX_AGES = {
+    'listing': 60,
+    'detail': 300,
+    'api': 60,
+}
+
+
+def cache_policy(kind, revalidate=None):
+    """Add Cache-Control (HTTP_CACHE_MAX_AGE[kind]) and Vary to the view's 200 and 304 responses.
+
+    When revalidate(request, *args, **kwargs) is true (e.g. a quote still
+    loading) caches may store the response but must revalidate it first.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                if revalidate is not None and revalidate(request, *args, **kwargs):
+                    patch_cache_control(response, public=True, no_cache=True)
+                else:
+                    max_ages = {**DEFAULT_MAX_AGES, **getattr(settings, 'HTTP_CACHE_MAX_AGE', {})}
+                    patch_cache_control(response, public=True, max_age=max_ages[kind])
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        return wrapped
+    return decorator
+
+
+def content_version(request=None):
+    """(latest rendition update, rendition count) - moves whenever a quote's verses or the quote set change.
+
+    Memoized on the request (when given) so the ETag and Last-Modified
+    callbacks and the cache keys built from it share one query.
+    """
+    if request is not None and hasattr(request, '_content_version'):
+        return request._content_version
+    version = QuoteRendition.objects.aggregate(latest=Max('updated_at'), total=Count('pk'))
+    version = (version['latest'], version['total'])
+    if request is not None:
+        request._content_version = version
+    return version
+
+
+def content_version_key(request=None):
+    """content_version as a cache key suffix: every process reads the same version from the database"""
+    latest, total = content_version(request)
+    return f"{total}:{latest.timestamp() if latest else 0}"
+
+
+def quote_version(request, quote_id):
+    """(last update, missing verses) of one quote's rendition, or None (memoized per request)"""
+    if not hasattr(request, '_quote_version'):
+        request._quote_version = QuoteRendition.objects.filter(quote_id=quote_id).values_list(
+            'updated_at', 'missing_count'
+        ).first()
+    return request._quote_version
+
+
+def _is_search(request):
+    # API.Bible search results come from the search cache, not the quote data
+    return bool(request.GET.get('q', '').strip()) and request.GET.get('mode') == 'search'
+
+
+def listing_etag(request, *args, **kwargs):
+    """ETag for a listing page: data version plus the full query string"""
+    if _is_search(request):
+        return None
+    latest, total = content_version(request)
+    if latest is None:
+        return None
+    digest = hashlib.sha1(f"{latest.isoformat()}:{total}:{request.get_full_path()}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def listing_last_modified(request, *args, **kwargs):
+    if _is_search(request):
+        return None
+    return content_version(request)[0]
+
+
+def api_etag(request, *args, **kwargs):
+    """ETag for api_quotes (search requests, ?q=, are not validated)"""
+    if request.GET.get('q'):
+        return None
+    return listing_etag(request)
+
+
+def api_last_modified(request, *args, **kwargs):
+    if request.GET.get('q'):
+        return None
+    return content_version(request)[0]
+
+
+def detail_etag(request, quote_id):
+    """ETag for a fully cached quote; None while it is loading, so the view runs and queues the fill"""
+    if detail_incomplete(request, quote_id):
+        return None
+    version = quote_version(request, quote_id)
+    return f"quote-{quote_id}-{version[0].timestamp():.6f}"
+
+
+def detail_last_modified(request, quote_id):
+    if detail_incomplete(request, quote_id):
+        return None
+    return quote_version(request, quote_id)[0]
+
+
+def detail_incomplete(request, quote_id):
+    """True while some of the quote's verses are not cached yet (or it has no rendition)"""
+    version = quote_version(request, quote_id)
+    return version is None or version[1] > 0
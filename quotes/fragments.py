@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+from .models import Book, QuoteRendition
+from . import conditional
+
+BOOK_LIST_KEY = 'book_list'
+
+
+def ttl():
+    return getattr(settings, 'FRAGMENT_CACHE_TTL', 24 * 3600)
+
+
+def book_list(version=None):
+    """All books in canonical order, cached under the content version.
+
+    Book changes refresh the renditions of the book's quotes (see
+    receivers.book_changed and setup_bible), which moves the version for
+    every process; nothing has to reach into another process's cache.
+    """
+    key = f"{BOOK_LIST_KEY}:{version or conditional.content_version_key()}"
+    books = cache.get(key)
+    if books is None:
+        books = list(Book.objects.all())
+        cache.set(key, books, ttl())
+    return books
+
+
+def version_of(quote):
+    """Content version of a quote: its rendition stamp, or None when it has no rendition yet.
+
+    Fragment keys carry this version, so once a quote's verses change no
+    process can serve its old fragments; they simply age out.
+    """
+    try:
+        return f"{quote.rendition.updated_at.timestamp():.6f}"
+    except QuoteRendition.DoesNotExist:
+        return None
+
+
+def verses_key(quote_id, version):
+    return f"quote_verses:{quote_id}:{version}"
+
+
+def get_verses(quote):
+    """Cached detail verse list for the quote's current version, or None"""
+    version = version_of(quote)
+    if version is None:
+        return None
+    return cache.get(verses_key(quote.id, version))
+
+
+def set_verses(quote, verses):
+    version = version_of(quote)
+    if version is not None:
+        cache.set(verses_key(quote.id, version), verses, ttl())
@@ -0,0 +1,135 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils import timezone
+from .resilience import breakers, rate_limits, check_budget, BudgetExhausted
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class BibleTransport:
+    """Process-wide HTTP transport: one pooled keep-alive session per upstream host"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url):
+        """Return the shared session for the host of `url`, creating it on first use"""
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                pool_size = getattr(settings, 'BIBLE_HTTP_POOL_SIZE', 10)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Connection': 'keep-alive'})
+                self._sessions[host] = session
+        return session
+
+    def get(self, url, headers=None, params=None, read_timeout=None):
+        """GET with connect/read timeouts and jittered exponential backoff on 429/5xx.
+
+        Every attempt goes through the host's circuit breaker and rate limit
+        and is clamped to the caller's latency budget; CircuitOpen /
+        BudgetExhausted are raised instead of waiting on an upstream that
+        cannot answer in time.
+        """
+        session = self.session_for(url)
+        host = urlsplit(url).netloc
+        breaker = breakers.for_host(host)
+        connect_timeout = getattr(settings, 'BIBLE_HTTP_CONNECT_TIMEOUT', 3.05)
+        read_timeout = read_timeout or getattr(settings, 'BIBLE_HTTP_READ_TIMEOUT', 10)
+        max_retries = getattr(settings, 'BIBLE_HTTP_MAX_RETRIES', 3)
+
+        attempt = 0
+        while True:
+            # Rate limit and budget first: once the breaker lets a half-open probe through,
+            # nothing may raise before the call's outcome is recorded
+            left = check_budget()
+            if not rate_limits.wait(host, left):
+                raise BudgetExhausted(f"rate limit for {host} would overrun the budget")
+            left = check_budget()
+            breaker.before_call()
+            timeout = (connect_timeout, read_timeout)
+            if left is not None:
+                timeout = (min(connect_timeout, left), min(read_timeout, left))
+
+            started = time.monotonic()
+            try:
+                response = session.get(url, headers=headers, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                breaker.record(False, time.monotonic() - started)
+                if attempt >= max_retries:
+                    raise
+                self._sleep(self._backoff(attempt))
+            except requests.RequestException:
+                # Broken bodies, redirect loops, bad encodings: failures too, but not worth a retry
+                breaker.record(False, time.monotonic() - started)
+                raise
+            except BaseException:
+                # No outcome to record (a bug, Ctrl-C), but a half-open probe slot must not stay taken
+                breaker.release()
+                raise
+            else:
+                retryable = response.status_code in RETRY_STATUSES
+                breaker.record(not retryable, time.monotonic() - started)
+                if not retryable or attempt >= max_retries:
+                    return response
+                delay = self._retry_after(response)
+                response.close()
+                self._sleep(delay if delay is not None else self._backoff(attempt))
+            attempt += 1
+
+    def close(self):
+        """Close every pooled session (e.g. after forking a worker)"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+    def _sleep(self, delay):
+        """Back off, unless the wait alone would overrun the latency budget"""
+        left = check_budget()
+        if left is not None and delay >= left:
+            raise BudgetExhausted("no budget left to retry")
+        time.sleep(delay)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff delay in seconds"""
+        base = getattr(settings, 'BIBLE_HTTP_BACKOFF_BASE', 0.5)
+        cap = getattr(settings, 'BIBLE_HTTP_BACKOFF_MAX', 8)
+        return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        """Parse a Retry-After header (seconds or HTTP date), capped at the backoff max"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+
+        cap = getattr(settings, 'BIBLE_HTTP_BACKOFF_MAX', 8)
+        try:
+            return min(cap, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            delay = (parsedate_to_datetime(value) - timezone.now()).total_seconds()
+        except (TypeError, ValueError):
+            return None
+        return min(cap, max(0.0, delay))
+
+
+# Global instance
+transport = BibleTransport()
@@ -0,0 +1,249 @@
+import logging
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from django.conf import settings
+from .models import Quote, QuoteRendition
+
+logger = logging.getLogger('performance')
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lower-cased word tokens"""
+    return TOKEN_RE.findall(text.lower())
+
+
+class QuoteIndex:
+    """In-process inverted index over quote text, book name and reference.
+
+    Quotes are numbered by their canonical position (the Quote ordering), so
+    every posting list is a sorted array('I') of positions and results come
+    back already in listing order. Each quote also keeps its text as an
+    array of token ids, which is enough to verify phrase matches without
+    going back to the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._reset()
+
+    def _reset(self):
+        self._vocabulary = {}  # token -> token id
+        self._postings = []  # token id -> array('I') of positions
+        self._quote_ids = array('I')  # position -> Quote.id
+        self._positions = {}  # Quote.id -> position
+        self._books = []  # position -> book name
+        self._labels = []  # position -> "book reference", lower-cased
+        self._streams = []  # position -> array('I') of token ids
+
+    # Building
+
+    def build(self):
+        """(Re)build the whole index from the database"""
+        started = time.perf_counter()
+        quotes = Quote.objects.select_related('book', 'rendition')
+        with self._lock:
+            self._reset()
+            for position, quote in enumerate(quotes):
+                self._quote_ids.append(quote.id)
+                self._positions[quote.id] = position
+                self._books.append(quote.book.name)
+                self._labels.append(f"{quote.book.name} {quote.reference}".lower())
+                self._streams.append(array('I'))
+                self._add(position, quote, self._texts(quote))
+            self._built_at = time.monotonic()
+
+        logger.info(
+            f"Quote index built: {len(self._quote_ids)} quotes, {len(self._vocabulary)} tokens, "
+            f"{self.memory_footprint() // 1024} KiB in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    def refresh_quotes(self, quote_ids):
+        """Re-index the given quotes after verses were cached for them"""
+        if self._built_at is None:
+            return
+
+        quote_ids = set(quote_ids)
+        quotes = list(Quote.objects.filter(id__in=quote_ids).select_related('book', 'rendition'))
+        with self._lock:
+            if any(self._positions.get(quote_id) is not None for quote_id in quote_ids - {quote.id for quote in quotes}):
+                # Deleted quotes leave holes in the positions, rebuild lazily
+                self._built_at = None
+                return
+            for quote in quotes:
+                position = self._positions.get(quote.id)
+                if position is None:
+                    # A quote we have not seen: positions would shift, rebuild lazily
+                    self._built_at = None
+                    return
+                self._remove(position)
+                self._add(position, quote, self._texts(quote))
+
+    def ensure_built(self):
+        """Build on first use and again once the index is older than QUOTE_INDEX_MAX_AGE"""
+        max_age = getattr(settings, 'QUOTE_INDEX_MAX_AGE', 300)
+        if self._built_at is None or time.monotonic() - self._built_at > max_age:
+            self.build()
+
+    def _texts(self, quote):
+        """Verse text from the quote's rendition (none until it has one)"""
+        try:
+            return [quote.rendition.text]
+        except QuoteRendition.DoesNotExist:
+            return []
+
+    def _add(self, position, quote, texts):
+        stream = self._streams[position]
+        tokens = tokenize(quote.book.name) + tokenize(quote.reference)
+        for text in texts:
+            tokens.extend(tokenize(text))
+
+        for token in tokens:
+            token_id = self._vocabulary.get(token)
+            if token_id is None:
+                token_id = self._vocabulary[sys.intern(token)] = len(self._postings)
+                self._postings.append(array('I'))
+            stream.append(token_id)
+
+        for token_id in set(stream):
+            postings = self._postings[token_id]
+            i = bisect_left(postings, position)
+            if i == len(postings) or postings[i] != position:
+                insort(postings, position)
+
+    def _remove(self, position):
+        stream = self._streams[position]
+        for token_id in set(stream):
+            postings = self._postings[token_id]
+            i = bisect_left(postings, position)
+            if i < len(postings) and postings[i] == position:
+                postings.pop(i)
+        del stream[:]
+
+    # Querying
+
+    def position(self, quote_id):
+        """Listing position of a quote (the order search results come back in), or None"""
+        with self._lock:
+            return self._positions.get(quote_id)
+
+    def search(self, query, book=None):
+        """Quote ids matching `query`, in canonical order.
+
+        Words are ANDed, `OR` between words makes alternatives, "quoted
+        text" must appear as a phrase and a trailing * matches a prefix. A
+        query that is a substring of a quote's "book reference" label (e.g.
+        "5:3" or "john 3") also matches, as the old icontains filter did.
+        """
+        self.ensure_built()
+        with self._lock:
+            matched = set()
+            for clause in re.split(r'\s+OR\s+', query.strip()):
+                positions = self._match_clause(clause)
+                if positions is not None:
+                    matched.update(positions)
+
+            needle = query.strip().lower()
+            if needle:
+                matched.update(i for i, label in enumerate(self._labels) if needle in label)
+
+            return [
+                self._quote_ids[position]
+                for position in sorted(matched)
+                if not book or self._books[position] == book
+            ]
+
+    def _match_clause(self, clause):
+        """Positions matching every term of an AND clause (None when the clause has no terms)"""
+        result = None
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', clause):
+            if phrase:
+                tokens = tokenize(phrase)
+                positions = self._phrase(tokens) if tokens else None
+            else:
+                tokens = tokenize(word)
+                if not tokens:
+                    continue
+                if len(tokens) > 1:
+                    positions = self._phrase(tokens)
+                elif word.endswith('*'):
+                    positions = self._prefix(tokens[0])
+                else:
+                    positions = self._term(tokens[0])
+            if positions is None:
+                continue
+            result = positions if result is None else result & positions
+            if not result:
+                return result
+        return result
+
+    def _term(self, token):
+        token_id = self._vocabulary.get(token)
+        if token_id is None:
+            return set()
+        return set(self._postings[token_id])
+
+    def _prefix(self, prefix):
+        positions = set()
+        for token, token_id in self._vocabulary.items():
+            if token.startswith(prefix):
+                positions.update(self._postings[token_id])
+        return positions
+
+    def _phrase(self, tokens):
+        token_ids = [self._vocabulary.get(token) for token in tokens]
+        if None in token_ids:
+            return set()
+
+        candidates = set(self._postings[token_ids[0]])
+        for token_id in token_ids[1:]:
+            candidates &= set(self._postings[token_id])
+
+        pattern = array('I', token_ids)
+        width = len(pattern)
+        matches = set()
+        for position in candidates:
+            stream = self._streams[position]
+            start = 0
+            while True:
+                try:
+                    start = stream.index(pattern[0], start)
+                except ValueError:
+                    break
+                if stream[start:start + width] == pattern:
+                    matches.add(position)
+                    break
+                start += 1
+        return matches
+
+    # Introspection
+
+    def memory_footprint(self):
+        """Approximate bytes held by the index structures"""
+        with self._lock:
+            size = sys.getsizeof(self._vocabulary) + sys.getsizeof(self._postings)
+            size += sum(sys.getsizeof(token) for token in self._vocabulary)
+            size += sum(sys.getsizeof(postings) for postings in self._postings)
+            size += sum(sys.getsizeof(stream) for stream in self._streams)
+            size += sys.getsizeof(self._quote_ids) + sys.getsizeof(self._positions)
+            size += sum(sys.getsizeof(label) for label in self._labels)
+            return size
+
+    def stats(self):
+        """Counters for logging and debugging"""
+        return {
+            'quotes': len(self._quote_ids),
+            'tokens': len(self._vocabulary),
+            'postings': sum(len(postings) for postings in self._postings),
+            'bytes': self.memory_footprint(),
+        }
+
+
+# Global instance
+quote_index = QuoteIndex()
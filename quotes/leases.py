@@ -0,0 +1,84 @@
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+from .models import Lease
+
+
+def owner_id():
+    """Lease owner id for the calling thread, unique across hosts and processes"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def acquire(key, owner, ttl=None):
+    """Take the lease on `key` unless another owner holds an unexpired one. Returns True on success"""
+    now = timezone.now()
+    expires_at = now + timezone.timedelta(seconds=ttl or getattr(settings, 'LEASE_TTL', 60))
+    try:
+        with transaction.atomic():
+            Lease.objects.create(key=key, owner=owner, acquired_at=now, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        # Held already: take it over only if it expired (its holder died or hung)
+        return Lease.objects.filter(key=key, expires_at__lt=now).update(
+            owner=owner, acquired_at=now, expires_at=expires_at
+        ) == 1
+
+
+def release(key, owner):
+    Lease.objects.filter(key=key, owner=owner).delete()
+
+
+def renew(key, owner, ttl=None):
+    """Push back the expiry of a lease `owner` still holds. Returns False if it was lost"""
+    expires_at = timezone.now() + timezone.timedelta(seconds=ttl or getattr(settings, 'LEASE_TTL', 60))
+    return Lease.objects.filter(key=key, owner=owner).update(expires_at=expires_at) == 1
+
+
+def _keep_alive(key, owner, ttl, stop):
+    """Renew a held lease every third of its TTL until `stop` is set (runs on its own thread)"""
+    try:
+        while not stop.wait(ttl / 3):
+            if not renew(key, owner, ttl):
+                print(f"Lease {key} was lost before the work finished")
+                return
+    except DatabaseError as e:
+        print(f"Error renewing lease {key}: {e}")
+    finally:
+        connection.close()
+
+
+@contextmanager
+def hold(key, wait=0, ttl=None):
+    """Hold the lease on `key` for the block, waiting up to `wait` seconds for it.
+
+    Yields True when the lease was taken, False when another worker still
+    holds it; the block decides what to do then (usually serve whatever is
+    cached instead of repeating the other worker's upstream call). A held
+    lease is renewed in the background, so slow (rate-limited) work keeps it
+    past its TTL; only a dead holder's lease expires.
+    """
+    owner = owner_id()
+    ttl = ttl or getattr(settings, 'LEASE_TTL', 60)
+    deadline = time.monotonic() + max(wait or 0, 0)
+    held = acquire(key, owner, ttl)
+    while not held and time.monotonic() < deadline:
+        time.sleep(min(0.2, max(deadline - time.monotonic(), 0)))
+        held = acquire(key, owner, ttl)
+    if not held:
+        yield False
+        return
+
+    stop = threading.Event()
+    keeper = threading.Thread(target=_keep_alive, args=(key, owner, ttl, stop), name=f"lease-{key}", daemon=True)
+    keeper.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        keeper.join()
+        release(key, owner)
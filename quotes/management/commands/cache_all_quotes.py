@@ -1,10 +1,12 @@
+import time
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from quotes.models import Quote
-from quotes.tasks import verse_cache
+from quotes import planner, warmer
 
 class Command(BaseCommand):
-    help = 'Cache all Jesus quotes verses immediately'
-    
+    help = 'Cache the verses of every Jesus quote: missing chapters fetched in parallel within the upstream rate limits'
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--limit',
@@ -12,31 +14,96 @@ class Command(BaseCommand):
             default=None,
             help='Limit number of quotes to cache'
         )
-    
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'WARM_CONCURRENCY', 8),
+            help='Chapters fetched at the same time'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=str(getattr(settings, 'WARM_CHECKPOINT_FILE', 'cache_warm.checkpoint.json')),
+            help='Progress file an interrupted run resumes from'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint and plan from scratch'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the calls, verses and estimated time the warm would take'
+        )
+
     def handle(self, *args, **options):
         limit = options.get('limit')
-        quotes = Quote.objects.all()
-        
+        quote_ids = None
+
         if limit:
-            quotes = quotes[:limit]
-        
-        total_quotes = quotes.count()
-        self.stdout.write(f"Caching {total_quotes} quotes...")
-        
-        cached_count = 0
-        for i, quote in enumerate(quotes, 1):
-            try:
-                verses_cached = verse_cache.cache_quote_immediately(quote)
-                if verses_cached > 0:
-                    cached_count += 1
-                    self.stdout.write(f"[{i}/{total_quotes}] Cached {quote.book.name} {quote.reference} ({verses_cached} verses)")
-                else:
-                    self.stdout.write(f"[{i}/{total_quotes}] Already cached: {quote.book.name} {quote.reference}")
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"[{i}/{total_quotes}] Error caching {quote.book.name} {quote.reference}: {e}")
-                )
-        
+            quote_ids = list(Quote.objects.order_by('id').values_list('id', flat=True)[:limit])
+
+        checkpoint = warmer.Checkpoint(options['checkpoint'])
+        if not options['restart']:
+            checkpoint.load()
+
+        # One request per missing chapter, however many quotes share it
+        full_plan = planner.plan(quote_ids)
+        fetch_plan = full_plan.without(checkpoint.done)
+        resumed = len(full_plan.calls) - len(fetch_plan.calls)
+
+        if options['dry_run']:
+            if resumed:
+                self.stdout.write(f"{resumed} chapters skipped, already fetched by an earlier run")
+            for line in planner.report(fetch_plan):
+                self.stdout.write(line)
+            return
+
+        if options['restart']:
+            checkpoint.clear()
+        self.stdout.write(f"{len(fetch_plan.calls)} calls to make for {fetch_plan.quote_count} quotes")
+        if resumed:
+            self.stdout.write(f"Resuming: {resumed} chapters already fetched by an earlier run")
+        if not fetch_plan.calls:
+            checkpoint.clear()
+            self.stdout.write(self.style.SUCCESS("Everything is cached"))
+            return
+
+        self._last_report = 0.0
+        try:
+            fetched, failed = warmer.warm(
+                fetch_plan.calls,
+                concurrency=options['concurrency'],
+                checkpoint=checkpoint,
+                progress=self.report
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f"Interrupted; progress saved to {checkpoint.path}"))
+            return
+
+        for book_api_id, chapter in sorted(failed):
+            self.stdout.write(self.style.ERROR(f"Could not fetch {book_api_id} {chapter}"))
+
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f"Fetched {len(fetched)} chapters, {len(failed)} failed; run again to retry them"
+            ))
+        else:
+            checkpoint.clear()
+            self.stdout.write(self.style.SUCCESS(f"Successfully fetched {len(fetched)} chapters"))
+
+    def report(self, done, failed, total, started_at):
+        """Progress line with throughput and ETA, at most every 2 seconds (and at the end)"""
+        now = time.monotonic()
+        finished = done + failed
+        if finished < total and now - self._last_report < 2:
+            return
+        self._last_report = now
+
+        elapsed = max(now - started_at, 1e-6)
+        rate = finished / elapsed
+        eta = (total - finished) / rate if rate else 0
         self.stdout.write(
-            self.style.SUCCESS(f"Successfully processed {total_quotes} quotes, cached {cached_count} new ones")
+            f"[{finished}/{total}] {rate:.1f} calls/s, {failed} failed, "
+            f"elapsed {time.strftime('%H:%M:%S', time.gmtime(elapsed))}, ETA {time.strftime('%H:%M:%S', time.gmtime(eta))}"
         )
@@ -1,67 +1,48 @@
 from django.core.management.base import BaseCommand
-from django.db import transaction
-from quotes.models import Quote, CachedVerse
+from quotes.models import Quote
 from quotes.bible_api import BibleAPIClient
+from quotes import planner
 import time
 
 class Command(BaseCommand):
-    help = 'Safely cache quotes one by one'
-    
+    help = 'Safely cache quotes one upstream call at a time'
+
     def add_arguments(self, parser):
         parser.add_argument('--limit', type=int, default=10, help='Number of quotes to cache')
-        parser.add_argument('--delay', type=float, default=2.0, help='Delay between quotes in seconds')
-    
+        parser.add_argument('--delay', type=float, default=2.0, help='Delay between upstream calls in seconds')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the calls the run would make')
+
     def handle(self, *args, **options):
         limit = options['limit']
         delay = options['delay']
-        
+
+        quote_ids = list(Quote.objects.uncached().values_list('id', flat=True)[:limit])
+        self.stdout.write(f"Found {len(quote_ids)} uncached quotes")
+
+        # Verses shared by several of the quotes are fetched once, and chapters cost one call
+        fetch_plan = planner.plan(quote_ids)
+        if options['dry_run']:
+            for line in planner.report(fetch_plan):
+                self.stdout.write(line)
+            self.stdout.write(f"With --delay {delay:g}: at least {delay * max(len(fetch_plan.calls) - 1, 0):.0f}s")
+            return
+
         client = BibleAPIClient()
-        uncached_quotes = Quote.objects.filter(cached_verses__isnull=True).distinct()[:limit]
-        
-        self.stdout.write(f"Found {uncached_quotes.count()} uncached quotes")
-        
-        for i, quote in enumerate(uncached_quotes, 1):
-            self.stdout.write(f"[{i}/{len(uncached_quotes)}] Caching {quote.book.name} {quote.reference}...")
-            
-            verse_ids = quote.get_verse_ids_list()
-            cached_count = 0
-            
-            for verse_id in verse_ids:
-                try:
-                    # Check if exists
-                    if CachedVerse.objects.filter(verse_id=verse_id).exists():
-                        cached_verse = CachedVerse.objects.get(verse_id=verse_id)
-                        quote.cached_verses.add(cached_verse)
-                        continue
-                    
-                    # Fetch from API
-                    verse_data = client.get_verse(verse_id)
-                    if verse_data:
-                        with transaction.atomic():
-                            cached_verse, created = CachedVerse.objects.get_or_create(
-                                verse_id=verse_id,
-                                defaults={
-                                    'book': quote.book,
-                                    'chapter': int(verse_id.split('.')[1]),
-                                    'verse_number': int(verse_id.split('.')[2]),
-                                    'text': verse_data['text'],
-                                    'reference': verse_data['reference']
-                                }
-                            )
-                            quote.cached_verses.add(cached_verse)
-                            
-                        if created:
-                            cached_count += 1
-                        
-                        time.sleep(0.5)  # Be nice to API
-                        
-                except Exception as e:
-                    self.stdout.write(f"  Error with {verse_id}: {e}")
-            
-            self.stdout.write(f"  Cached {cached_count} new verses")
-            
-            # Delay between quotes
-            if i < len(uncached_quotes):
+        for i, call in enumerate(fetch_plan.calls, 1):
+            label = f"{call.api_id} {call.chapter}" if call.kind == 'chapter' else call.verse_ids[0]
+            self.stdout.write(f"[{i}/{len(fetch_plan.calls)}] Fetching {label} ({len(call.verse_ids)} missing verses)...")
+
+            try:
+                if not planner.execute(client, call):
+                    self.stdout.write(f"  Nothing returned for {label}")
+            except Exception as e:
+                self.stdout.write(f"  Error with {label}: {e}")
+
+            # Delay between calls
+            if i < len(fetch_plan.calls):
                 time.sleep(delay)
-        
-        self.stdout.write(self.style.SUCCESS("Done!"))
\ No newline at end of file
+
+        still_missing = len(planner.plan(quote_ids).missing)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done! Cached {len(fetch_plan.missing) - still_missing} verses, {still_missing} still missing"
+        ))
@@ -0,0 +1,27 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from quotes import snapshot
+
+class Command(BaseCommand):
+    help = 'Write the books, quotes and cached verses to a compressed snapshot file for import_cache on another node'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(getattr(settings, 'CACHE_SNAPSHOT_FILE', 'cache_snapshot.jsonl.gz')),
+            help='Snapshot file to write'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        started = time.monotonic()
+
+        counts = snapshot.write(path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {counts['book']} books, {counts['quote']} quotes and {counts['verse']} verses "
+            f"to {path} ({os.path.getsize(path) / 1024:.0f} KiB in {time.monotonic() - started:.1f}s)"
+        ))
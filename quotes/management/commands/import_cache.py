@@ -0,0 +1,53 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from quotes import snapshot
+
+class Command(BaseCommand):
+    help = 'Load a snapshot written by export_cache (replacing the cache, or merged into it with --merge)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(getattr(settings, 'CACHE_SNAPSHOT_FILE', 'cache_snapshot.jsonl.gz')),
+            help='Snapshot file to load'
+        )
+        parser.add_argument(
+            '--merge',
+            action='store_true',
+            help='Keep local books, quotes and verses; snapshot rows win where both have them'
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only check the snapshot (format, version, checksum) without loading it'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        started = time.monotonic()
+
+        try:
+            if options['verify']:
+                counts = {'book': 0, 'quote': 0, 'verse': 0}
+                for row in snapshot.read(path):
+                    counts[row[0]] += 1
+                self.stdout.write(self.style.SUCCESS(
+                    f"{path} is intact: {counts['book']} books, {counts['quote']} quotes, {counts['verse']} verses"
+                ))
+                return
+
+            # A bad checksum surfaces after the last row and rolls the whole import back
+            loader = snapshot.load(path, merge=options['merge'], batch_size=options['batch_size'])
+        except snapshot.SnapshotError as e:
+            raise CommandError(str(e))
+
+        counts = loader.counts
+        if loader.skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {loader.skipped} rows for unknown books"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Merged' if options['merge'] else 'Imported'} {counts['book']} books, {counts['quote']} quotes "
+            f"and {counts['verse']} verses in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,200 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from quotes.models import Book, Quote, CachedVerse
+from quotes.quotes_data import QUOTES
+from quotes import renditions, versification
+import csv
+import json
+import time
+import xml.etree.ElementTree as ET
+
+class Command(BaseCommand):
+    help = 'Load a local KJV corpus file (JSON, JSON Lines, CSV or OSIS XML) into the verse cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Corpus file on disk')
+        parser.add_argument(
+            '--format',
+            choices=['json', 'jsonl', 'csv', 'osis'],
+            default=None,
+            help='Corpus format (guessed from the file extension by default)'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        corpus_format = options['format'] or self.guess_format(path)
+        started = time.monotonic()
+
+        # Only the books our quotes live in
+        wanted = {versification.BY_QUOTES_KEY[name].api_id for name in QUOTES}
+        books = {book.api_id: book for book in Book.objects.filter(api_id__in=wanted)}
+        if not books:
+            raise CommandError("No books found - run setup_bible first")
+
+        readers = {
+            'json': self.read_json,
+            'jsonl': self.read_jsonl,
+            'csv': self.read_csv,
+            'osis': self.read_osis,
+        }
+
+        verses = []
+        seen = set()
+        skipped = 0
+        try:
+            for book_key, chapter, verse_number, text in readers[corpus_format](path):
+                info = versification.find_book(book_key)
+                book = books.get(info.api_id) if info else None
+                text = ' '.join((text or '').split())
+                if book is None or not text:
+                    skipped += 1
+                    continue
+
+                chapter, verse_number = int(chapter), int(verse_number)
+                verse_id = versification.verse_id(book.api_id, chapter, verse_number)
+                if verse_id in seen:
+                    continue
+                seen.add(verse_id)
+                verses.append(CachedVerse(
+                    verse_id=verse_id,
+                    book=book,
+                    chapter=chapter,
+                    verse_number=verse_number,
+                    text=text,
+                    reference=f"{book.name} {chapter}:{verse_number}",
+                    ordinal=versification.pack(book.api_id, chapter, verse_number)
+                ))
+        except (OSError, ValueError, ET.ParseError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        if not verses:
+            raise CommandError(f"No verses for {', '.join(sorted(books))} found in {path}")
+
+        with transaction.atomic():
+            CachedVerse.objects.bulk_create(
+                verses,
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['verse_id'],
+                update_fields=['text', 'reference', 'ordinal']
+            )
+
+        # Quotes pick up the new verses through their ranges; only their renditions need refreshing
+        quotes = Quote.objects.filter(book__in=books.values())
+        renditions.refresh(quotes.values_list('id', flat=True))
+        uncached = quotes.filter(rendition__cached_count=0).count()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Skipped {skipped} rows outside {', '.join(sorted(books))}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {len(verses)} verses in {elapsed:.1f}s ({uncached} quotes still uncached)")
+        )
+
+    def guess_format(self, path):
+        """Pick a reader from the file extension"""
+        lowered = path.lower()
+        if lowered.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        if lowered.endswith('.json'):
+            return 'json'
+        if lowered.endswith(('.csv', '.tsv')):
+            return 'csv'
+        if lowered.endswith(('.xml', '.osis')):
+            return 'osis'
+        raise CommandError(f"Cannot guess the format of {path}; pass --format")
+
+    def verse_fields(self, row):
+        """Pull (book, chapter, verse, text) out of a JSON/CSV record"""
+        book = row.get('book') or row.get('book_name') or row.get('book_id')
+        verse_number = row.get('verse') or row.get('verse_number')
+        return book, row.get('chapter'), verse_number, row.get('text')
+
+    def read_jsonl(self, path):
+        """One JSON verse object per line"""
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield self.verse_fields(json.loads(line))
+
+    def read_json(self, path, chunk_size=65536):
+        """A top-level JSON array of verse objects, decoded item by item"""
+        decoder = json.JSONDecoder()
+        with open(path, encoding='utf-8') as f:
+            buffer = f.read(chunk_size).lstrip()
+            if not buffer.startswith('['):
+                raise ValueError("expected a JSON array of verse objects")
+            buffer = buffer[1:]
+            eof = False
+
+            while True:
+                buffer = buffer.lstrip().lstrip(',').lstrip()
+                if buffer.startswith(']'):
+                    return
+                try:
+                    row, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buffer += chunk
+                    continue
+                buffer = buffer[end:]
+                yield self.verse_fields(row)
+
+    def read_csv(self, path):
+        """CSV/TSV with book, chapter, verse and text columns"""
+        with open(path, encoding='utf-8', newline='') as f:
+            dialect = csv.excel_tab if path.lower().endswith('.tsv') else csv.excel
+            for row in csv.DictReader(f, dialect=dialect):
+                yield self.verse_fields({key.strip().lower(): value for key, value in row.items() if key})
+
+    def read_osis(self, path):
+        """OSIS XML: container <verse osisID="Matt.5.3"> elements or sID/eID milestones in <chapter>"""
+        for event, elem in ET.iterparse(path, events=('end',)):
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if tag == 'verse' and elem.get('osisID') and not (elem.get('sID') or elem.get('eID')):
+                book, chapter, verse_number = elem.get('osisID').split()[0].split('.')[:3]
+                yield book, chapter, verse_number, self.osis_text(elem)
+                elem.clear()
+            elif tag == 'chapter':
+                yield from self.osis_milestone_verses(elem)
+                elem.clear()
+
+    def osis_text(self, elem):
+        """Text of an OSIS element without its footnotes"""
+        parts = [elem.text or '']
+        for child in elem:
+            if child.tag.rsplit('}', 1)[-1] != 'note':
+                parts.append(self.osis_text(child))
+            parts.append(child.tail or '')
+        return ''.join(parts)
+
+    def osis_milestone_verses(self, chapter_elem):
+        """Collect the text between <verse sID/> and <verse eID/> milestones"""
+        current = None
+        parts = []
+        for kind, value in self.osis_tokens(chapter_elem):
+            if kind == 'start':
+                current, parts = value, []
+            elif kind == 'end' and current is not None:
+                book, chapter, verse_number = current.split('.')[:3]
+                yield book, chapter, verse_number, ''.join(parts)
+                current = None
+            elif kind == 'text' and current is not None:
+                parts.append(value)
+
+    def osis_tokens(self, elem):
+        """Flatten an OSIS subtree into ('start', osisID) / ('end', None) / ('text', str) tokens"""
+        yield 'text', elem.text or ''
+        for child in elem:
+            tag = child.tag.rsplit('}', 1)[-1]
+            if tag == 'verse':
+                if child.get('sID'):
+                    yield 'start', (child.get('osisID') or child.get('sID')).split()[0]
+                elif child.get('eID'):
+                    yield 'end', None
+            elif tag != 'note':
+                yield from self.osis_tokens(child)
+            yield 'text', child.tail or ''
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from quotes.models import SearchCache
+from quotes import search_cache
+
+class Command(BaseCommand):
+    help = 'Delete expired search cache rows and evict least recently used ones beyond the caps'
+    
+    def handle(self, *args, **options):
+        expired, evicted = search_cache.prune()
+        totals = SearchCache.objects.aggregate(rows=Count('id'), size=Sum('size'))
+        
+        self.stdout.write(f"Expired: {expired}, evicted: {evicted}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Search cache now holds {totals['rows']} rows ({(totals['size'] or 0) // 1024} KiB)")
+        )
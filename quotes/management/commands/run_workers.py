@@ -0,0 +1,74 @@
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from quotes.models import Quote
+from quotes.tasks import job_queue
+from quotes.leases import owner_id
+
+class Command(BaseCommand):
+    help = 'Run cache-fill workers that consume the CacheJob queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'CACHE_WORKERS', 4), help='Consumer threads')
+        parser.add_argument('--poll', type=float, default=getattr(settings, 'JOB_POLL_INTERVAL', 2), help='Seconds between polls when idle')
+        parser.add_argument('--seed', action='store_true', help='Queue every uncached quote (background priority) before starting')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is ready instead of waiting for more')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            queued = job_queue.enqueue(Quote.objects.uncached().values_list('id', flat=True))
+            self.stdout.write(f"Queued {queued} uncached quotes")
+
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.totals = {'done': 0, 'queued': 0, 'failed': 0, 'verses': 0}
+
+        threads = [
+            threading.Thread(target=self.consume, args=(options['poll'], options['once']), name=f"cache-worker-{i}", daemon=True)
+            for i in range(max(1, options['workers']))
+        ]
+        self.stdout.write(f"Starting {len(threads)} workers ({job_queue.stats()['queued']} jobs queued)")
+        for thread in threads:
+            thread.start()
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            # Running jobs finish; anything still leased after a hard kill is picked up when its lease expires
+            self.stdout.write("Stopping after the current jobs...")
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {self.totals['done']} quotes filled ({self.totals['verses']} verses), "
+            f"{self.totals['queued']} retrying later, {self.totals['failed']} failed"
+        ))
+
+    def consume(self, poll, once):
+        """Lease, fill and ack jobs until stopped (or, with --once, until none is ready)"""
+        worker = owner_id()
+        try:
+            while not self.stop.is_set():
+                job = job_queue.lease(worker)
+                if job is None:
+                    if once:
+                        break
+                    self.stop.wait(poll)
+                    continue
+
+                status, cached = job_queue.process(job)
+                with self.lock:
+                    self.totals[status] += 1
+                    self.totals['verses'] += cached
+
+                message = f"{job.quote.book.name} {job.quote.reference}: {status}"
+                if status == 'done':
+                    self.stdout.write(self.style.SUCCESS(f"{message} ({cached} verses)"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"{message} (attempt {job.attempts})"))
+        finally:
+            connection.close()
@@ -1,106 +1,180 @@
+import time
 from django.core.management.base import BaseCommand
-from quotes.models import Book, Quote
+from django.db import transaction
+from quotes.models import Book, Quote, QuoteRange
 from quotes.bible_api import BibleAPIClient
 from quotes.quotes_data import QUOTES
+from quotes.metrics import query_cost
+from quotes.signals import quotes_changed
+from quotes import renditions, versification
 
 class Command(BaseCommand):
-    help = 'Setup Bible books and populate Jesus quotes'
-    
+    help = 'Setup Bible books and populate Jesus quotes (diffs against the database, safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-stale',
+            action='store_true',
+            help='Keep quotes that are no longer in quotes_data instead of deleting them'
+        )
+
     def handle(self, *args, **options):
-        client = BibleAPIClient()
-        
-        # Fetch and create books from API.Bible
-        self.stdout.write("Fetching books from API.Bible...")
-        books_data = client.get_books()
-        
-        # Map our book names to API book IDs and simple API names
-        book_mapping = {
-            'matthew': {'api_id': 'MAT', 'simple_name': 'matthew'},
-            'mark': {'api_id': 'MRK', 'simple_name': 'mark'}, 
-            'luke': {'api_id': 'LUK', 'simple_name': 'luke'},
-            'john': {'api_id': 'JHN', 'simple_name': 'john'},
-            'acts': {'api_id': 'ACT', 'simple_name': 'acts'},
-            '1_corinthians': {'api_id': '1CO', 'simple_name': '1-corinthians'},
-            '2_corinthians': {'api_id': '2CO', 'simple_name': '2-corinthians'},
-            'revelation': {'api_id': 'REV', 'simple_name': 'revelation'}
-        }
-        
-        canonical_order = {
-            'matthew': 1, 'mark': 2, 'luke': 3, 'john': 4,
-            'acts': 5, '1_corinthians': 6, '2_corinthians': 7,
-            'revelation': 8
-        }
-        
-        # Create books
-        for book_name, book_info in book_mapping.items():
-            api_id = book_info['api_id']
-            
-            # Find full name from API.Bible
-            full_name = book_name.replace('_', ' ').title()
-            for book_data in books_data:
-                if book_data.get('id') == api_id:
-                    full_name = book_data.get('name', full_name)
-                    break
-            
-            book, created = Book.objects.get_or_create(
-                api_id=api_id,
-                defaults={
-                    'name': full_name,
-                    'canonical_order': canonical_order.get(book_name, 99)
-                }
-            )
-            if created:
-                self.stdout.write(f"Created book: {full_name} ({api_id})")
-        
-        # Create quotes with verse IDs
-        self.stdout.write("Creating quotes...")
-        for book_name, quote_refs in QUOTES.items():
-            try:
-                api_id = book_mapping[book_name]['api_id']
-                book = Book.objects.get(api_id=api_id)
-                
-                for quote_ref in quote_refs:
-                    quote, created = Quote.objects.get_or_create(
-                        book=book,
-                        reference=quote_ref
-                    )
-                    
-                    if created:
-                        # Generate verse IDs for this quote
-                        chapter, verse_numbers = get_chapter_verse_from_quote(quote_ref)
-                        verse_ids = []
-                        
-                        for verse_num in verse_numbers:
-                            verse_id = f"{api_id}.{chapter}.{verse_num}"
-                            verse_ids.append(verse_id)
-                        
-                        quote.set_verse_ids_list(verse_ids)
-                        quote.save()
-                        
-                        self.stdout.write(f"Created quote: {book.name} {quote_ref}")
-            
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"Error processing {book_name}: {e}")
-                )
-        
+        timings = {}
+        started = time.perf_counter()
+
+        with query_cost('setup_bible') as report:
+            # Parse QUOTES once: {(api_id, reference): [(start, end), ...]}
+            wanted, unparsed = self.parse_quotes()
+            timings['parse'] = time.perf_counter() - started
+
+            with transaction.atomic():
+                mark = time.perf_counter()
+                books = self.sync_books()
+                changes = self.diff_quotes(wanted, unparsed, books, options['keep_stale'])
+                timings['diff'] = time.perf_counter() - mark
+
+                mark = time.perf_counter()
+                created_ids = self.apply(changes, books)
+                timings['apply'] = time.perf_counter() - mark
+
+            # Listing previews for new and changed quotes (picks up any verses already cached)
+            mark = time.perf_counter()
+            if self.books_changed:
+                # New or reordered books change every listing: fresh stamps for all quotes move the
+                # content version that page ETags and the cached book list are keyed on
+                renditions.rebuild()
+            else:
+                renditions.refresh(created_ids + list(changes['update']))
+            if changes['delete']:
+                quotes_changed.send(sender=Quote, quote_ids=changes['delete'])
+            timings['refresh'] = time.perf_counter() - mark
+
+        self.stdout.write(
+            f"Quotes: {len(changes['create'])} created, {len(changes['update'])} updated, "
+            f"{len(changes['delete'])} deleted, {changes['unchanged']} unchanged"
+        )
+        self.stdout.write(
+            ', '.join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in timings.items())
+            + f" ({report['queries']} queries, {(time.perf_counter() - started) * 1000:.0f}ms total)"
+        )
         self.stdout.write(
             self.style.SUCCESS("Successfully setup Bible data!")
         )
 
-def get_chapter_verse_from_quote(quote):
-    """Parse chapter:verse format into chapter and list of verses"""
-    parts = quote.split(":")
-    chapter = parts[0]
-    verse_parts = parts[1].split(",")
-    
-    verses = []
-    for verse_part in verse_parts:
-        verse_part = verse_part.strip()
-        if "-" in verse_part:
-            start, end = verse_part.split("-")
-            verses.extend(range(int(start), int(end) + 1))
-        else:
-            verses.append(int(verse_part))
-    
-    return chapter, verses
\ No newline at end of file
+    def parse_quotes(self):
+        """Ordinal runs for every reference in QUOTES, keyed by (api_id, reference).
+
+        Also returns the keys that failed to parse: their stored quotes are
+        left alone, so a parser regression cannot delete data.
+        """
+        wanted, unparsed = {}, set()
+        for book_name, quote_refs in QUOTES.items():
+            info = versification.BY_QUOTES_KEY.get(book_name)
+            if info is None:
+                self.stdout.write(self.style.ERROR(f"Error processing {book_name}: unknown book"))
+                continue
+            for quote_ref in quote_refs:
+                try:
+                    # A few references overshoot the KJV chapter, so parse leniently
+                    ranges = versification.parse_reference(quote_ref, info.api_id, strict=False)
+                except ValueError as e:
+                    self.stdout.write(self.style.ERROR(f"Error processing {book_name} {quote_ref}: {e}"))
+                    unparsed.add((info.api_id, quote_ref))
+                    continue
+                ordinals = [ordinal for start, end in ranges for ordinal in range(start, end + 1)]
+                wanted[(info.api_id, quote_ref)] = versification.compact(ordinals)
+        return wanted, unparsed
+
+    def sync_books(self):
+        """Create missing books (the only step that needs API.Bible) and fix their order. Returns {api_id: Book}"""
+        books = {book.api_id: book for book in Book.objects.all()}
+
+        missing = [info for info in versification.BOOKS if info.api_id not in books]
+        if missing:
+            # Full names from API.Bible, falling back to the registry
+            self.stdout.write("Fetching books from API.Bible...")
+            names = {book_data.get('id'): book_data.get('name') for book_data in BibleAPIClient().get_books()}
+            created = Book.objects.bulk_create([
+                Book(api_id=info.api_id, name=names.get(info.api_id) or info.name, canonical_order=info.order)
+                for info in missing
+            ])
+            for book in created:
+                books[book.api_id] = book
+                self.stdout.write(f"Created book: {book.name} ({book.api_id})")
+
+        reordered = []
+        for info in versification.BOOKS:
+            book = books[info.api_id]
+            if book.canonical_order != info.order:
+                book.canonical_order = info.order
+                reordered.append(book)
+        if reordered:
+            Book.objects.bulk_update(reordered, ['canonical_order'])
+
+        # bulk writes send no signals; handle() refreshes the renditions instead
+        self.books_changed = bool(missing or reordered)
+        return books
+
+    def diff_quotes(self, wanted, unparsed, books, keep_stale):
+        """Compare QUOTES with the stored quotes and their ranges, all in memory"""
+        api_ids = {book.id: api_id for api_id, book in books.items()}
+
+        existing = {}
+        for quote_id, book_id, reference in Quote.objects.values_list('id', 'book_id', 'reference'):
+            existing[(api_ids.get(book_id), reference)] = quote_id
+
+        stored_ranges = {}
+        for quote_id, start, end in QuoteRange.objects.values_list('quote_id', 'start_ordinal', 'end_ordinal'):
+            stored_ranges.setdefault(quote_id, []).append((start, end))
+
+        create, update, unchanged = {}, {}, 0
+        for key, ranges in wanted.items():
+            quote_id = existing.get(key)
+            if quote_id is None:
+                create[key] = ranges
+            elif sorted(stored_ranges.get(quote_id, [])) != ranges:
+                update[quote_id] = ranges
+            else:
+                unchanged += 1
+
+        # Quotes still listed in QUOTES but unparseable, or of books the registry no longer
+        # knows, are kept as they are
+        delete = [] if keep_stale else [
+            quote_id for key, quote_id in existing.items()
+            if key not in wanted and key not in unparsed and key[0] in versification.BY_API_ID
+        ]
+        return {
+            'create': create,
+            'update': update,
+            'delete': delete,
+            'unchanged': unchanged,
+        }
+
+    def apply(self, changes, books):
+        """Write the diff with bulk statements (the caller holds the transaction). Returns the new quote ids"""
+        if changes['delete']:
+            Quote.objects.filter(id__in=changes['delete']).delete()
+
+        if changes['update']:
+            QuoteRange.objects.filter(quote_id__in=list(changes['update'])).delete()
+
+        # SQLite returns the new primary keys from bulk_create
+        keys = list(changes['create'])
+        created = Quote.objects.bulk_create([
+            Quote(book=books[api_id], reference=reference) for api_id, reference in keys
+        ])
+        ranges = [
+            QuoteRange(quote_id=quote.id, start_ordinal=start, end_ordinal=end)
+            for quote, key in zip(created, keys)
+            for start, end in changes['create'][key]
+        ]
+        ranges += [
+            QuoteRange(quote_id=quote_id, start_ordinal=start, end_ordinal=end)
+            for quote_id, quote_ranges in changes['update'].items()
+            for start, end in quote_ranges
+        ]
+        QuoteRange.objects.bulk_create(ranges, batch_size=500)
+
+        for quote in created:
+            self.stdout.write(f"Created quote: {quote.book.name} {quote.reference}")
+        return [quote.id for quote in created]
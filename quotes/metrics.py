@@ -0,0 +1,29 @@
+import logging
+import time
+from contextlib import contextmanager
+from django.db import connection
+
+logger = logging.getLogger('performance')
+
+
+@contextmanager
+def query_cost(label):
+    """Count the queries and wall time spent inside the block and log them.
+
+    Yields a dict that holds 'queries' and 'ms' once the block exits, so
+    callers can add their own counters to the same report line.
+    """
+    report = {'queries': 0, 'ms': 0.0}
+
+    def count(execute, sql, params, many, context):
+        report['queries'] += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count):
+            yield report
+    finally:
+        report['ms'] = round((time.perf_counter() - started) * 1000, 1)
+        extra = ', '.join(f"{key}={value}" for key, value in report.items() if key not in ('queries', 'ms'))
+        logger.info(f"{label}: {report['queries']} queries in {report['ms']}ms" + (f" ({extra})" if extra else ''))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from .resilience import latency_budget
+
+class LatencyBudgetMiddleware:
+    """Give each request a fixed budget for upstream Bible API calls.
+
+    Once the budget is spent, BibleAPIClient stops calling out and views fall
+    back to whatever is already in CachedVerse / SearchCache.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        budget = getattr(settings, 'BIBLE_REQUEST_BUDGET', None)
+        if not budget:
+            return self.get_response(request)
+        with latency_budget(budget):
+            return self.get_response(request)
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Book',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('api_id', models.CharField(max_length=10, unique=True)),
+                ('name', models.CharField(max_length=50)),
+                ('canonical_order', models.IntegerField()),
+            ],
+            options={
+                'ordering': ['canonical_order'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=200, unique=True)),
+                ('results', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CachedVerse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('verse_id', models.CharField(max_length=20, unique=True)),
+                ('chapter', models.IntegerField()),
+                ('verse_number', models.IntegerField()),
+                ('text', models.TextField()),
+                ('reference', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quotes.book')),
+            ],
+            options={
+                'ordering': ['book__canonical_order', 'chapter', 'verse_number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Quote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100)),
+                ('verse_ids', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quotes.book')),
+                ('cached_verses', models.ManyToManyField(blank=True, to='quotes.cachedverse')),
+            ],
+            options={
+                'ordering': ['book__canonical_order', 'reference'],
+                'unique_together': {('book', 'reference')},
+            },
+        ),
+    ]
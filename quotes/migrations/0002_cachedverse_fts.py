@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# External-content FTS5 index over CachedVerse.text/reference, kept in sync by triggers
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS quotes_cachedverse_fts USING fts5(
+        text, reference,
+        content='quotes_cachedverse', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS quotes_cachedverse_fts_ai AFTER INSERT ON quotes_cachedverse BEGIN
+        INSERT INTO quotes_cachedverse_fts(rowid, text, reference) VALUES (new.id, new.text, new.reference);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS quotes_cachedverse_fts_ad AFTER DELETE ON quotes_cachedverse BEGIN
+        INSERT INTO quotes_cachedverse_fts(quotes_cachedverse_fts, rowid, text, reference)
+        VALUES ('delete', old.id, old.text, old.reference);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS quotes_cachedverse_fts_au AFTER UPDATE ON quotes_cachedverse BEGIN
+        INSERT INTO quotes_cachedverse_fts(quotes_cachedverse_fts, rowid, text, reference)
+        VALUES ('delete', old.id, old.text, old.reference);
+        INSERT INTO quotes_cachedverse_fts(rowid, text, reference) VALUES (new.id, new.text, new.reference);
+    END
+    """,
+    "INSERT INTO quotes_cachedverse_fts(quotes_cachedverse_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS quotes_cachedverse_fts_ai",
+    "DROP TRIGGER IF EXISTS quotes_cachedverse_fts_ad",
+    "DROP TRIGGER IF EXISTS quotes_cachedverse_fts_au",
+    "DROP TABLE IF EXISTS quotes_cachedverse_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_FTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_FTS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def clear_raw_keys(apps, schema_editor):
+    # Rows keyed on the raw "query:limit:offset:sort" string can never be hit again
+    apps.get_model('quotes', 'SearchCache').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0002_cachedverse_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchcache',
+            name='fetched_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='searchcache',
+            name='last_accessed',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='searchcache',
+            name='size',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(clear_raw_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0003_searchcache_windows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NegativeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('reason', models.CharField(choices=[('not_found', 'Not found'), ('unknown_book', 'Unknown book'), ('network', 'Network error'), ('upstream_error', 'Upstream error')], max_length=20)),
+                ('detail', models.CharField(blank=True, max_length=200)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
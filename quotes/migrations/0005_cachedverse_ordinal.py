@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:17
+
+from django.db import migrations, models
+from quotes import versification
+
+
+def fill_ordinals(apps, schema_editor):
+    CachedVerse = apps.get_model('quotes', 'CachedVerse')
+    verses = []
+    for verse in CachedVerse.objects.only('id', 'verse_id').iterator():
+        verse.ordinal = versification.ordinal_for_verse_id(verse.verse_id)
+        if verse.ordinal is not None:
+            verses.append(verse)
+    CachedVerse.objects.bulk_update(verses, ['ordinal'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0004_negativecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cachedverse',
+            name='ordinal',
+            field=models.IntegerField(db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_ordinals, migrations.RunPython.noop),
+    ]
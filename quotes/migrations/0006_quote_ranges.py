@@ -0,0 +1,86 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:21
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+from quotes import versification
+
+
+def verse_ids_to_ranges(apps, schema_editor):
+    Quote = apps.get_model('quotes', 'Quote')
+    QuoteRange = apps.get_model('quotes', 'QuoteRange')
+    ranges = []
+    for quote in Quote.objects.only('id', 'verse_ids').iterator():
+        try:
+            verse_ids = json.loads(quote.verse_ids or '[]')
+        except ValueError:
+            verse_ids = []
+        ordinals = [versification.ordinal_for_verse_id(verse_id) for verse_id in verse_ids]
+        for start, end in versification.compact([o for o in ordinals if o is not None]):
+            ranges.append(QuoteRange(quote_id=quote.id, start_ordinal=start, end_ordinal=end))
+    QuoteRange.objects.bulk_create(ranges, batch_size=500)
+
+
+def ranges_to_verse_ids(apps, schema_editor):
+    Quote = apps.get_model('quotes', 'Quote')
+    QuoteRange = apps.get_model('quotes', 'QuoteRange')
+    CachedVerse = apps.get_model('quotes', 'CachedVerse')
+    verse_ids = {}
+    for verse_range in QuoteRange.objects.order_by('quote_id', 'start_ordinal').iterator():
+        verse_ids.setdefault(verse_range.quote_id, []).extend(
+            versification.verse_id_for_ordinal(ordinal)
+            for ordinal in range(verse_range.start_ordinal, verse_range.end_ordinal + 1)
+        )
+
+    verse_pks = dict(CachedVerse.objects.values_list('verse_id', 'id'))
+    quotes = []
+    links = []
+    for quote in Quote.objects.only('id').iterator():
+        ids = verse_ids.get(quote.id, [])
+        quote.verse_ids = json.dumps(ids)
+        quotes.append(quote)
+        links.extend(
+            Quote.cached_verses.through(quote_id=quote.id, cachedverse_id=verse_pks[verse_id])
+            for verse_id in ids if verse_id in verse_pks
+        )
+    Quote.objects.bulk_update(quotes, ['verse_ids'], batch_size=500)
+    Quote.cached_verses.through.objects.bulk_create(links, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0005_cachedverse_ordinal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_ordinal', models.IntegerField()),
+                ('end_ordinal', models.IntegerField()),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranges', to='quotes.quote')),
+            ],
+            options={
+                'ordering': ['quote', 'start_ordinal'],
+                'indexes': [models.Index(fields=['start_ordinal', 'end_ordinal'], name='quotes_quot_start_o_d942df_idx')],
+            },
+        ),
+        migrations.RunPython(verse_ids_to_ranges, ranges_to_verse_ids),
+        migrations.RemoveField(
+            model_name='quote',
+            name='cached_verses',
+        ),
+        # A default lets the column be re-added (and refilled) when migrating backwards
+        migrations.AlterField(
+            model_name='quote',
+            name='verse_ids',
+            field=models.TextField(default='[]'),
+        ),
+        migrations.RemoveField(
+            model_name='quote',
+            name='verse_ids',
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:24
+
+import json
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+PREVIEW_VERSES = 3
+
+
+def fill_renditions(apps, schema_editor):
+    Quote = apps.get_model('quotes', 'Quote')
+    QuoteRange = apps.get_model('quotes', 'QuoteRange')
+    CachedVerse = apps.get_model('quotes', 'CachedVerse')
+    QuoteRendition = apps.get_model('quotes', 'QuoteRendition')
+
+    verses = {}
+    verse_counts = {}
+    for verse_range in QuoteRange.objects.order_by('quote_id', 'start_ordinal').iterator():
+        verse_counts[verse_range.quote_id] = (
+            verse_counts.get(verse_range.quote_id, 0) + verse_range.end_ordinal - verse_range.start_ordinal + 1
+        )
+        verses.setdefault(verse_range.quote_id, []).extend(
+            CachedVerse.objects.filter(
+                ordinal__range=(verse_range.start_ordinal, verse_range.end_ordinal)
+            ).order_by('ordinal').values_list('verse_number', 'text')
+        )
+
+    now = django.utils.timezone.now()
+    renditions = []
+    for quote_id in Quote.objects.values_list('id', flat=True):
+        quote_verses = verses.get(quote_id, [])
+        verse_count = verse_counts.get(quote_id, 0)
+        renditions.append(QuoteRendition(
+            quote_id=quote_id,
+            text=' '.join(text for _, text in quote_verses),
+            preview=json.dumps([
+                {'verse_number': number, 'text': text} for number, text in quote_verses[:PREVIEW_VERSES]
+            ]),
+            verse_count=verse_count,
+            cached_count=len(quote_verses),
+            missing_count=max(verse_count - len(quote_verses), 0),
+            updated_at=now
+        ))
+    QuoteRendition.objects.bulk_create(renditions, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0006_quote_ranges'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteRendition',
+            fields=[
+                ('quote', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rendition', serialize=False, to='quotes.quote')),
+                ('text', models.TextField(blank=True)),
+                ('preview', models.TextField(default='[]')),
+                ('verse_count', models.IntegerField(default=0)),
+                ('cached_count', models.IntegerField(default=0)),
+                ('missing_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(fill_renditions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0007_quoterendition'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quoterendition',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quotes', '0008_quoterendition_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.IntegerField(default=0)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('leased_by', models.CharField(blank=True, max_length=100)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quote', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cache_job', to='quotes.quote')),
+            ],
+            options={
+                'ordering': ['-priority', 'run_after'],
+                'indexes': [models.Index(fields=['status', 'priority', 'run_after'], name='quotes_cach_status_92967a_idx')],
+            },
+        ),
+    ]
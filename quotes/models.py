@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone
 import json
+from . import versification
 
 class Book(models.Model):
     api_id = models.CharField(max_length=10, unique=True)  # e.g., "MAT"
@@ -21,56 +22,211 @@ class CachedVerse(models.Model):
     verse_number = models.IntegerField()
     text = models.TextField()
     reference = models.CharField(max_length=50)  # e.g., "Matthew 5:3"
+    ordinal = models.IntegerField(null=True, db_index=True)  # e.g., 40005003, see versification.py
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['book__canonical_order', 'chapter', 'verse_number']
     
+    def save(self, *args, **kwargs):
+        if self.ordinal is None:
+            self.ordinal = versification.ordinal_for_verse_id(self.verse_id)
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return f"{self.reference}"
 
+class QuoteQuerySet(models.QuerySet):
+    def uncached(self):
+        """Quotes none of whose verses are in the verse cache yet"""
+        covered = CachedVerse.objects.filter(
+            ordinal__gte=models.OuterRef('start_ordinal'),
+            ordinal__lte=models.OuterRef('end_ordinal')
+        )
+        cached_ranges = QuoteRange.objects.filter(quote=models.OuterRef('pk')).filter(models.Exists(covered))
+        return self.exclude(models.Exists(cached_ranges))
+
 class Quote(models.Model):
     """Predefined Jesus quotes from our QUOTES data"""
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     reference = models.CharField(max_length=100)  # e.g., "5:3-48"
-    verse_ids = models.TextField()  # JSON list of verse IDs
-    cached_verses = models.ManyToManyField(CachedVerse, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = QuoteQuerySet.as_manager()
+    
     class Meta:
         ordering = ['book__canonical_order', 'reference']
         unique_together = ('book', 'reference')
     
     def get_verse_ids_list(self):
-        """Return list of verse IDs from JSON field"""
+        """Return the quote's verse IDs in order, expanded from its ranges"""
+        return [
+            versification.verse_id_for_ordinal(ordinal)
+            for verse_range in self.ranges.all()
+            for ordinal in range(verse_range.start_ordinal, verse_range.end_ordinal + 1)
+        ]
+    
+    def set_verse_ids_list(self, verse_ids):
+        """Replace the quote's ranges with the compacted runs of these verse IDs"""
+        ordinals = [versification.ordinal_for_verse_id(verse_id) for verse_id in verse_ids]
+        self.ranges.all().delete()
+        QuoteRange.objects.bulk_create([
+            QuoteRange(quote=self, start_ordinal=start, end_ordinal=end)
+            for start, end in versification.compact([o for o in ordinals if o is not None])
+        ])
+    
+    def verses(self, refresh=False):
+        """Cached verses covered by this quote, in canonical order"""
+        if refresh or not hasattr(self, '_verses'):
+            attach_verses([self])
+        return self._verses
+    
+    def __str__(self):
+        return f"{self.book.name} {self.reference}"
+
+class QuoteRange(models.Model):
+    """A run of consecutive verses in a quote, as inclusive verse ordinals"""
+    quote = models.ForeignKey(Quote, on_delete=models.CASCADE, related_name='ranges')
+    start_ordinal = models.IntegerField()  # e.g., 40005003 (Matthew 5:3)
+    end_ordinal = models.IntegerField()  # e.g., 40005048 (Matthew 5:48)
+    
+    class Meta:
+        ordering = ['quote', 'start_ordinal']
+        indexes = [models.Index(fields=['start_ordinal', 'end_ordinal'])]
+    
+    def __str__(self):
+        return f"{versification.verse_id_for_ordinal(self.start_ordinal)}-{versification.verse_id_for_ordinal(self.end_ordinal)}"
+
+class QuoteRendition(models.Model):
+    """Denormalized text and preview of a quote, refreshed whenever its verses are cached"""
+    quote = models.OneToOneField(Quote, on_delete=models.CASCADE, primary_key=True, related_name='rendition')
+    text = models.TextField(blank=True)  # every cached verse, in order, space separated
+    preview = models.TextField(default='[]')  # JSON list of the first few verses
+    verse_count = models.IntegerField(default=0)  # verses the quote spans
+    cached_count = models.IntegerField(default=0)
+    missing_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)  # drives HTTP validators
+    
+    def get_preview(self):
+        """Get preview verses as a list of {'verse_number', 'text'} dicts"""
         try:
-            return json.loads(self.verse_ids or '[]')
+            return json.loads(self.preview)
         except:
             return []
     
-    def set_verse_ids_list(self, verse_ids):
-        """Set verse IDs as JSON"""
-        self.verse_ids = json.dumps(verse_ids)
+    def hidden_count(self):
+        """Verses of the quote not shown in the preview"""
+        return max(self.verse_count - len(self.get_preview()), 0)
     
     def __str__(self):
-        return f"{self.book.name} {self.reference}"
+        return f"{self.quote} ({self.cached_count}/{self.verse_count})"
+
+def attach_verses(quotes, batch_size=500):
+    """Load the cached verses of many quotes with one range join per batch.
+    
+    Sets the list returned by Quote.verses() on each quote and returns the quotes.
+    """
+    quotes = list(quotes)
+    by_id = {}
+    for quote in quotes:
+        quote._verses = []
+        by_id[quote.id] = quote
+    
+    quote_ids = list(by_id)
+    sql = (
+        f"SELECT r.quote_id AS range_quote_id, v.* "
+        f"FROM {QuoteRange._meta.db_table} r "
+        f"JOIN {CachedVerse._meta.db_table} v ON v.ordinal BETWEEN r.start_ordinal AND r.end_ordinal "
+        f"WHERE r.quote_id IN (%s) "
+        f"ORDER BY r.quote_id, v.ordinal"
+    )
+    for i in range(0, len(quote_ids), batch_size):
+        batch = quote_ids[i:i + batch_size]
+        for verse in CachedVerse.objects.raw(sql % ', '.join(['%s'] * len(batch)), batch):
+            by_id[verse.range_quote_id]._verses.append(verse)
+    return quotes
 
 class SearchCache(models.Model):
-    """Cache search results from API.Bible"""
-    query = models.CharField(max_length=200, unique=True)
+    """Cache search results from API.Bible, one row per window of results"""
+    query = models.CharField(max_length=200, unique=True)  # e.g., "love:canonical:0" (normalized)
     results = models.TextField()  # JSON results
     created_at = models.DateTimeField(auto_now_add=True)
+    fetched_at = models.DateTimeField(default=timezone.now)  # last upstream fetch
+    last_accessed = models.DateTimeField(default=timezone.now, db_index=True)  # for LRU eviction
+    size = models.IntegerField(default=0)  # bytes of JSON
     
     class Meta:
         ordering = ['-created_at']
     
     def is_fresh(self, hours=24):
         """Check if cache is fresh (default 24 hours)"""
-        return timezone.now() - self.created_at < timezone.timedelta(hours=hours)
+        return timezone.now() - self.fetched_at < timezone.timedelta(hours=hours)
     
     def get_results(self):
         """Get results as Python object"""
         try:
             return json.loads(self.results)
         except:
-            return []
\ No newline at end of file
+            return []
+
+class NegativeCache(models.Model):
+    """Remember failed or empty upstream lookups so they are not retried on every request"""
+    REASON_CHOICES = [
+        ('not_found', 'Not found'),
+        ('unknown_book', 'Unknown book'),
+        ('network', 'Network error'),
+        ('upstream_error', 'Upstream error'),
+    ]
+    
+    key = models.CharField(max_length=200, unique=True)  # e.g., "verse:MAT.5.99"
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    detail = models.CharField(max_length=200, blank=True)  # e.g., "HTTP 404"
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def is_active(self):
+        return self.expires_at > timezone.now()
+    is_active.boolean = True
+    
+    def __str__(self):
+        return f"{self.key} ({self.reason})"
+
+class CacheJob(models.Model):
+    """Queued cache fill for one quote, consumed by `manage.py run_workers` (quotes/tasks.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    quote = models.OneToOneField(Quote, on_delete=models.CASCADE, related_name='cache_job')  # one job per quote
+    priority = models.IntegerField(default=0)  # higher runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)  # pushed back on retry
+    leased_by = models.CharField(max_length=100, blank=True)  # worker id, e.g. "host:pid:thread"
+    leased_until = models.DateTimeField(null=True, blank=True)  # expired leases are picked up again
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-priority', 'run_after']
+        indexes = [models.Index(fields=['status', 'priority', 'run_after'])]
+    
+    def __str__(self):
+        return f"{self.quote_id} ({self.status})"
+
+class Lease(models.Model):
+    """Cross-process lock on a unit of cache-fill work, e.g. one chapter (quotes/leases.py)"""
+    key = models.CharField(max_length=200, unique=True)  # e.g., "chapter:MAT.5" or "quote:42"
+    owner = models.CharField(max_length=100)  # "host:pid:thread" of the holder
+    acquired_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)  # an expired lease can be taken over
+    
+    def __str__(self):
+        return f"{self.key} ({self.owner})"
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from .models import NegativeCache
+
+DEFAULT_TTLS = {
+    'not_found': 7 * 24 * 3600,
+    'unknown_book': 30 * 24 * 3600,
+    'network': 60,
+    'upstream_error': 300,
+}
+
+# Per-process memo of key -> (reason, expires_at timestamp) so repeat misses skip the database too
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def ttl_for(reason):
+    """Seconds a negative entry of this reason is kept (NEGATIVE_CACHE_TTLS overrides)"""
+    ttls = {**DEFAULT_TTLS, **getattr(settings, 'NEGATIVE_CACHE_TTLS', {})}
+    return ttls.get(reason, 300)
+
+
+def db_key(key):
+    """The key as stored: long keys (search queries) keep a readable prefix plus a hash of the whole key"""
+    max_length = NegativeCache._meta.get_field('key').max_length
+    if len(key) <= max_length:
+        return key
+    return f"{key[:max_length - 41]}#{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+
+def check(key):
+    """Return the reason `key` is known to fail, or None if a lookup may go ahead"""
+    now = time.time()
+    with _memo_lock:
+        entry = _memo.get(key)
+    if entry is not None:
+        if entry[1] > now:
+            return entry[0]
+        with _memo_lock:
+            _memo.pop(key, None)
+
+    try:
+        cached = NegativeCache.objects.filter(key=db_key(key), expires_at__gt=timezone.now()).first()
+    except DatabaseError:
+        return None
+    if cached is None:
+        return None
+
+    _remember(key, cached.reason, cached.expires_at.timestamp())
+    return cached.reason
+
+
+def record(key, reason, detail=''):
+    """Remember that `key` failed for `reason` for that reason's TTL"""
+    expires_at = timezone.now() + timezone.timedelta(seconds=ttl_for(reason))
+    _remember(key, reason, expires_at.timestamp())
+    try:
+        NegativeCache.objects.update_or_create(
+            key=db_key(key),
+            defaults={'reason': reason, 'detail': detail[:200], 'expires_at': expires_at}
+        )
+        enforce_limit()
+    except DatabaseError as e:
+        print(f"Error recording negative cache entry {key}: {e}")
+
+
+def clear(key):
+    """Forget a negative entry (e.g. after the lookup finally succeeded)"""
+    with _memo_lock:
+        _memo.pop(key, None)
+    NegativeCache.objects.filter(key=db_key(key)).delete()
+
+
+def enforce_limit():
+    """Drop expired rows, then the oldest ones beyond NEGATIVE_CACHE_MAX_ROWS"""
+    max_rows = getattr(settings, 'NEGATIVE_CACHE_MAX_ROWS', 10000)
+    if NegativeCache.objects.count() <= max_rows:
+        return
+    NegativeCache.objects.filter(expires_at__lte=timezone.now()).delete()
+    overflow = NegativeCache.objects.order_by('-created_at').values_list('pk', flat=True)[max_rows:]
+    NegativeCache.objects.filter(pk__in=list(overflow)).delete()
+
+
+def _remember(key, reason, expires_ts):
+    max_rows = getattr(settings, 'NEGATIVE_CACHE_MAX_ROWS', 10000)
+    with _memo_lock:
+        if len(_memo) >= max_rows:
+            _memo.clear()
+        _memo[key] = (reason, expires_ts)
@@ -0,0 +1,166 @@
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .models import Quote
+from . import conditional
+
+QUOTE_TOTALS_KEY = 'quote_totals'
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing.
+
+    Instead of page numbers it hands out opaque cursors built from the
+    (book order, reference, id) key of its first and last quote.
+    """
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return encode_cursor(quote_key(self.object_list[-1]))
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return encode_cursor(quote_key(self.object_list[0]))
+        return None
+
+
+def quote_key(quote):
+    """Sort key of a quote in the listing"""
+    return (quote.book.canonical_order, quote.reference, quote.id)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key), separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Key from a cursor token, or None for a missing or malformed one"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        order, reference, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    if not isinstance(order, int) or not isinstance(reference, str) or not isinstance(pk, int):
+        return None
+    return order, reference, pk
+
+
+def _beyond(key, lookup):
+    """Filter for the quotes sorting after (lookup='gt') or before ('lt') a listing key"""
+    order, reference, pk = key
+    return (
+        Q(**{f"book__canonical_order__{lookup}": order})
+        | Q(**{'book__canonical_order': order, f"reference__{lookup}": reference})
+        | Q(**{'book__canonical_order': order, 'reference': reference, f"id__{lookup}": pk})
+    )
+
+
+def paginate_quotes(quotes, after=None, before=None, per_page=20):
+    """Page through a Quote queryset by key: one indexed query whatever the depth"""
+    if before is not None:
+        rows = list(
+            quotes.filter(_beyond(before, 'lt')).order_by('-book__canonical_order', '-reference', '-id')[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        return KeysetPage(rows[:per_page][::-1], has_next=True, has_previous=has_previous)
+
+    if after is not None:
+        quotes = quotes.filter(_beyond(after, 'gt'))
+    rows = list(quotes.order_by('book__canonical_order', 'reference', 'id')[:per_page + 1])
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=after is not None)
+
+
+def iter_pages(quotes, after=None, limit=None, batch_size=200):
+    """Yield successive keyset pages of a Quote queryset, stopping after `limit` quotes.
+
+    Only one batch is held in memory at a time, so exports stay flat in size.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        page = paginate_quotes(quotes, after=after, per_page=size)
+        if not page.object_list:
+            return
+        yield page
+        if remaining is not None:
+            remaining -= len(page)
+        if not page.has_next:
+            return
+        after = quote_key(page.object_list[-1])
+
+
+def paginate_ids(quote_ids, position, after=None, before=None, per_page=20):
+    """Page through quote ids already in listing order (e.g. quote index results).
+
+    `position` maps a quote id to its listing position; cursors resolve to
+    positions with a bisect, so no query is needed to find the page (one
+    small query when the cursor's quote has been deleted since). The
+    returned page holds ids - swap in the loaded quotes before rendering.
+    """
+    positions = [position(quote_id) for quote_id in quote_ids]
+    if before is not None:
+        end = _cursor_index(positions, position, before, after=False)
+        start = max(0, end - per_page)
+    else:
+        start = _cursor_index(positions, position, after, after=True) if after is not None else 0
+        end = start + per_page
+    return KeysetPage(quote_ids[start:end], has_next=end < len(quote_ids), has_previous=start > 0)
+
+
+def _cursor_index(positions, position, key, after):
+    """Index in `positions` where the page after (or before) a cursor key starts (or ends)"""
+    current = position(key[2])
+    if current is not None:
+        return bisect_right(positions, current) if after else bisect_left(positions, current)
+    # The cursor's quote was deleted: carry on from the first quote that sorts after its key
+    later = Quote.objects.filter(_beyond(key, 'gt')).order_by(
+        'book__canonical_order', 'reference', 'id'
+    ).values_list('id', flat=True).first()
+    if later is None or position(later) is None:
+        return len(positions)
+    return bisect_left(positions, position(later))
+
+
+def quote_totals(version=None):
+    """Number of quotes per book name, cached for QUOTE_TOTALS_TTL seconds.
+
+    The key carries the content version (conditional.content_version_key),
+    so quotes added or removed by any process - setup_bible, import_cache -
+    change the key everywhere instead of waiting out the TTL.
+    """
+    key = f"{QUOTE_TOTALS_KEY}:{version or conditional.content_version_key()}"
+    totals = cache.get(key)
+    if totals is None:
+        totals = dict(Quote.objects.values_list('book__name').annotate(total=Count('id')).order_by())
+        cache.set(key, totals, getattr(settings, 'QUOTE_TOTALS_TTL', 3600))
+    return totals
+
+
+def quote_total(book_name='', version=None):
+    """Quotes in one book, or in all books, without a COUNT per request"""
+    totals = quote_totals(version)
+    if book_name:
+        return totals.get(book_name, 0)
+    return sum(totals.values())
@@ -0,0 +1,140 @@
+"""Fetch planning for cache warms.
+
+The planner expands the ordinal ranges of every selected quote into one
+set, subtracts the cached ordinals with a single query per book, and
+groups what is left into upstream calls. Overlapping quotes therefore
+cost nothing extra, and a verse cached by one call is never asked for again.
+"""
+from collections import namedtuple
+from urllib.parse import urlsplit
+from django.conf import settings
+from .models import CachedVerse, Quote, QuoteRange
+from .bible_api import BibleAPIClient
+from . import versification
+
+# One upstream request: a whole chapter file, or a single verse file
+Fetch = namedtuple('Fetch', ['kind', 'api_id', 'chapter', 'verse_ids'])
+
+
+class Plan:
+    """Missing verses of a set of quotes and the upstream calls that fetch them"""
+
+    def __init__(self, quote_count, wanted, missing, calls):
+        self.quote_count = quote_count
+        self.wanted = wanted  # ordinals the quotes need
+        self.missing = missing  # ordinals not cached yet
+        self.calls = calls  # Fetch tuples, in canonical order
+
+    @property
+    def chapters(self):
+        return sorted({(call.api_id, call.chapter) for call in self.calls})
+
+    def without(self, chapters):
+        """The plan minus calls for the given (api_id, chapter) pairs (e.g. a checkpoint)"""
+        chapters = set(chapters)
+        calls = [call for call in self.calls if (call.api_id, call.chapter) not in chapters]
+        return Plan(self.quote_count, self.wanted, self.missing, calls)
+
+    def by_book(self):
+        """{api_id: (calls, missing verses)} for the report"""
+        books = {}
+        for call in self.calls:
+            calls, verses = books.get(call.api_id, (0, 0))
+            books[call.api_id] = (calls + 1, verses + len(call.verse_ids))
+        return books
+
+    def estimate(self):
+        """(seconds, host, rate, burst) for the calls at the upstream's configured rate limit.
+
+        seconds is None when the host is not rate limited.
+        """
+        host = urlsplit(BibleAPIClient().simple_bible_base_url).netloc
+        limit = getattr(settings, 'BIBLE_RATE_LIMITS', {}).get(host)
+        if not limit:
+            return None, host, None, None
+        rate, burst = limit
+        # The bucket starts full: the first `burst` calls go out at once, the rest at `rate`
+        return max(0, len(self.calls) - burst) / rate, host, rate, burst
+
+
+def wanted_ordinals(quote_ids=None):
+    """Every ordinal the given quotes (default: all quotes) cover"""
+    ranges = QuoteRange.objects.all()
+    if quote_ids is not None:
+        ranges = ranges.filter(quote_id__in=quote_ids)
+    wanted = set()
+    for start, end in ranges.values_list('start_ordinal', 'end_ordinal'):
+        wanted.update(range(start, end + 1))
+    return wanted
+
+
+def cached_ordinals(ordinals):
+    """The subset of `ordinals` already in CachedVerse, one query per book touched"""
+    # Books hold a few thousand verses at most, so reading a book's cached ordinals is
+    # cheaper than an OR of hundreds of ranges (and stays under SQLite's expression limits)
+    cached = set()
+    for api_id in {versification.unpack(ordinal)[0] for ordinal in ordinals}:
+        cached.update(CachedVerse.objects.filter(
+            ordinal__range=versification.book_range(api_id)
+        ).values_list('ordinal', flat=True))
+    return cached & set(ordinals)
+
+
+def plan(quote_ids=None, fetch_mode=None):
+    """Plan the cheapest calls for the verses of `quote_ids` (default: all quotes) that are not cached.
+
+    A chapter file brings every verse of the chapter in one request, so any
+    chapter with two or more missing verses is one chapter call. In 'verse'
+    fetch mode a chapter missing a single verse is fetched as that verse's
+    (much smaller) file instead; in 'chapter' mode everything is chapters.
+    """
+    if quote_ids is not None:
+        quote_ids = list(quote_ids)
+    quote_count = Quote.objects.count() if quote_ids is None else len(quote_ids)
+    fetch_mode = fetch_mode or getattr(settings, 'BIBLE_FETCH_MODE', 'chapter')
+    wanted = wanted_ordinals(quote_ids)
+    missing = wanted - cached_ordinals(wanted)
+
+    by_chapter = {}
+    for ordinal in sorted(missing):
+        api_id, chapter, _ = versification.unpack(ordinal)
+        by_chapter.setdefault((api_id, chapter), []).append(versification.verse_id_for_ordinal(ordinal))
+
+    calls = []
+    for (api_id, chapter), verse_ids in sorted(by_chapter.items(), key=lambda item: versification.pack(*item[0], 0)):
+        kind = 'verse' if fetch_mode == 'verse' and len(verse_ids) == 1 else 'chapter'
+        calls.append(Fetch(kind, api_id, chapter, tuple(verse_ids)))
+    return Plan(quote_count, wanted, missing, calls)
+
+
+def execute(client, call):
+    """Run one planned call through the client (so leases, singleflight and rate limits apply).
+
+    Returns True when the upstream answered with verses.
+    """
+    if call.kind == 'verse':
+        return client.get_verse(call.verse_ids[0]) is not None
+    return bool(client.get_chapter(call.api_id, call.chapter))
+
+
+def report(fetch_plan):
+    """Human-readable cost report lines for a plan (used by the --dry-run options)"""
+    calls = fetch_plan.calls
+    chapter_calls = sum(1 for call in calls if call.kind == 'chapter')
+    lines = [
+        f"{fetch_plan.quote_count} quotes cover {len(fetch_plan.wanted)} verses: "
+        f"{len(fetch_plan.wanted) - len(fetch_plan.missing)} cached, {len(fetch_plan.missing)} missing",
+        f"Upstream calls: {len(calls)} ({chapter_calls} chapter, {len(calls) - chapter_calls} verse)",
+    ]
+    for api_id, (book_calls, verses) in sorted(fetch_plan.by_book().items(), key=lambda item: versification.BY_API_ID[item[0]].order):
+        lines.append(
+            f"  {versification.BY_API_ID[api_id].name}: {book_calls} call{'s' if book_calls != 1 else ''}, "
+            f"{verses} missing verse{'s' if verses != 1 else ''}"
+        )
+
+    seconds, host, rate, burst = fetch_plan.estimate()
+    if seconds is None:
+        lines.append(f"Estimated time: no rate limit configured for {host}")
+    else:
+        lines.append(f"Estimated time at {rate:g} requests/s to {host} (burst {burst}): {seconds:.1f}s")
+    return lines
@@ -0,0 +1,29 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Book, CachedVerse, Quote
+from .signals import quotes_changed
+from .index import quote_index
+from . import renditions
+
+
+@receiver([post_save, post_delete], sender=CachedVerse)
+def verse_changed(sender, instance, raw=False, **kwargs):
+    """Single-row writes (admin, get_or_create) refresh the quotes covering the verse"""
+    if raw or instance.ordinal is None:
+        return
+    renditions.refresh_covering([instance.ordinal])
+
+
+@receiver(quotes_changed)
+def reindex_quotes(sender, quote_ids, **kwargs):
+    """Keep the in-memory search index in step with the refreshed renditions"""
+    quote_index.refresh_quotes(quote_ids)
+
+
+@receiver([post_save, post_delete], sender=Book)
+def book_changed(sender, instance, raw=False, **kwargs):
+    """New rendition stamps for the book's quotes move the content version the book list is keyed on"""
+    if raw:
+        return
+    # After a delete the quotes are gone too, and the lower rendition count moves the version
+    renditions.refresh(Quote.objects.filter(book_id=instance.id).values_list('id', flat=True))
@@ -0,0 +1,83 @@
+import json
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Quote, QuoteRange, QuoteRendition, attach_verses
+from .signals import quotes_changed
+from . import versification
+
+# Verses shown under each quote on the home listing
+PREVIEW_VERSES = 3
+
+
+def quotes_covering(ordinals):
+    """Ids of the quotes whose ranges contain any of these verse ordinals"""
+    # One overlap test per chapter touched keeps the query short for big batches
+    chapters = {}
+    for ordinal in ordinals:
+        base = ordinal - ordinal % versification.CHAPTER_FACTOR
+        low, high = chapters.get(base, (ordinal, ordinal))
+        chapters[base] = (min(low, ordinal), max(high, ordinal))
+    if not chapters:
+        return set()
+
+    overlaps = Q()
+    for low, high in chapters.values():
+        overlaps |= Q(start_ordinal__lte=high, end_ordinal__gte=low)
+    return set(QuoteRange.objects.filter(overlaps).values_list('quote_id', flat=True))
+
+
+def refresh(quote_ids):
+    """Recompute the renditions of these quotes from their ranges and cached verses"""
+    quote_ids = list(quote_ids)
+    if not quote_ids:
+        return 0
+
+    spans = {}
+    for quote_id, start, end in QuoteRange.objects.filter(quote_id__in=quote_ids).values_list(
+        'quote_id', 'start_ordinal', 'end_ordinal'
+    ):
+        spans[quote_id] = spans.get(quote_id, 0) + end - start + 1
+
+    now = timezone.now()
+    renditions = []
+    for quote in attach_verses(Quote.objects.filter(id__in=quote_ids).only('id')):
+        verses = quote.verses()
+        verse_count = spans.get(quote.id, 0)
+        renditions.append(QuoteRendition(
+            quote=quote,
+            text=' '.join(verse.text for verse in verses),
+            preview=json.dumps([
+                {'verse_number': verse.verse_number, 'text': verse.text} for verse in verses[:PREVIEW_VERSES]
+            ]),
+            verse_count=verse_count,
+            cached_count=len(verses),
+            missing_count=max(verse_count - len(verses), 0),
+            updated_at=now
+        ))
+
+    with transaction.atomic():
+        QuoteRendition.objects.bulk_create(
+            renditions,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['quote'],
+            update_fields=['text', 'preview', 'verse_count', 'cached_count', 'missing_count', 'updated_at']
+        )
+    quotes_changed.send(sender=QuoteRendition, quote_ids=quote_ids)
+    return len(renditions)
+
+
+def refresh_covering(ordinals):
+    """Refresh every quote that contains one of these newly cached verses; returns their ids"""
+    quote_ids = quotes_covering(ordinals)
+    refresh(quote_ids)
+    return quote_ids
+
+
+def rebuild(batch_size=500):
+    """Recompute every rendition (after a bulk import or restore)"""
+    quote_ids = list(Quote.objects.values_list('id', flat=True))
+    for i in range(0, len(quote_ids), batch_size):
+        refresh(quote_ids[i:i + batch_size])
+    return len(quote_ids)
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """An upstream call was skipped: circuit open or request budget spent"""
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class BudgetExhausted(UpstreamUnavailable):
+    pass
+
+
+# ---------- Per-request latency budget ----------
+
+_local = threading.local()
+
+
+@contextmanager
+def latency_budget(seconds):
+    """Bound the total time upstream calls may take inside this block (per thread)"""
+    previous = getattr(_local, 'deadline', None)
+    deadline = time.monotonic() + seconds
+    if previous is not None:
+        deadline = min(deadline, previous)
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """Seconds left in the current budget, or None when no budget applies"""
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_budget(needed=0.0):
+    """Raise BudgetExhausted unless more than `needed` seconds are left"""
+    left = remaining()
+    if left is not None and left <= needed:
+        raise BudgetExhausted("request latency budget exhausted")
+    return left
+
+
+# ---------- Circuit breaker ----------
+
+class CircuitBreaker:
+    """Failure-rate and slow-call breaker for one upstream host.
+
+    Closed: calls flow and outcomes fill a rolling window. Open: calls fail
+    fast with CircuitOpen until the cool-down passes. Half-open: a single
+    probe call is let through; success closes the circuit, failure reopens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=self._setting('BIBLE_BREAKER_WINDOW', 20))
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _setting(self, name, default):
+        return getattr(settings, name, default)
+
+    def before_call(self):
+        """Raise CircuitOpen if the call must not go out"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self._setting('BIBLE_BREAKER_COOLDOWN', 30):
+                    raise CircuitOpen(f"circuit open for {self.name}")
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                raise CircuitOpen(f"circuit half-open for {self.name}, probe in flight")
+            self._probing = True
+
+    def release(self):
+        """Free the half-open probe slot if the call ended without record() (it is a no-op otherwise)"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok, latency):
+        """Record one call outcome and move between states"""
+        slow = latency >= self._setting('BIBLE_BREAKER_SLOW_CALL', 5.0)
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if ok and not slow:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+
+            self._outcomes.append((ok, slow))
+            if len(self._outcomes) < self._setting('BIBLE_BREAKER_MIN_CALLS', 5):
+                return
+            failures = sum(1 for outcome_ok, _ in self._outcomes if not outcome_ok)
+            slow_calls = sum(1 for _, outcome_slow in self._outcomes if outcome_slow)
+            if (failures / len(self._outcomes) >= self._setting('BIBLE_BREAKER_FAILURE_RATE', 0.5)
+                    or slow_calls / len(self._outcomes) >= self._setting('BIBLE_BREAKER_SLOW_RATE', 0.8)):
+                self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        print(f"Circuit opened for {self.name}")
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def for_host(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host)
+            return breaker
+
+    def states(self):
+        with self._lock:
+            return {host: breaker.state for host, breaker in self._breakers.items()}
+
+
+# Global instance
+breakers = BreakerRegistry()
+
+
+# ---------- Rate limiting ----------
+
+class TokenBucket:
+    """Token bucket: `rate` requests per second on average, bursts of up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """Take a token and return the seconds to wait before using it.
+
+        Returns None (and takes nothing) when the wait would exceed max_wait.
+        Waiting happens outside the lock, so callers queue up fairly.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class RateLimiterRegistry:
+    """One token bucket per upstream host, sized from BIBLE_RATE_LIMITS (hosts not listed are unlimited)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def for_host(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                limit = getattr(settings, 'BIBLE_RATE_LIMITS', {}).get(host)
+                self._buckets[host] = TokenBucket(*limit) if limit else None
+            return self._buckets[host]
+
+    def wait(self, host, max_wait=None):
+        """Block until a request to `host` is allowed; False if that would take longer than max_wait"""
+        bucket = self.for_host(host)
+        if bucket is None:
+            return True
+        delay = bucket.reserve(max_wait)
+        if delay is None:
+            return False
+        if delay:
+            time.sleep(delay)
+        return True
+
+
+# Global instance
+rate_limits = RateLimiterRegistry()
@@ -0,0 +1,118 @@
+import re
+from django.db import DatabaseError, connection
+from django.utils.html import escape
+
+FTS_TABLE = 'quotes_cachedverse_fts'
+
+# Sentinels wrapped around matches by FTS5, swapped for <mark> after HTML-escaping
+MARK_OPEN = '\x02'
+MARK_CLOSE = '\x03'
+
+ORDERINGS = {
+    'canonical': 'b.canonical_order, v.chapter, v.verse_number',
+    'relevance': 'rank, b.canonical_order, v.chapter, v.verse_number',
+}
+
+_fts_available = None
+
+
+def fts_available():
+    """True when the FTS5 index from migration 0002 exists (SQLite only)"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names(include_views=True)
+        )
+    return _fts_available
+
+
+def build_match_query(query):
+    """Turn user input into an FTS5 MATCH expression.
+
+    Words are ANDed, "quoted text" is a phrase and a trailing * (or ?) makes
+    a prefix query. Every term is quoted, so FTS5 operators typed by the user
+    are matched literally instead of raising syntax errors.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        if phrase:
+            words = re.findall(r'\w+', phrase)
+            if words:
+                terms.append('"' + ' '.join(words) + '"')
+            continue
+
+        prefix = word.endswith(('*', '?'))
+        words = re.findall(r'\w+', word)
+        if not words:
+            continue
+        terms.append('"' + ' '.join(words) + '"' + ('*' if prefix else ''))
+
+    return ' '.join(terms)
+
+
+def _marked_html(value):
+    """HTML-escape FTS output and turn the match sentinels into <mark> tags"""
+    return escape(value).replace(MARK_OPEN, '<mark>').replace(MARK_CLOSE, '</mark>')
+
+
+def search(query, limit=20, offset=0, sort='canonical'):
+    """Search cached verses with FTS5 and BM25 ranking.
+
+    Returns the same shape as BibleAPIClient.search_verses plus `snippet`,
+    `highlight` (safe HTML) and `score` per verse, or None when the local
+    index is unavailable or the query has no searchable terms.
+    """
+    if not fts_available():
+        return None
+
+    match = build_match_query(query)
+    if not match:
+        return None
+
+    order_by = ORDERINGS.get(sort, ORDERINGS['canonical'])
+    sql = f"""
+        SELECT v.verse_id, v.reference, v.text, b.api_id, v.chapter,
+               snippet({FTS_TABLE}, 0, %s, %s, '…', 16),
+               highlight({FTS_TABLE}, 0, %s, %s),
+               bm25({FTS_TABLE}, 10.0, 1.0) AS rank
+        FROM {FTS_TABLE} f
+        JOIN quotes_cachedverse v ON v.id = f.rowid
+        JOIN quotes_book b ON b.id = v.book_id
+        WHERE {FTS_TABLE} MATCH %s
+        ORDER BY {order_by}
+        LIMIT %s OFFSET %s
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+            )
+            total = cursor.fetchone()[0]
+            cursor.execute(sql, [
+                MARK_OPEN, MARK_CLOSE, MARK_OPEN, MARK_CLOSE, match, limit, offset
+            ])
+            rows = cursor.fetchall()
+    except DatabaseError as e:
+        print(f"Local search failed for {query!r}: {e}")
+        return None
+
+    verses = []
+    for verse_id, reference, text, book_id, chapter, snippet, highlight, rank in rows:
+        verses.append({
+            'id': verse_id,
+            'reference': reference,
+            'text': text,
+            'book_id': book_id,
+            'chapter_id': f"{book_id}.{chapter}",
+            'snippet': _marked_html(snippet),
+            'highlight': _marked_html(highlight),
+            'score': round(-rank, 4),
+        })
+
+    return {
+        'verses': verses,
+        'total': total,
+        'query': query,
+        'engine': 'local'
+    }
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import threading
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import SearchCache
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a search query"""
+    return ' '.join(query.lower().split())
+
+
+def window_size():
+    return _setting('SEARCH_CACHE_WINDOW', 100)
+
+
+def window_key(query, sort, start):
+    """Cache key for one fetched window of results"""
+    key = f"{normalize_query(query)}:{sort}:{start}"
+    if len(key) > 200:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        key = f"{key[:150]}:{digest}"
+    return key
+
+
+def lookup(key, allow_expired=False):
+    """Return (results, state) where state is 'fresh', 'stale' or None for a miss.
+
+    With allow_expired, rows past the stale window are still returned (state
+    'expired') - used when the upstream cannot be reached.
+    """
+    try:
+        cached = SearchCache.objects.get(query=key)
+    except SearchCache.DoesNotExist:
+        return None, None
+
+    now = timezone.now()
+    age = (now - cached.fetched_at).total_seconds()
+    if age > _setting('SEARCH_CACHE_STALE_TTL', 7 * 24 * 3600):
+        if allow_expired:
+            return cached.get_results(), 'expired'
+        return None, None
+
+    # Only touch the LRU stamp once in a while so reads rarely write
+    if (now - cached.last_accessed).total_seconds() > _setting('SEARCH_CACHE_TOUCH_INTERVAL', 600):
+        SearchCache.objects.filter(pk=cached.pk).update(last_accessed=now)
+
+    state = 'fresh' if age <= _setting('SEARCH_CACHE_TTL', 24 * 3600) else 'stale'
+    return cached.get_results(), state
+
+
+def store(key, results):
+    """Save a window of results and keep the table within its row/byte caps"""
+    payload = json.dumps(results)
+    now = timezone.now()
+    SearchCache.objects.update_or_create(
+        query=key,
+        defaults={
+            'results': payload,
+            'fetched_at': now,
+            'last_accessed': now,
+            'size': len(payload.encode('utf-8'))
+        }
+    )
+    enforce_limits()
+
+
+def enforce_limits():
+    """Evict least recently used rows beyond SEARCH_CACHE_MAX_ROWS / SEARCH_CACHE_MAX_BYTES"""
+    max_rows = _setting('SEARCH_CACHE_MAX_ROWS', 5000)
+    max_bytes = _setting('SEARCH_CACHE_MAX_BYTES', 20 * 1024 * 1024)
+
+    totals = SearchCache.objects.aggregate(rows=Count('id'), size=Sum('size'))
+    rows, total_bytes = totals['rows'], totals['size'] or 0
+    if rows <= max_rows and total_bytes <= max_bytes:
+        return 0
+
+    evict = []
+    for pk, size in SearchCache.objects.order_by('last_accessed').values_list('pk', 'size').iterator():
+        if rows <= max_rows and total_bytes <= max_bytes:
+            break
+        evict.append(pk)
+        rows -= 1
+        total_bytes -= size
+
+    deleted = 0
+    for i in range(0, len(evict), 500):
+        deleted += SearchCache.objects.filter(pk__in=evict[i:i + 500]).delete()[0]
+    return deleted
+
+
+def prune():
+    """Delete rows past the stale window, then enforce the caps. Returns (expired, evicted)"""
+    cutoff = timezone.now() - timezone.timedelta(seconds=_setting('SEARCH_CACHE_STALE_TTL', 7 * 24 * 3600))
+    expired = SearchCache.objects.filter(fetched_at__lt=cutoff).delete()[0]
+    return expired, enforce_limits()
+
+
+def refresh_in_background(key, fetch):
+    """Re-run `fetch()` in a daemon thread and store its result (once per key at a time)"""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+
+    def run():
+        try:
+            results = fetch()
+            if results is not None:
+                store(key, results)
+        except Exception as e:
+            print(f"Background refresh failed for {key}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+            connection.close()
+
+    threading.Thread(target=run, name=f"search-refresh:{key[:40]}", daemon=True).start()
+    return True
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by renditions.refresh once the renditions of `quote_ids` were rewritten,
+# whichever path cached the verses (bulk upserts send no post_save of their own)
+quotes_changed = Signal()
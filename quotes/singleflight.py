@@ -0,0 +1,60 @@
+import threading
+from .resilience import BudgetExhausted
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one in-flight call.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for it and get the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() for `key`, or wait up to `timeout` seconds for the call already in flight"""
+        kind = key.split(':', 1)[0]
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            counters = self._stats.setdefault(kind, {'calls': 0, 'collapsed': 0})
+            counters['calls' if leader else 'collapsed'] += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise BudgetExhausted(f"gave up waiting for in-flight {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """Upstream calls made and callers collapsed onto them, per key prefix"""
+        with self._lock:
+            return {kind: dict(counters) for kind, counters in self._stats.items()}
+
+
+# Global instance
+flights = SingleFlight()
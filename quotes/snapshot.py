@@ -0,0 +1,257 @@
+"""Cache snapshots: the books, quotes and cached verses of one node in a file another node loads.
+
+A snapshot is gzip-compressed JSON Lines. The first line is a header with the
+format name and version, then one array per record:
+
+    ["book", api_id, name, canonical_order]
+    ["quote", book_api_id, reference, [[start_ordinal, end_ordinal], ...]]
+    ["verse", verse_id, reference, text]
+
+and a trailer with the record counts and the sha256 of every line before it.
+Records use natural keys (api_id, book + reference, verse_id) rather than
+primary keys, so a snapshot can be merged into a database that already has
+rows. Renditions and ordinals are derived data and are rebuilt on import.
+"""
+import gzip
+import hashlib
+import itertools
+import json
+import os
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Book, CacheJob, CachedVerse, Quote, QuoteRange, QuoteRendition
+from .signals import quotes_changed
+from . import renditions, versification
+
+FORMAT = 'eshis-cache-snapshot'
+VERSION = 1
+
+
+class SnapshotError(Exception):
+    """The file is not a snapshot we can read, or it is truncated or corrupted"""
+
+
+def _quote_rows(chunk_size):
+    """(book_api_id, reference, ranges) per quote, joining the id-ordered ranges as they stream by"""
+    quotes = Quote.objects.order_by('id').values_list('id', 'book__api_id', 'reference')
+    ranges = itertools.groupby(
+        QuoteRange.objects.order_by('quote_id', 'start_ordinal').values_list(
+            'quote_id', 'start_ordinal', 'end_ordinal'
+        ).iterator(chunk_size=chunk_size),
+        key=lambda row: row[0]
+    )
+    pending = next(ranges, None)
+    for quote_id, book_api_id, reference in quotes.iterator(chunk_size=chunk_size):
+        # Ranges of quotes deleted mid-export are skipped
+        while pending is not None and pending[0] < quote_id:
+            pending = next(ranges, None)
+        quote_ranges = []
+        if pending is not None and pending[0] == quote_id:
+            quote_ranges = [[start, end] for _, start, end in pending[1]]
+            pending = next(ranges, None)
+        yield book_api_id, reference, quote_ranges
+
+
+def records(chunk_size=2000):
+    """Every snapshot record, streamed from the database"""
+    for api_id, name, order in Book.objects.order_by('canonical_order').values_list('api_id', 'name', 'canonical_order'):
+        yield ['book', api_id, name, order]
+    for book_api_id, reference, ranges in _quote_rows(chunk_size):
+        yield ['quote', book_api_id, reference, ranges]
+    verses = CachedVerse.objects.order_by('ordinal').values_list('verse_id', 'reference', 'text')
+    for verse_id, reference, text in verses.iterator(chunk_size=chunk_size):
+        yield ['verse', verse_id, reference, text]
+
+
+def write(path, rows=None):
+    """Write a snapshot of `rows` (default: the whole cache) to `path`; returns the record counts"""
+    rows = records() if rows is None else rows
+    counts = {'book': 0, 'quote': 0, 'verse': 0}
+    digest = hashlib.sha256()
+
+    # Write then rename, so an interrupted export never leaves a half snapshot behind
+    temp_path = f"{path}.tmp"
+    try:
+        with gzip.open(temp_path, 'wb') as f:
+            def emit(value):
+                line = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                digest.update(line)
+                f.write(line)
+
+            emit({'format': FORMAT, 'version': VERSION, 'created_at': timezone.now().isoformat()})
+            for row in rows:
+                counts[row[0]] += 1
+                emit(row)
+            # The trailer is not part of its own checksum
+            f.write(json.dumps({'end': True, 'counts': counts, 'sha256': digest.hexdigest()}).encode('utf-8') + b'\n')
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return counts
+
+
+def read(path):
+    """Yield the records of a snapshot, checking the header, counts and checksum as it goes.
+
+    SnapshotError is raised at the point the problem is found, which for a
+    bad checksum or a truncated file is after the last record: callers that
+    write while reading should do so inside a transaction.
+    """
+    digest = hashlib.sha256()
+    counts = {'book': 0, 'quote': 0, 'verse': 0}
+    header = None
+    try:
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                value = json.loads(line)
+                if header is None:
+                    if not isinstance(value, dict) or value.get('format') != FORMAT:
+                        raise SnapshotError(f"{path} is not a cache snapshot")
+                    if value.get('version') != VERSION:
+                        raise SnapshotError(f"Unsupported snapshot version {value.get('version')} (expected {VERSION})")
+                    header = value
+                elif isinstance(value, dict):
+                    if value.get('sha256') != digest.hexdigest():
+                        raise SnapshotError("Checksum mismatch, the snapshot is corrupted")
+                    if value.get('counts') != counts:
+                        raise SnapshotError(f"Record counts do not match the trailer: {counts}")
+                    return
+                else:
+                    if not isinstance(value, list) or value[0] not in counts:
+                        raise SnapshotError(f"Unknown record: {line[:80]!r}")
+                    counts[value[0]] += 1
+                    yield value
+                digest.update(line)
+    except (OSError, EOFError, ValueError, IndexError) as e:
+        raise SnapshotError(f"Could not read {path}: {e}")
+    raise SnapshotError(f"{path} is truncated (no trailer)")
+
+
+def clear():
+    """Delete the cache tables wholesale, children first.
+
+    Plain DELETEs: a queryset delete would load every verse to run its
+    per-row signals. Returns the ids of the quotes that were removed.
+    """
+    quote_ids = list(Quote.objects.values_list('id', flat=True))
+    with connection.cursor() as cursor:
+        for model in (QuoteRendition, CacheJob, QuoteRange, Quote, CachedVerse, Book):
+            cursor.execute(f"DELETE FROM {model._meta.db_table}")
+    return quote_ids
+
+
+class Loader:
+    """Bulk-inserts snapshot records in batches, upserting on the natural keys"""
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.books = dict(Book.objects.values_list('api_id', 'id'))
+        self.counts = {'book': 0, 'quote': 0, 'verse': 0}
+        self.skipped = 0
+        self._kind = None
+        self._pending = []
+
+    def add(self, row):
+        # Snapshots are grouped by kind; books must be in before the quotes and verses that point at them
+        if row[0] != self._kind or len(self._pending) >= self.batch_size:
+            self.flush()
+            self._kind = row[0]
+        self._pending.append(row)
+
+    def flush(self):
+        if self._pending:
+            getattr(self, f"_load_{self._kind}s")(self._pending)
+            self._pending = []
+
+    def _load_books(self, rows):
+        Book.objects.bulk_create(
+            [Book(api_id=api_id, name=name, canonical_order=order) for _, api_id, name, order in rows],
+            update_conflicts=True,
+            unique_fields=['api_id'],
+            update_fields=['name', 'canonical_order']
+        )
+        self.books = dict(Book.objects.values_list('api_id', 'id'))
+        self.counts['book'] += len(rows)
+
+    def _load_quotes(self, rows):
+        wanted = {}
+        for _, book_api_id, reference, ranges in rows:
+            book_id = self.books.get(book_api_id)
+            if book_id is None:
+                self.skipped += 1
+                continue
+            wanted[(book_id, reference)] = ranges
+
+        # Quotes already in the database keep their ids; the snapshot's ranges replace theirs
+        Quote.objects.bulk_create(
+            [Quote(book_id=book_id, reference=reference) for book_id, reference in wanted],
+            ignore_conflicts=True
+        )
+        ids = {}
+        for quote_id, book_id, reference in Quote.objects.filter(
+            book_id__in={book_id for book_id, _ in wanted},
+            reference__in={reference for _, reference in wanted}
+        ).values_list('id', 'book_id', 'reference'):
+            if (book_id, reference) in wanted:
+                ids[(book_id, reference)] = quote_id
+
+        QuoteRange.objects.filter(quote_id__in=list(ids.values())).delete()
+        QuoteRange.objects.bulk_create([
+            QuoteRange(quote_id=ids[key], start_ordinal=start, end_ordinal=end)
+            for key, ranges in wanted.items()
+            for start, end in ranges
+        ])
+        self.counts['quote'] += len(ids)
+
+    def _load_verses(self, rows):
+        verses = []
+        for _, verse_id, reference, text in rows:
+            parsed = versification.parse_verse_id(verse_id)
+            book_id = self.books.get(parsed[0]) if parsed else None
+            if book_id is None or parsed[0] not in versification.BY_API_ID:
+                self.skipped += 1
+                continue
+            verses.append(CachedVerse(
+                verse_id=verse_id,
+                book_id=book_id,
+                chapter=parsed[1],
+                verse_number=parsed[2],
+                text=text,
+                reference=reference,
+                ordinal=versification.pack(*parsed)
+            ))
+        CachedVerse.objects.bulk_create(
+            verses,
+            update_conflicts=True,
+            unique_fields=['verse_id'],
+            update_fields=['text', 'reference', 'ordinal']
+        )
+        self.counts['verse'] += len(verses)
+
+
+def load(path, merge=False, batch_size=500):
+    """Import a snapshot in one transaction; returns the Loader with its counts.
+
+    Without `merge` the cache tables are emptied first and end up exactly as
+    in the snapshot. With `merge` local rows are kept and the snapshot's rows
+    win where both have the same book, quote or verse.
+    """
+    removed = []
+    with transaction.atomic():
+        if not merge:
+            removed = clear()
+        loader = Loader(batch_size)
+        for row in read(path):
+            loader.add(row)
+        loader.flush()
+
+    # Renditions are not in the snapshot; bulk writes sent no signals. The new stamps also
+    # move the content version the cached quote totals and book list are keyed on
+    renditions.rebuild()
+    if removed:
+        quotes_changed.send(sender=Quote, quote_ids=removed)
+    return loader
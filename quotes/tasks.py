@@ -1,94 +1,171 @@
-import time
+from django.conf import settings
+from django.db.models import Count, F, Q
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Q
-from .models import Quote, CachedVerse
+from .models import CacheJob
 from .bible_api import BibleAPIClient
+from . import planner
+from . import leases
 
-class VerseCache:
-    _instance = None
-    _lock = False
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
-    
-    def cache_quote_immediately(self, quote):
-        """Cache a specific quote's verses immediately - SYNCHRONOUS"""
-        if self._lock:
-            return 0  # Skip if already processing
-            
-        self._lock = True
+# Job priorities: a reader waiting on a detail page goes before bulk warming
+PRIORITY_VIEWER = 100
+PRIORITY_REQUESTED = 50
+PRIORITY_BACKGROUND = 0
+
+
+class FillError(Exception):
+    """Some chapters of a quote could not be fetched (the job is retried)"""
+
+
+class QuoteBusy(Exception):
+    """Another worker holds the quote's lease and is filling it right now"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def fill_quote(quote):
+    """Cache a quote's missing verses, one chapter request per missing chapter.
+
+    Returns the number of verses cached; raises FillError when a chapter
+    came back empty (upstream down or negatively cached) after trying all.
+    Raises QuoteBusy when another process is already filling the quote.
+    """
+    with leases.hold(f"quote:{quote.id}") as held:
+        if not held:
+            raise QuoteBusy(f"quote {quote.id} is being filled elsewhere")
+        return _fill_quote(quote)
+
+
+def _fill_quote(quote):
+    client = BibleAPIClient()
+    fetch_plan = planner.plan([quote.id])
+
+    failed = []
+    for call in fetch_plan.calls:
         try:
-            return self._do_cache_quote(quote)
-        finally:
-            self._lock = False
-    
-    def _do_cache_quote(self, quote):
-        """Actually cache the quote verses"""
-        client = BibleAPIClient()
-        verse_ids = quote.get_verse_ids_list()
-        
-        cached_count = 0
-        for verse_id in verse_ids:
-            try:
-                # Check if already cached
-                if CachedVerse.objects.filter(verse_id=verse_id).exists():
-                    cached_verse = CachedVerse.objects.get(verse_id=verse_id)
-                    quote.cached_verses.add(cached_verse)
-                    continue
-                
-                # Fetch from API
-                verse_data = client.get_verse(verse_id)
-                if verse_data:
-                    # Check again after API call (avoid race conditions)
-                    cached_verse, created = CachedVerse.objects.get_or_create(
-                        verse_id=verse_id,
-                        defaults={
-                            'book': quote.book,
-                            'chapter': int(verse_id.split('.')[1]),
-                            'verse_number': int(verse_id.split('.')[2]),
-                            'text': verse_data['text'],
-                            'reference': verse_data['reference']
-                        }
-                    )
-                    
-                    quote.cached_verses.add(cached_verse)
-                    if created:
-                        cached_count += 1
-                        print(f"Cached verse: {verse_id}")
-                    
-                    # Small delay to be nice to APIs
-                    time.sleep(0.5)
-                    
-            except Exception as e:
-                print(f"Error caching verse {verse_id}: {e}")
-                continue
-        
-        return cached_count
-    
-    def cache_random_quotes(self, max_quotes=3):
-        """Cache a few random uncached quotes - called on-demand"""
-        if self._lock:
+            # A chapter call upserts all of the chapter's verses in bulk
+            if not planner.execute(client, call):
+                failed.append(f"{call.api_id}.{call.chapter}")
+        except Exception as e:
+            print(f"Error caching chapter {call.api_id}.{call.chapter}: {e}")
+            failed.append(f"{call.api_id}.{call.chapter}")
+
+    cached_count = len(fetch_plan.missing) - len(planner.plan([quote.id]).missing) if fetch_plan.calls else 0
+    if failed:
+        raise FillError(f"could not fetch {', '.join(failed)} ({cached_count} verses cached)")
+    if cached_count:
+        print(f"Cached {cached_count} verses for quote {quote.id}")
+    return cached_count
+
+
+class JobQueue:
+    """Persistent cache-fill queue in the CacheJob table.
+
+    Every process using the database shares it: web requests enqueue,
+    `manage.py run_workers` leases, fills and acks. A lease is a
+    conditional UPDATE, so two workers can never claim the same job, and
+    jobs whose worker died are picked up again once the lease expires.
+    """
+
+    def enqueue(self, quote_ids, priority=PRIORITY_BACKGROUND):
+        """Queue fills for quotes, one job per quote. Returns the number of jobs (re)queued"""
+        quote_ids = set(quote_ids)
+        if not quote_ids:
             return 0
-            
+        now = timezone.now()
+        existing = CacheJob.objects.filter(quote_id__in=quote_ids)
+
+        # Jobs already waiting only move up
+        existing.filter(status='queued', priority__lt=priority).update(priority=priority, updated_at=now)
+
+        # Finished jobs run again (verses went missing or the upstream recovered), but not
+        # straight away, so repeated page views of a quote that cannot complete stay cheap
+        cooldown = now - timezone.timedelta(seconds=_setting('JOB_REQUEUE_AFTER', 300))
+        requeued = existing.filter(status__in=['done', 'failed'], updated_at__lt=cooldown).update(
+            status='queued', priority=priority, attempts=0, run_after=now, last_error='', updated_at=now
+        )
+
+        known = set(existing.values_list('quote_id', flat=True))
+        new_jobs = [CacheJob(quote_id=quote_id, priority=priority) for quote_id in quote_ids - known]
+        CacheJob.objects.bulk_create(new_jobs, ignore_conflicts=True)
+        return requeued + len(new_jobs)
+
+    def lease(self, worker, lease_seconds=None):
+        """Claim the most urgent ready job for `worker`, or None when there is nothing to do"""
+        now = timezone.now()
+        lease_seconds = lease_seconds or _setting('JOB_LEASE_SECONDS', 300)
+        claimable = Q(status='queued', run_after__lte=now) | Q(status='running', leased_until__lt=now)
+
+        candidates = CacheJob.objects.filter(claimable).order_by('-priority', 'run_after', 'id')
+        for job_id in candidates.values_list('id', flat=True)[:10]:
+            # Only one worker's UPDATE can still match; the others move on to the next candidate
+            claimed = CacheJob.objects.filter(claimable, id=job_id).update(
+                status='running',
+                leased_by=worker,
+                leased_until=now + timezone.timedelta(seconds=lease_seconds),
+                attempts=F('attempts') + 1,
+                updated_at=now,
+            )
+            if claimed:
+                return CacheJob.objects.select_related('quote', 'quote__book').get(id=job_id)
+        return None
+
+    def ack(self, job):
+        """Mark a leased job done (ignored if the lease was lost to another worker)"""
+        return CacheJob.objects.filter(id=job.id, leased_by=job.leased_by, status='running').update(
+            status='done', leased_by='', leased_until=None, last_error='', updated_at=timezone.now()
+        )
+
+    def retry(self, job, error):
+        """Requeue a failed job with exponential backoff, or give up after JOB_MAX_ATTEMPTS"""
+        now = timezone.now()
+        if job.attempts >= _setting('JOB_MAX_ATTEMPTS', 5):
+            status, run_after = 'failed', now
+        else:
+            delay = min(
+                _setting('JOB_RETRY_BACKOFF', 30) * 2 ** (job.attempts - 1),
+                _setting('JOB_RETRY_BACKOFF_MAX', 3600)
+            )
+            status, run_after = 'queued', now + timezone.timedelta(seconds=delay)
+        CacheJob.objects.filter(id=job.id, leased_by=job.leased_by, status='running').update(
+            status=status, run_after=run_after, leased_by='', leased_until=None,
+            last_error=str(error)[:1000], updated_at=now
+        )
+        return status
+
+    def defer(self, job, delay=None):
+        """Put a leased job back in the queue without counting the attempt"""
+        delay = delay if delay is not None else _setting('LEASE_WAIT', 5)
+        CacheJob.objects.filter(id=job.id, leased_by=job.leased_by, status='running').update(
+            status='queued', run_after=timezone.now() + timezone.timedelta(seconds=delay),
+            attempts=F('attempts') - 1, leased_by='', leased_until=None, updated_at=timezone.now()
+        )
+        return 'queued'
+
+    def process(self, job):
+        """Fill a leased job's quote and ack or retry it. Returns (status, verses cached)"""
         try:
-            # Get quotes without cached verses
-            uncached_quotes = Quote.objects.filter(
-                cached_verses__isnull=True
-            ).distinct()[:max_quotes]
-            
-            total_cached = 0
-            for quote in uncached_quotes:
-                cached = self.cache_quote_immediately(quote)
-                total_cached += cached
-            
-            return total_cached
-            
+            cached = fill_quote(job.quote)
+        except QuoteBusy:
+            # Check back shortly: the other fill usually leaves nothing to do
+            return self.defer(job), 0
         except Exception as e:
-            print(f"Error in cache_random_quotes: {e}")
-            return 0
+            return self.retry(job, e), 0
+        self.ack(job)
+        return 'done', cached
+
+    def status_of(self, quote_id):
+        """Job status for a quote ('queued', 'running', 'done', 'failed'), or None"""
+        return CacheJob.objects.filter(quote_id=quote_id).values_list('status', flat=True).first()
+
+    def stats(self):
+        """Job counts per status"""
+        counts = {status: 0 for status, _ in CacheJob.STATUS_CHOICES}
+        for row in CacheJob.objects.values('status').annotate(total=Count('id')):
+            counts[row['status']] = row['total']
+        return counts
+
 
 # Global instance
-verse_cache = VerseCache()
\ No newline at end of file
+job_queue = JobQueue()
@@ -1,3 +1,1321 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .bible_api import BibleAPIClient
+from .http import BibleTransport
+from .index import quote_index
+from .management.commands.import_corpus import Command as ImportCorpusCommand
+from .models import Book, CacheJob, CachedVerse, Lease, Quote, QuoteRendition, SearchCache
+from .quotes_data import QUOTES
+from .resilience import BreakerRegistry, BudgetExhausted, CircuitBreaker, CircuitOpen, latency_budget
+from .singleflight import SingleFlight
+from .tasks import PRIORITY_VIEWER, FillError, job_queue
+from . import fragments, leases, negative_cache, pagination, planner, renditions, search_cache, snapshot, versification, warmer
+
+
+@override_settings(BIBLE_BREAKER_WINDOW=4, BIBLE_BREAKER_MIN_CALLS=4, BIBLE_BREAKER_FAILURE_RATE=0.5,
+                   BIBLE_BREAKER_SLOW_CALL=5.0, BIBLE_BREAKER_COOLDOWN=30)
+class CircuitBreakerTests(SimpleTestCase):
+    def trip(self, breaker):
+        for _ in range(4):
+            breaker.before_call()
+            breaker.record(False, 0.1)
+
+    def test_closed_until_failure_rate_reached(self):
+        breaker = CircuitBreaker('example.org')
+        for ok in (True, True, False):
+            breaker.before_call()
+            breaker.record(ok, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_open_fails_fast_during_cooldown(self):
+        breaker = CircuitBreaker('example.org')
+        self.trip(breaker)
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = CircuitBreaker('example.org')
+        self.trip(breaker)
+        with override_settings(BIBLE_BREAKER_COOLDOWN=0):
+            breaker.before_call()
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            with self.assertRaises(CircuitOpen):
+                breaker.before_call()
+
+    def test_successful_probe_closes(self):
+        breaker = CircuitBreaker('example.org')
+        self.trip(breaker)
+        with override_settings(BIBLE_BREAKER_COOLDOWN=0):
+            breaker.before_call()
+            breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_or_slow_probe_reopens(self):
+        for ok, latency in ((False, 0.1), (True, 6.0)):
+            breaker = CircuitBreaker('example.org')
+            self.trip(breaker)
+            with override_settings(BIBLE_BREAKER_COOLDOWN=0):
+                breaker.before_call()
+            breaker.record(ok, latency)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_release_frees_probe_slot(self):
+        breaker = CircuitBreaker('example.org')
+        self.trip(breaker)
+        with override_settings(BIBLE_BREAKER_COOLDOWN=0):
+            breaker.before_call()
+            breaker.release()
+            breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+@override_settings(BIBLE_BREAKER_WINDOW=4, BIBLE_BREAKER_MIN_CALLS=4, BIBLE_BREAKER_COOLDOWN=0,
+                   BIBLE_HTTP_MAX_RETRIES=0, BIBLE_RATE_LIMITS={})
+class TransportBreakerTests(SimpleTestCase):
+    url = 'https://upstream.test/bible.json'
+
+    def setUp(self):
+        self.transport = BibleTransport()
+        self.session = mock.Mock()
+        self.transport.session_for = mock.Mock(return_value=self.session)
+        self.breakers = BreakerRegistry()
+        patcher = mock.patch('quotes.http.breakers', self.breakers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = self.breakers.for_host('upstream.test')
+        for _ in range(4):
+            self.breaker.record(False, 0.1)
+
+    def test_other_request_errors_count_as_probe_failures(self):
+        for error in (requests.exceptions.ChunkedEncodingError, requests.TooManyRedirects,
+                      requests.exceptions.ContentDecodingError):
+            self.session.get.side_effect = error('broken')
+            with self.assertRaises(error):
+                self.transport.get(self.url)
+            self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+            self.assertFalse(self.breaker._probing)
+
+    def test_unexpected_error_releases_probe(self):
+        self.session.get.side_effect = RuntimeError('bug')
+        with self.assertRaises(RuntimeError):
+            self.transport.get(self.url)
+        self.assertFalse(self.breaker._probing)
+
+        self.session.get.side_effect = None
+        self.session.get.return_value = mock.Mock(status_code=200)
+        self.transport.get(self.url)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class ApiQuotesTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        self.quote = Quote.objects.create(book=book, reference='5:3-4')
+        self.quote.set_verse_ids_list(['MAT.5.3', 'MAT.5.4'])
+        CachedVerse.objects.create(verse_id='MAT.5.3', book=book, chapter=5, verse_number=3,
+                                   text='Blessed are the poor in spirit', reference='Matthew 5:3')
+
+    def get(self, **params):
+        response = self.client.get(reverse('quotes:api_quotes'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))['quotes']
+
+    def test_default_payload_keeps_original_fields(self):
+        quote, = self.get()
+        self.assertEqual(set(quote), {'book', 'reference', 'verses'})
+        self.assertEqual(quote['verses'], [
+            {'verse': 3, 'text': 'Blessed are the poor in spirit', 'reference': 'Matthew 5:3'}
+        ])
+
+    def test_fields_trims_payload(self):
+        quote, = self.get(fields='reference,missing_count')
+        self.assertEqual(quote, {'reference': '5:3-4', 'missing_count': 1})
+
+
+class SearchVersesTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        CachedVerse.objects.create(verse_id='MAT.5.3', book=book, chapter=5, verse_number=3,
+                                   text='Blessed are the poor in spirit', reference='Matthew 5:3')
+        self.upstream = {'verses': [{'id': 'PSA.1.1'}, {'id': 'MAT.5.3'}], 'total': 2, 'query': 'blessed'}
+
+    def test_online_search_ignores_partial_local_hits(self):
+        client = BibleAPIClient()
+        client.offline = False
+        with mock.patch.object(client, '_search_window', return_value=self.upstream) as window:
+            results = client.search_verses('blessed')
+        window.assert_called_once()
+        self.assertEqual(results['total'], 2)
+
+    def test_local_index_is_partial_fallback_when_upstream_fails(self):
+        client = BibleAPIClient()
+        client.offline = False
+        with mock.patch.object(client, '_search_window', return_value=None):
+            results = client.search_verses('blessed')
+        self.assertTrue(results['partial'])
+        self.assertEqual([verse['id'] for verse in results['verses']], ['MAT.5.3'])
+
+    def test_offline_answers_from_local_index(self):
+        client = BibleAPIClient()
+        client.offline = True
+        with mock.patch.object(client, '_search_window') as window:
+            results = client.search_verses('blessed')
+        window.assert_not_called()
+        self.assertEqual(results['total'], 1)
+        self.assertNotIn('partial', results)
+
+
+@override_settings(BIBLE_FETCH_MODE='chapter')
+class ChapterVerseMissTests(TestCase):
+    def setUp(self):
+        for verse_id in ('MAT.5.4', 'MAT.5.49'):
+            negative_cache.clear(f"verse:{verse_id}")
+
+    def verse(self, number, cached):
+        return {'id': f"MAT.5.{number}", 'reference': f"Matthew 5:{number}", 'text': 'text',
+                'verse_number': number, 'cached': cached}
+
+    def miss(self, verse_id, chapter_verses):
+        client = BibleAPIClient()
+        client.offline = False
+        with mock.patch.object(client, 'get_chapter', return_value=chapter_verses):
+            self.assertIsNone(client._fetch_verse(verse_id))
+        return negative_cache.check(f"verse:{verse_id}")
+
+    def test_partially_cached_chapter_is_not_proof_of_absence(self):
+        # Lease held elsewhere: only the cached verses come back
+        self.assertIsNone(self.miss('MAT.5.4', [self.verse(3, True)]))
+
+    def test_fetched_chapter_without_the_verse_is_negatively_cached(self):
+        self.assertEqual(self.miss('MAT.5.4', [self.verse(3, False)]), 'not_found')
+
+    def test_complete_cached_chapter_without_the_verse_is_negatively_cached(self):
+        # Matthew 5 has 48 verses
+        self.assertEqual(self.miss('MAT.5.49', [self.verse(number, True) for number in range(1, 49)]), 'not_found')
+
+
+class BusyQuoteTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        self.quote = Quote.objects.create(book=book, reference='5:3')
+        self.quote.set_verse_ids_list(['MAT.5.3'])
+
+    def test_quote_filled_elsewhere_is_deferred_not_acked(self):
+        job_queue.enqueue([self.quote.id])
+        leases.acquire(f"quote:{self.quote.id}", 'elsewhere')
+        job = job_queue.lease('worker')
+
+        self.assertEqual(job_queue.process(job), ('queued', 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.leased_by), ('queued', 0, ''))
+        self.assertGreater(job.run_after, timezone.now())
+
+
+class LeaseRenewalTests(TransactionTestCase):
+    def test_held_lease_outlives_its_ttl(self):
+        with leases.hold('chapter:MAT.5', ttl=0.6) as held:
+            self.assertTrue(held)
+            time.sleep(1.0)
+            self.assertFalse(leases.acquire('chapter:MAT.5', 'other'))
+        self.assertFalse(Lease.objects.exists())
+
+    def test_lease_of_dead_holder_expires(self):
+        leases.acquire('chapter:MAT.5', 'dead', ttl=0.2)
+        time.sleep(0.3)
+        self.assertTrue(leases.acquire('chapter:MAT.5', 'other'))
+
+
+class QuoteTotalsTests(TestCase):
+    def test_totals_follow_quotes_changed_by_another_process(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        first = Quote.objects.create(book=book, reference='5:3')
+        renditions.refresh([first.id])
+        self.assertEqual(pagination.quote_total('Matthew'), 1)
+
+        # Nothing clears this process's cache: the new version alone must invalidate it
+        second = Quote.objects.create(book=book, reference='5:4')
+        renditions.refresh([second.id])
+        self.assertEqual(pagination.quote_total('Matthew'), 2)
+        first.delete()
+        self.assertEqual(pagination.quote_total(), 1)
+
+
+class BookListTests(TestCase):
+    def test_book_changes_reach_the_cached_list_through_the_version(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        renditions.refresh([Quote.objects.create(book=book, reference='5:3').id])
+        self.assertEqual([b.name for b in fragments.book_list()], ['Matthew'])
+
+        book.name = 'The Gospel of Matthew'
+        book.save()
+        self.assertEqual([b.name for b in fragments.book_list()], ['The Gospel of Matthew'])
+
+
+class ApiResolveTests(TestCase):
+    def post(self, body):
+        return self.client.post(reverse('quotes:api_resolve'), json.dumps(body), content_type='application/json')
+
+    def test_non_string_book_is_rejected(self):
+        for book in (['MAT'], {'id': 'MAT'}, 40):
+            response = self.post({'book': book, 'refs': ['5:3']})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'book must be a string'})
+
+    def test_non_string_refs_are_rejected(self):
+        self.assertEqual(self.post({'refs': [['MAT.5.3']]}).status_code, 400)
+
+
+class NegativeCacheKeyTests(TestCase):
+    def test_long_keys_round_trip_through_the_database(self):
+        key = 'search:' + 'love one another ' * 20
+        other = key[:-1] + 'X'
+        negative_cache.record(key, 'not_found')
+        # A fresh process has no memo: the lookup must match the stored row
+        negative_cache._memo.clear()
+        self.assertEqual(negative_cache.check(key), 'not_found')
+        self.assertIsNone(negative_cache.check(other))
+
+        negative_cache.clear(key)
+        negative_cache._memo.clear()
+        self.assertIsNone(negative_cache.check(key))
+
+
+class SetupBibleTests(TestCase):
+    def setUp(self):
+        for info in versification.BOOKS:
+            Book.objects.create(api_id=info.api_id, name=info.name, canonical_order=info.order)
+        matthew = Book.objects.get(api_id='MAT')
+        self.kept = Quote.objects.create(book=matthew, reference=QUOTES['matthew'][0])
+        self.stale = Quote.objects.create(book=matthew, reference='99:1')
+
+    def test_unparseable_reference_keeps_its_quote(self):
+        parse = versification.parse_reference
+
+        def broken(text, book=None, strict=True):
+            if text == self.kept.reference:
+                raise ValueError('parser regression')
+            return parse(text, book, strict)
+
+        with mock.patch('quotes.versification.parse_reference', broken):
+            call_command('setup_bible', stdout=io.StringIO())
+        self.assertTrue(Quote.objects.filter(id=self.kept.id).exists())
+        self.assertFalse(Quote.objects.filter(id=self.stale.id).exists())
+
+    def test_rerun_changes_nothing(self):
+        call_command('setup_bible', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('setup_bible', stdout=out)
+        self.assertIn('0 created, 0 updated, 0 deleted', out.getvalue())
+
+
+class ParseReferenceTests(SimpleTestCase):
+    def mat(self, chapter, verse):
+        return versification.pack('MAT', chapter, verse)
+
+    def test_single_verses_and_ranges(self):
+        self.assertEqual(versification.parse_reference('5:3-12, 14', 'MAT'),
+                         ((self.mat(5, 3), self.mat(5, 12)), (self.mat(5, 14), self.mat(5, 14))))
+
+    def test_backwards_ranges_are_rejected(self):
+        for text in ('5:12-3', '7:3-5:2'):
+            with self.assertRaises(ValueError):
+                versification.parse_reference(text, 'MAT')
+
+    def test_overshoot_is_only_kept_when_lenient(self):
+        # Matthew 5 has 48 verses
+        with self.assertRaises(ValueError):
+            versification.parse_reference('5:47-50', 'MAT')
+        self.assertEqual(versification.parse_reference('5:47-50', 'MAT', strict=False),
+                         ((self.mat(5, 47), self.mat(5, 50)),))
+
+    def test_missing_chapter_is_rejected_even_when_lenient(self):
+        for text in ('29:1', '0:1'):
+            with self.assertRaises(ValueError):
+                versification.parse_reference(text, 'MAT', strict=False)
+
+    def test_cross_chapter_range_splits_per_chapter(self):
+        self.assertEqual(versification.parse_reference('Matthew 5:47-7:2'), (
+            (self.mat(5, 47), self.mat(5, 48)),
+            (self.mat(6, 1), self.mat(6, 34)),
+            (self.mat(7, 1), self.mat(7, 2)),
+        ))
+
+    def test_whole_chapters_verse_ids_and_passages(self):
+        self.assertEqual(versification.parse_reference('5', 'MAT'), ((self.mat(5, 1), self.mat(5, 48)),))
+        self.assertEqual(versification.parse_reference('MAT.5.3; John 3:16'), (
+            (self.mat(5, 3), self.mat(5, 3)),
+            (versification.pack('JHN', 3, 16), versification.pack('JHN', 3, 16)),
+        ))
+
+    def test_unknown_book_and_garbage(self):
+        for text, book in (('5:3', None), ('Hezekiah 1:1', None), ('five', 'MAT'), (';', 'MAT')):
+            with self.assertRaises(ValueError):
+                versification.parse_reference(text, book)
+
+
+class QuoteRangesMigrationTests(TransactionTestCase):
+    """0005 (verse ordinals) and 0006 (verse_ids/M2M -> QuoteRange), forwards and back"""
+
+    before = [('quotes', '0004_negativecache')]
+    after = [('quotes', '0006_quote_ranges')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_round_trip(self):
+        apps = self.migrate(self.before)
+        Book = apps.get_model('quotes', 'Book')
+        CachedVerse = apps.get_model('quotes', 'CachedVerse')
+        OldQuote = apps.get_model('quotes', 'Quote')
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=1)
+        verses = [
+            CachedVerse.objects.create(verse_id=f"MAT.5.{number}", book=book, chapter=5, verse_number=number,
+                                       text=f"verse {number}", reference=f"Matthew 5:{number}")
+            for number in (3, 4)
+        ]
+        verse_ids = ['MAT.5.3', 'MAT.5.4', 'MAT.5.5', 'MAT.5.9']
+        quote = OldQuote.objects.create(book=book, reference='5:3-5, 9', verse_ids=json.dumps(verse_ids))
+        quote.cached_verses.set(verses)
+
+        apps = self.migrate(self.after)
+        self.assertEqual(
+            list(apps.get_model('quotes', 'CachedVerse').objects.order_by('ordinal').values_list('ordinal', flat=True)),
+            [versification.pack('MAT', 5, 3), versification.pack('MAT', 5, 4)]
+        )
+        self.assertEqual(
+            list(apps.get_model('quotes', 'QuoteRange').objects.filter(quote_id=quote.id).values_list('start_ordinal', 'end_ordinal')),
+            [(versification.pack('MAT', 5, 3), versification.pack('MAT', 5, 5)),
+             (versification.pack('MAT', 5, 9), versification.pack('MAT', 5, 9))]
+        )
+
+        apps = self.migrate([('quotes', '0005_cachedverse_ordinal')])
+        restored = apps.get_model('quotes', 'Quote').objects.get(id=quote.id)
+        self.assertEqual(json.loads(restored.verse_ids), verse_ids)
+        self.assertEqual(sorted(restored.cached_verses.values_list('verse_id', flat=True)), ['MAT.5.3', 'MAT.5.4'])
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        self.quotes = [Quote.objects.create(book=book, reference=f"5:{number}") for number in (3, 4)]
+
+    def test_lease_takes_the_most_urgent_job_once(self):
+        job_queue.enqueue([self.quotes[0].id])
+        job_queue.enqueue([self.quotes[1].id], priority=PRIORITY_VIEWER)
+
+        first = job_queue.lease('worker-1')
+        second = job_queue.lease('worker-2')
+        self.assertEqual(first.quote_id, self.quotes[1].id)
+        self.assertEqual(second.quote_id, self.quotes[0].id)
+        self.assertIsNone(job_queue.lease('worker-3'))
+
+    @override_settings(JOB_RETRY_BACKOFF=30, JOB_MAX_ATTEMPTS=2)
+    def test_failed_fill_backs_off_then_gives_up(self):
+        job_queue.enqueue([self.quotes[0].id])
+        with mock.patch('quotes.tasks.fill_quote', side_effect=FillError('upstream down')):
+            job = job_queue.lease('worker')
+            self.assertEqual(job_queue.process(job), ('queued', 0))
+            job.refresh_from_db()
+            self.assertEqual(job.last_error, 'upstream down')
+            self.assertGreater(job.run_after, timezone.now() + timezone.timedelta(seconds=25))
+            self.assertIsNone(job_queue.lease('worker'))
+
+            CacheJob.objects.filter(id=job.id).update(run_after=timezone.now())
+            job = job_queue.lease('worker')
+            self.assertEqual(job.attempts, 2)
+            self.assertEqual(job_queue.process(job), ('failed', 0))
+
+    def test_expired_lease_is_reclaimed_and_old_ack_ignored(self):
+        job_queue.enqueue([self.quotes[0].id])
+        stuck = job_queue.lease('dead-worker')
+        self.assertIsNone(job_queue.lease('worker'))
+
+        CacheJob.objects.filter(id=stuck.id).update(leased_until=timezone.now() - timezone.timedelta(seconds=1))
+        reclaimed = job_queue.lease('worker')
+        self.assertEqual((reclaimed.id, reclaimed.leased_by), (stuck.id, 'worker'))
+        self.assertEqual(job_queue.ack(stuck), 0)
+        self.assertEqual(job_queue.ack(reclaimed), 1)
+        self.assertEqual(job_queue.status_of(self.quotes[0].id), 'done')
+
+
+class LeaseContentionTests(TestCase):
+    def test_second_holder_waits_then_gives_up(self):
+        with leases.hold('chapter:MAT.5') as held:
+            self.assertTrue(held)
+            started = time.monotonic()
+            with leases.hold('chapter:MAT.5', wait=0.3) as other:
+                self.assertFalse(other)
+            self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        # Released on exit
+        with leases.hold('chapter:MAT.5') as held:
+            self.assertTrue(held)
+
+    def test_release_only_by_owner(self):
+        self.assertTrue(leases.acquire('quote:1', 'a'))
+        self.assertFalse(leases.acquire('quote:1', 'b'))
+        leases.release('quote:1', 'b')
+        self.assertFalse(leases.acquire('quote:1', 'b'))
+        leases.release('quote:1', 'a')
+        self.assertTrue(leases.acquire('quote:1', 'b'))
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=1)
+        quote = Quote.objects.create(book=book, reference='5:3-4')
+        quote.set_verse_ids_list(['MAT.5.3', 'MAT.5.4'])
+        CachedVerse.objects.create(verse_id='MAT.5.3', book=book, chapter=5, verse_number=3,
+                                   text='Blessed are the poor in spirit', reference='Matthew 5:3')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshot.jsonl.gz')
+
+    def state(self):
+        return (
+            list(Book.objects.values_list('api_id', 'name', 'canonical_order')),
+            [(quote.book.api_id, quote.reference, list(quote.ranges.values_list('start_ordinal', 'end_ordinal')))
+             for quote in Quote.objects.order_by('reference')],
+            list(CachedVerse.objects.values_list('verse_id', 'chapter', 'verse_number', 'text', 'reference', 'ordinal')),
+            list(QuoteRendition.objects.values_list('cached_count', 'missing_count', 'text')),
+        )
+
+    def test_export_import_round_trip(self):
+        renditions.rebuild()
+        before = self.state()
+        self.assertEqual(snapshot.write(self.path), {'book': 1, 'quote': 1, 'verse': 1})
+
+        Book.objects.all().delete()
+        loader = snapshot.load(self.path)
+        self.assertEqual(loader.counts, {'book': 1, 'quote': 1, 'verse': 1})
+        self.assertEqual(self.state(), before)
+
+    def test_merge_keeps_local_rows(self):
+        snapshot.write(self.path)
+        CachedVerse.objects.create(verse_id='MAT.5.4', book=Book.objects.get(), chapter=5, verse_number=4,
+                                   text='Blessed are they that mourn', reference='Matthew 5:4')
+        snapshot.load(self.path, merge=True)
+        self.assertEqual(CachedVerse.objects.count(), 2)
+        self.assertEqual(QuoteRendition.objects.get().missing_count, 0)
+
+    def test_corrupted_snapshot_is_rejected_and_rolled_back(self):
+        snapshot.write(self.path)
+        with gzip.open(self.path) as f:
+            data = f.read()
+        with gzip.open(self.path, 'wb') as f:
+            f.write(data.replace(b'poor in spirit', b'rich in spirit'))
+
+        before = self.state()
+        with self.assertRaisesMessage(snapshot.SnapshotError, 'Checksum mismatch'):
+            snapshot.load(self.path)
+        self.assertEqual(self.state(), before)
+
+        with gzip.open(self.path, 'wb') as f:
+            f.write(data.rsplit(b'\n', 2)[0] + b'\n')
+        with self.assertRaisesMessage(snapshot.SnapshotError, 'truncated'):
+            snapshot.load(self.path)
+        self.assertEqual(self.state(), before)
+
+
+class DetailRevalidationTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        self.quote = Quote.objects.create(book=book, reference='5:3-4')
+        self.quote.set_verse_ids_list(['MAT.5.3', 'MAT.5.4'])
+        CachedVerse.objects.create(verse_id='MAT.5.3', book=book, chapter=5, verse_number=3,
+                                   text='Blessed are the poor in spirit', reference='Matthew 5:3')
+        renditions.refresh([self.quote.id])
+        self.url = reverse('quotes:detail', args=[self.quote.id])
+
+    def test_revalidating_a_loading_quote_queues_its_fill(self):
+        stamp = QuoteRendition.objects.get().updated_at
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"quote-{self.quote.id}-{stamp.timestamp():.6f}"',
+                                   HTTP_IF_MODIFIED_SINCE=http_date(stamp.timestamp() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertTrue(CacheJob.objects.filter(quote=self.quote, status='queued').exists())
+
+    def test_complete_quote_answers_304(self):
+        CachedVerse.objects.create(verse_id='MAT.5.4', book=self.quote.book, chapter=5, verse_number=4,
+                                   text='Blessed are they that mourn', reference='Matthew 5:4')
+        renditions.refresh([self.quote.id])
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse(CacheJob.objects.exists())
+
+
+@override_settings(JOB_REQUEUE_AFTER=300)
+class QuoteVersesPollingTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        self.quote = Quote.objects.create(book=book, reference='5:3-4')
+        self.quote.set_verse_ids_list(['MAT.5.3', 'MAT.5.4'])
+        CachedVerse.objects.create(verse_id='MAT.5.3', book=book, chapter=5, verse_number=3,
+                                   text='Blessed are the poor in spirit', reference='Matthew 5:3')
+        renditions.refresh([self.quote.id])
+
+    def poll(self):
+        response = self.client.get(reverse('quotes:quote_verses', args=[self.quote.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def fail_job(self, age):
+        CacheJob.objects.get_or_create(quote=self.quote)
+        # update() skips auto_now
+        CacheJob.objects.update(status='failed', updated_at=timezone.now() - timezone.timedelta(seconds=age))
+
+    def test_detail_page_shows_cached_verses_and_polls(self):
+        response = self.client.get(reverse('quotes:detail', args=[self.quote.id]))
+        self.assertContains(response, 'Blessed are the poor in spirit')
+        self.assertTrue(response.context['loading'])
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertEqual(job_queue.status_of(self.quote.id), 'queued')
+
+    def test_poll_reports_progress(self):
+        job_queue.enqueue([self.quote.id])
+        data = self.poll()
+        self.assertEqual([verse['id'] for verse in data['verses']], ['MAT.5.3'])
+        self.assertEqual((data['missing_count'], data['complete'], data['job']), (1, False, 'queued'))
+
+    def test_poll_requeues_a_failed_fill_after_the_cooldown(self):
+        self.fail_job(age=10)
+        self.assertEqual(self.poll()['job'], 'failed')
+        self.fail_job(age=600)
+        self.assertEqual(self.poll()['job'], 'queued')
+        self.assertEqual(CacheJob.objects.get().priority, PRIORITY_VIEWER)
+
+    def test_poll_requeues_a_pruned_job(self):
+        self.assertEqual(self.poll()['job'], 'queued')
+
+    def test_complete_quote_queues_nothing(self):
+        CachedVerse.objects.create(verse_id='MAT.5.4', book=self.quote.book, chapter=5, verse_number=4,
+                                   text='Blessed are they that mourn', reference='Matthew 5:4')
+        renditions.refresh([self.quote.id])
+        data = self.poll()
+        self.assertTrue(data['complete'])
+        self.assertIsNone(data['job'])
+
+
+@override_settings(BIBLE_OFFLINE_CORPUS=False)
+class PartialSearchViewTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        CachedVerse.objects.create(verse_id='MAT.5.3', book=book, chapter=5, verse_number=3,
+                                   text='Blessed are the poor in spirit', reference='Matthew 5:3')
+        patcher = mock.patch.object(BibleAPIClient, '_search_window', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_search_page_flags_incomplete_results(self):
+        response = self.client.get(reverse('quotes:home'), {'q': 'blessed', 'mode': 'search'})
+        self.assertTrue(response.context['search_partial'])
+        self.assertContains(response, 'Results may be incomplete')
+        self.assertContains(response, 'Matthew 5:3')
+
+    def test_api_search_returns_the_flag(self):
+        data = self.client.get(reverse('quotes:api_quotes'), {'q': 'blessed'}).json()
+        self.assertTrue(data['partial'])
+        self.assertEqual([verse['id'] for verse in data['verses']], ['MAT.5.3'])
+
+    def test_upstream_results_are_not_partial(self):
+        upstream = {'verses': [{'id': 'MAT.5.3', 'reference': 'Matthew 5:3', 'text': 'Blessed'}], 'total': 1}
+        with mock.patch.object(BibleAPIClient, '_search_window', return_value=upstream):
+            response = self.client.get(reverse('quotes:home'), {'q': 'blessed', 'mode': 'search'})
+            data = self.client.get(reverse('quotes:api_quotes'), {'q': 'blessed'}).json()
+        self.assertNotContains(response, 'Results may be incomplete')
+        self.assertFalse(data['partial'])
+
+
+class QuoteAdminTests(TestCase):
+    def test_editing_ranges_refreshes_the_rendition(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        quote = Quote.objects.create(book=book, reference='5:3')
+        quote.set_verse_ids_list(['MAT.5.3'])
+        renditions.refresh([quote.id])
+        before = QuoteRendition.objects.get()
+        quote_range = quote.ranges.get()
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.org', 'password'))
+        response = self.client.post(reverse('admin:quotes_quote_change', args=[quote.id]), {
+            'book': book.id,
+            'reference': '5:3-4',
+            'ranges-TOTAL_FORMS': 1,
+            'ranges-INITIAL_FORMS': 1,
+            'ranges-0-id': quote_range.id,
+            'ranges-0-quote': quote.id,
+            'ranges-0-start_ordinal': quote_range.start_ordinal,
+            'ranges-0-end_ordinal': quote_range.end_ordinal + 1,
+        })
+        self.assertEqual(response.status_code, 302)
+
+        after = QuoteRendition.objects.get()
+        self.assertEqual((before.verse_count, after.verse_count), (1, 2))
+        self.assertEqual(after.missing_count, 2)
+        self.assertGreater(after.updated_at, before.updated_at)
+
+
+class QuoteIndexTests(TestCase):
+    VERSES = [
+        ('MAT', 'Matthew', 40, '5:3', 5, 3, 'Blessed are the poor in spirit'),
+        ('MAT', 'Matthew', 40, '5:4', 5, 4, 'Blessed are they that mourn'),
+        ('MAT', 'Matthew', 40, '6:9', 6, 9, 'Our Father which art in heaven'),
+        ('JHN', 'John', 43, '3:16', 3, 16, 'For God so loved the world'),
+    ]
+
+    def setUp(self):
+        self.quotes = {}
+        for api_id, name, order, reference, chapter, verse, text in self.VERSES:
+            book, _ = Book.objects.get_or_create(api_id=api_id, defaults={'name': name, 'canonical_order': order})
+            quote = Quote.objects.create(book=book, reference=reference)
+            quote.set_verse_ids_list([f"{api_id}.{chapter}.{verse}"])
+            CachedVerse.objects.create(verse_id=f"{api_id}.{chapter}.{verse}", book=book, chapter=chapter,
+                                       verse_number=verse, text=text, reference=f"{name} {reference}")
+            self.quotes[reference] = quote.id
+        renditions.rebuild()
+        quote_index.build()
+
+    def search(self, query, book=None):
+        ids = {quote_id: reference for reference, quote_id in self.quotes.items()}
+        return [ids[quote_id] for quote_id in quote_index.search(query, book=book)]
+
+    def test_words_are_anded_and_phrases_keep_their_order(self):
+        self.assertEqual(self.search('blessed'), ['5:3', '5:4'])
+        self.assertEqual(self.search('poor blessed'), ['5:3'])
+        self.assertEqual(self.search('"blessed are the poor"'), ['5:3'])
+        self.assertEqual(self.search('"poor blessed"'), [])
+        self.assertEqual(self.search('mourn OR heaven'), ['5:4', '6:9'])
+        self.assertEqual(self.search('blessed', book='John'), [])
+
+    def test_trailing_star_matches_a_prefix(self):
+        self.assertEqual(self.search('bless'), [])
+        self.assertEqual(self.search('bless*'), ['5:3', '5:4'])
+        self.assertEqual(self.search('lov* world'), ['3:16'])
+
+    def test_quotes_changed_reindexes_without_a_rebuild(self):
+        CachedVerse.objects.filter(verse_id='MAT.5.4').update(text='Blessed are the meek')
+        self.assertEqual(self.search('meek'), [])
+
+        with mock.patch.object(quote_index, 'build') as build:
+            renditions.refresh([self.quotes['5:4']])
+            self.assertEqual(self.search('meek'), ['5:4'])
+            self.assertEqual(self.search('mourn'), [])
+        build.assert_not_called()
+
+    def test_home_search_matches_the_old_icontains_filter(self):
+        for query in ('blessed', 'Matthew', '5:3', 'heaven', 'loved', 'nowhere'):
+            expected = list(Quote.objects.filter(
+                Q(rendition__text__icontains=query) | Q(book__name__icontains=query) | Q(reference__icontains=query)
+            ).distinct().order_by('book__canonical_order', 'reference', 'id').values_list('id', flat=True))
+            response = self.client.get(reverse('quotes:home'), {'q': query})
+            self.assertEqual([quote.id for quote in response.context['page_obj']], expected, query)
+            self.assertEqual(response.context['total_quotes'], len(expected))
+
+
+@override_settings(SEARCH_CACHE_TTL=100, SEARCH_CACHE_STALE_TTL=1000, SEARCH_CACHE_TOUCH_INTERVAL=10,
+                   SEARCH_CACHE_MAX_ROWS=100, SEARCH_CACHE_MAX_BYTES=10 ** 6)
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        self.started = self.now = timezone.now()
+        patcher = mock.patch.object(search_cache.timezone, 'now', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def at(self, seconds):
+        self.now = self.started + timezone.timedelta(seconds=seconds)
+
+    def store(self, key, results=None):
+        search_cache.store(key, results or {'verses': [], 'total': 0})
+
+    def test_fresh_then_stale_then_expired(self):
+        self.store('love:canonical:0', {'verses': [], 'total': 3})
+        for seconds, state in ((0, 'fresh'), (100, 'fresh'), (101, 'stale'), (1000, 'stale'), (1001, None)):
+            self.at(seconds)
+            results, found = search_cache.lookup('love:canonical:0')
+            self.assertEqual(found, state, seconds)
+            self.assertEqual(results, {'verses': [], 'total': 3} if state else None)
+        self.assertEqual(search_cache.lookup('love:canonical:0', allow_expired=True),
+                         ({'verses': [], 'total': 3}, 'expired'))
+
+    def test_reads_only_touch_the_lru_stamp_after_the_interval(self):
+        self.store('love:canonical:0')
+        self.at(5)
+        search_cache.lookup('love:canonical:0')
+        self.assertEqual(SearchCache.objects.get().last_accessed, self.started)
+        self.at(20)
+        search_cache.lookup('love:canonical:0')
+        self.assertEqual(SearchCache.objects.get().last_accessed, self.now)
+
+    def test_least_recently_used_rows_are_evicted_first(self):
+        with override_settings(SEARCH_CACHE_MAX_ROWS=2):
+            self.store('a:canonical:0')
+            self.at(1)
+            self.store('b:canonical:0')
+            self.at(20)
+            search_cache.lookup('a:canonical:0')
+            self.at(21)
+            self.store('c:canonical:0')
+        self.assertEqual(sorted(SearchCache.objects.values_list('query', flat=True)), ['a:canonical:0', 'c:canonical:0'])
+
+    def test_byte_cap_evicts_until_the_table_fits(self):
+        payload = {'verses': ['x' * 100], 'total': 1}
+        size = len(json.dumps(payload))
+        with override_settings(SEARCH_CACHE_MAX_BYTES=2 * size):
+            for i, key in enumerate(('a:canonical:0', 'b:canonical:0', 'c:canonical:0')):
+                self.at(i)
+                self.store(key, payload)
+        self.assertEqual(sorted(SearchCache.objects.values_list('query', flat=True)), ['b:canonical:0', 'c:canonical:0'])
+        self.assertEqual(search_cache.enforce_limits(), 0)
+
+    def test_long_window_keys_are_hashed_to_fit(self):
+        long_query = 'blessed ' * 40
+        key = search_cache.window_key(long_query, 'canonical', 0)
+        self.assertLessEqual(len(key), SearchCache._meta.get_field('query').max_length)
+        self.assertEqual(key, search_cache.window_key(long_query.upper() + '  ', 'canonical', 0))
+        self.assertNotEqual(key, search_cache.window_key(long_query + 'mourn', 'canonical', 0))
+        self.assertNotEqual(key, search_cache.window_key(long_query, 'canonical', 100))
+        self.assertEqual(search_cache.window_key('Love  One', 'relevance', 0), 'love one:relevance:0')
+
+        self.store(key, {'verses': [], 'total': 1})
+        self.assertEqual(search_cache.lookup(key)[1], 'fresh')
+
+    def test_background_refresh_runs_once_per_key(self):
+        release = threading.Event()
+        fetched = []
+
+        def fetch():
+            fetched.append(True)
+            release.wait(5)
+            return None
+
+        self.assertTrue(search_cache.refresh_in_background('love:canonical:0', fetch))
+        self.assertFalse(search_cache.refresh_in_background('love:canonical:0', fetch))
+        release.set()
+        for _ in range(50):
+            if 'love:canonical:0' not in search_cache._refreshing:
+                break
+            time.sleep(0.02)
+        self.assertEqual(fetched, [True])
+        self.assertNotIn('love:canonical:0', search_cache._refreshing)
+
+
+class SingleFlightTests(SimpleTestCase):
+    callers = 8
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return fn
+
+    def run_callers(self, fn, timeout=None):
+        """Start the callers, release the leader once the rest are waiting; returns each caller's outcome"""
+        outcomes = [None] * self.callers
+
+        def call(i):
+            try:
+                outcomes[i] = ('result', self.flights.do('chapter:MAT.5', fn, timeout=timeout))
+            except Exception as e:
+                outcomes[i] = ('error', e)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(self.callers)]
+        for thread in threads:
+            thread.start()
+        for _ in range(250):
+            if self.flights.stats().get('chapter', {}).get('collapsed') == self.callers - 1:
+                break
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        result = {'verses': ['MAT.5.3']}
+        outcomes = self.run_callers(self.slow(result))
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(outcome == ('result', result) for outcome in outcomes))
+        self.assertTrue(all(outcome[1] is result for outcome in outcomes))
+        self.assertEqual(self.flights.stats(), {'chapter': {'calls': 1, 'collapsed': self.callers - 1}})
+
+    def test_exception_reaches_every_waiter(self):
+        error = requests.ConnectionError('upstream down')
+        outcomes = self.run_callers(self.slow(error=error))
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(outcome == ('error', error) for outcome in outcomes))
+
+    def test_waiter_gives_up_after_timeout(self):
+        leader = threading.Thread(target=self.flights.do, args=('chapter:MAT.5', self.slow('late')))
+        leader.start()
+        try:
+            while not self.calls:
+                time.sleep(0.01)
+            started = time.monotonic()
+            with self.assertRaises(BudgetExhausted):
+                self.flights.do('chapter:MAT.5', self.slow('other'), timeout=0.2)
+            self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        finally:
+            self.release.set()
+            leader.join(5)
+        self.assertEqual(self.calls, 1)
+
+    def test_next_call_after_completion_runs_again(self):
+        self.release.set()
+        self.assertEqual(self.flights.do('chapter:MAT.5', self.slow(1)), 1)
+        self.assertEqual(self.flights.do('chapter:MAT.5', self.slow(2)), 2)
+        self.assertEqual(self.calls, 2)
+
+
+class ApiQuotesStreamTests(TestCase):
+    total = 450  # more than two iter_pages batches of 200
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        Quote.objects.bulk_create([Quote(book=book, reference=f"{i // 50 + 1}:{i % 50 + 1}") for i in range(cls.total)])
+        renditions.rebuild()
+        cls.listing = list(Quote.objects.order_by('book__canonical_order', 'reference', 'id').values_list('id', flat=True))
+
+    def get(self, **params):
+        response = self.client.get(reverse('quotes:api_quotes'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_json_stream_is_one_valid_document(self):
+        data = json.loads(self.get(fields='id'))
+        self.assertEqual([quote['id'] for quote in data['quotes']], self.listing)
+        self.assertIsNone(data['next'])
+
+    def test_limit_and_after_page_across_batches(self):
+        first = json.loads(self.get(fields='id', limit=250))
+        self.assertEqual(len(first['quotes']), 250)
+        second = json.loads(self.get(fields='id', limit=250, after=first['next']))
+        self.assertIsNone(second['next'])
+        self.assertEqual([quote['id'] for quote in first['quotes'] + second['quotes']], self.listing)
+
+    def test_ndjson_lines_carry_resumable_cursors(self):
+        lines = self.get(fields='id,reference', format='ndjson').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], self.listing)
+        self.assertEqual(set(rows[0]), {'id', 'reference', 'cursor'})
+
+        resumed = [json.loads(line) for line in self.get(fields='id', format='ndjson', after=rows[299]['cursor'],
+                                                         limit=10).splitlines()]
+        self.assertEqual([row['id'] for row in resumed], self.listing[300:310])
+
+    def test_field_selection(self):
+        quote = json.loads(self.get(fields='reference,verse_count', limit=1))['quotes'][0]
+        self.assertEqual(quote, {'reference': '1:1', 'verse_count': 0})
+        quote = json.loads(self.get(fields='reference', verses=1, limit=1))['quotes'][0]
+        self.assertEqual(quote, {'reference': '1:1', 'verses': []})
+
+        response = self.client.get(reverse('quotes:api_quotes'), {'fields': 'reference,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('quotes:api_quotes'), {'limit': '0'}).status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        matthew = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        john = Book.objects.create(api_id='JHN', name='John', canonical_order=43)
+        for book, references in ((john, ['3:16', '14:6', '15:12']), (matthew, ['5:3', '5:4', '5:5', '6:9', '7:7'])):
+            for reference in references:
+                Quote.objects.create(book=book, reference=reference)
+        self.listing = list(Quote.objects.order_by('book__canonical_order', 'reference', 'id').values_list('id', flat=True))
+        quote_index.build()
+
+    def walk(self, paginate):
+        """Pages forward with next cursors, then back with previous cursors"""
+        forward = [paginate()]
+        while forward[-1].has_next:
+            forward.append(paginate(after=pagination.decode_cursor(forward[-1].next_cursor)))
+        backward = [forward[-1]]
+        while backward[-1].has_previous:
+            backward.append(paginate(before=pagination.decode_cursor(backward[-1].previous_cursor)))
+        return forward, backward[::-1]
+
+    def ids(self, pages):
+        return [[quote if isinstance(quote, int) else quote.id for quote in page] for page in pages]
+
+    def test_quotes_walk_forward_and_back_to_the_same_pages(self):
+        quotes = Quote.objects.select_related('book')
+        forward, backward = self.walk(lambda **cursor: pagination.paginate_quotes(quotes, per_page=3, **cursor))
+        self.assertEqual(self.ids(forward), [self.listing[0:3], self.listing[3:6], self.listing[6:8]])
+        self.assertEqual(self.ids(backward), self.ids(forward))
+
+    def test_ids_walk_forward_and_back_to_the_same_pages(self):
+        loaded = Quote.objects.select_related('book').in_bulk(self.listing)
+
+        def paginate(**cursor):
+            page = pagination.paginate_ids(self.listing, quote_index.position, per_page=3, **cursor)
+            page.object_list = [loaded[quote_id] for quote_id in page.object_list]
+            return page
+
+        forward, backward = self.walk(paginate)
+        self.assertEqual(self.ids(forward), [self.listing[0:3], self.listing[3:6], self.listing[6:8]])
+        self.assertEqual(self.ids(backward), self.ids(forward))
+
+    def test_malformed_cursor_falls_back_to_the_first_page(self):
+        for token in ('garbage', 'W10', pagination.encode_cursor(['40', '5:3', 1]), '%%%'):
+            self.assertIsNone(pagination.decode_cursor(token))
+        response = self.client.get(reverse('quotes:home'), {'after': 'garbage'})
+        self.assertEqual([quote.id for quote in response.context['page_obj']], self.listing)
+
+    def test_cursor_of_a_deleted_quote_resumes_after_its_key(self):
+        quote = Quote.objects.select_related('book').get(id=self.listing[3])
+        cursor = pagination.quote_key(quote)
+        quote.delete()
+        quote_index.build()
+        remaining = self.listing[:3] + self.listing[4:]
+
+        page = pagination.paginate_ids(remaining, quote_index.position, after=cursor, per_page=3)
+        self.assertEqual(page.object_list, self.listing[4:7])
+        page = pagination.paginate_ids(remaining, quote_index.position, before=cursor, per_page=3)
+        self.assertEqual(page.object_list, self.listing[0:3])
+
+        # Past the end of the listing
+        last = Quote.objects.select_related('book').get(id=self.listing[-1])
+        cursor = pagination.quote_key(last)
+        last.delete()
+        quote_index.build()
+        self.assertEqual(pagination.paginate_ids(remaining[:-1], quote_index.position, after=cursor).object_list, [])
+
+
+class WarmCheckpointTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        for reference, verse_ids in (('5:3-4', ['MAT.5.3', 'MAT.5.4']), ('6:9', ['MAT.6.9']), ('7:7', ['MAT.7.7'])):
+            Quote.objects.create(book=book, reference=reference).set_verse_ids_list(verse_ids)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'warm.checkpoint.json')
+        self.executed = []
+
+    def warm(self, interrupt_at=None):
+        def execute(client, call):
+            if call.chapter == interrupt_at:
+                raise KeyboardInterrupt
+            self.executed.append((call.api_id, call.chapter))
+            return True
+
+        out = io.StringIO()
+        with mock.patch('quotes.warmer.planner.execute', side_effect=execute):
+            call_command('cache_all_quotes', checkpoint=self.path, concurrency=1, stdout=out)
+        return out.getvalue()
+
+    def test_interrupted_warm_resumes_and_skips_finished_chapters(self):
+        self.assertIn('Interrupted', self.warm(interrupt_at=7))
+        self.assertEqual(warmer.Checkpoint(self.path).load().done, {('MAT', 5), ('MAT', 6)})
+
+        # Nothing was cached (execute is mocked): only the checkpoint keeps 5 and 6 from being fetched again
+        self.executed = []
+        output = self.warm()
+        self.assertIn('Resuming: 2 chapters already fetched', output)
+        self.assertEqual(self.executed, [('MAT', 7)])
+        self.assertFalse(os.path.exists(self.path))
+
+
+class PlannerTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        for reference, verse_ids in (('5:3-4', ['MAT.5.3', 'MAT.5.4']), ('5:4-5', ['MAT.5.4', 'MAT.5.5']),
+                                     ('6:9-10', ['MAT.6.9', 'MAT.6.10']), ('7:7', ['MAT.7.7'])):
+            Quote.objects.create(book=self.book, reference=reference).set_verse_ids_list(verse_ids)
+        self.host = urlsplit(BibleAPIClient().simple_bible_base_url).netloc
+
+    def cache(self, *verse_ids):
+        for verse_id in verse_ids:
+            _, chapter, verse = versification.parse_verse_id(verse_id)
+            CachedVerse.objects.create(verse_id=verse_id, book=self.book, chapter=chapter, verse_number=verse,
+                                       text='text', reference=f"Matthew {chapter}:{verse}")
+
+    def test_quotes_sharing_a_chapter_make_one_call(self):
+        fetch_plan = planner.plan()
+        self.assertEqual([(call.kind, call.chapter, call.verse_ids) for call in fetch_plan.calls], [
+            ('chapter', 5, ('MAT.5.3', 'MAT.5.4', 'MAT.5.5')),
+            ('chapter', 6, ('MAT.6.9', 'MAT.6.10')),
+            ('chapter', 7, ('MAT.7.7',)),
+        ])
+        self.assertEqual((fetch_plan.quote_count, len(fetch_plan.wanted), len(fetch_plan.missing)), (4, 6, 6))
+
+    def test_cached_chapters_are_left_out(self):
+        self.cache('MAT.6.9', 'MAT.6.10', 'MAT.5.4')
+        fetch_plan = planner.plan()
+        self.assertEqual([(call.chapter, call.verse_ids) for call in fetch_plan.calls],
+                         [(5, ('MAT.5.3', 'MAT.5.5')), (7, ('MAT.7.7',))])
+        self.assertEqual(fetch_plan.without([('MAT', 5)]).chapters, [('MAT', 7)])
+
+    def test_verse_mode_fetches_lone_missing_verses_on_their_own(self):
+        kinds = [(call.kind, call.chapter) for call in planner.plan(fetch_mode='verse').calls]
+        self.assertEqual(kinds, [('chapter', 5), ('chapter', 6), ('verse', 7)])
+
+    def test_estimate_follows_the_configured_rate_and_burst(self):
+        calls = [planner.Fetch('chapter', 'MAT', chapter, ()) for chapter in range(1, 13)]
+        fetch_plan = planner.Plan(0, set(), set(), calls)
+        with override_settings(BIBLE_RATE_LIMITS={self.host: (2, 5)}):
+            self.assertEqual(fetch_plan.estimate(), (3.5, self.host, 2, 5))
+            self.assertEqual(planner.Plan(0, set(), set(), calls[:5]).estimate()[0], 0)
+        with override_settings(BIBLE_RATE_LIMITS={}):
+            self.assertEqual(fetch_plan.estimate(), (None, self.host, None, None))
+
+    def test_dry_run_reports_the_plan_without_fetching(self):
+        out = io.StringIO()
+        with override_settings(BIBLE_RATE_LIMITS={self.host: (1, 1)}), \
+                mock.patch('quotes.warmer.planner.execute') as execute:
+            call_command('cache_all_quotes', dry_run=True, restart=True, stdout=out)
+        execute.assert_not_called()
+        output = out.getvalue()
+        self.assertIn('4 quotes cover 6 verses: 0 cached, 6 missing', output)
+        self.assertIn('Upstream calls: 3 (3 chapter, 0 verse)', output)
+        self.assertIn('Matthew: 3 calls, 6 missing verses', output)
+        self.assertIn(f"Estimated time at 1 requests/s to {self.host} (burst 1): 2.0s", output)
+
+
+class RenditionTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        self.quotes = {}
+        for reference, verse_ids in (('5:3-4', ['MAT.5.3', 'MAT.5.4']), ('5:4-5', ['MAT.5.4', 'MAT.5.5']),
+                                     ('6:9', ['MAT.6.9'])):
+            quote = Quote.objects.create(book=self.book, reference=reference)
+            quote.set_verse_ids_list(verse_ids)
+            self.quotes[reference] = quote.id
+        renditions.rebuild()
+        self.before = self.state()
+
+    def state(self):
+        return {
+            reference: QuoteRendition.objects.values_list('missing_count', 'preview', 'updated_at').get(quote_id=quote_id)
+            for reference, quote_id in self.quotes.items()
+        }
+
+    def verse(self, number, text):
+        return CachedVerse(verse_id=f"MAT.5.{number}", book=self.book, chapter=5, verse_number=number,
+                           text=text, reference=f"Matthew 5:{number}", ordinal=versification.pack('MAT', 5, number))
+
+    def assert_refreshed(self, refreshed):
+        after = self.state()
+        for reference in self.quotes:
+            if reference in refreshed:
+                self.assertGreater(after[reference][2], self.before[reference][2], reference)
+            else:
+                self.assertEqual(after[reference], self.before[reference], reference)
+        return after
+
+    def test_rebuild_counts_the_missing_verses(self):
+        self.assertEqual({reference: state[:2] for reference, state in self.before.items()},
+                         {'5:3-4': (2, '[]'), '5:4-5': (2, '[]'), '6:9': (1, '[]')})
+
+    def test_caching_a_verse_refreshes_exactly_the_quotes_covering_it(self):
+        self.verse(4, 'Blessed are they that mourn').save()
+        after = self.assert_refreshed({'5:3-4', '5:4-5'})
+        self.assertEqual(after['5:3-4'][0], 1)
+        self.assertEqual(json.loads(after['5:4-5'][1]), [{'verse_number': 4, 'text': 'Blessed are they that mourn'}])
+
+    def test_bulk_cached_verses_refresh_through_refresh_covering(self):
+        verses = CachedVerse.objects.bulk_create([self.verse(3, 'Blessed are the poor'), self.verse(5, 'Blessed are the meek')])
+        self.assertEqual(self.state(), self.before)  # bulk_create sends no signals
+
+        quote_ids = renditions.refresh_covering([verse.ordinal for verse in verses])
+        self.assertEqual(quote_ids, {self.quotes['5:3-4'], self.quotes['5:4-5']})
+        after = self.assert_refreshed({'5:3-4', '5:4-5'})
+        self.assertEqual([row[0] for row in (after['5:3-4'], after['5:4-5'])], [1, 1])
+        rendition = QuoteRendition.objects.get(quote_id=self.quotes['5:3-4'])
+        self.assertEqual((rendition.text, rendition.verse_count, rendition.cached_count),
+                         ('Blessed are the poor', 2, 1))
+
+    def test_refresh_sends_quotes_changed(self):
+        with mock.patch('quotes.receivers.quote_index.refresh_quotes') as reindex:
+            renditions.refresh([self.quotes['6:9']])
+        reindex.assert_called_once_with([self.quotes['6:9']])
+
+
+@override_settings(BIBLE_HTTP_MAX_RETRIES=3, BIBLE_HTTP_BACKOFF_BASE=0.5, BIBLE_HTTP_BACKOFF_MAX=8,
+                   BIBLE_RATE_LIMITS={}, BIBLE_BREAKER_MIN_CALLS=100)
+class TransportRetryTests(SimpleTestCase):
+    url = 'https://upstream.test/bible.json'
+
+    def setUp(self):
+        self.transport = BibleTransport()
+        self.session = mock.Mock()
+        self.transport.session_for = mock.Mock(return_value=self.session)
+        for target, value in (('quotes.http.breakers', BreakerRegistry()),
+                              ('quotes.http.random.uniform', lambda low, high: high)):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('quotes.http.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, status, retry_after=None):
+        return mock.Mock(status_code=status, headers={'Retry-After': retry_after} if retry_after else {})
+
+    def slept(self):
+        return [call.args[0] for call in self.sleep.call_args_list]
+
+    def test_429_waits_for_retry_after(self):
+        ok = self.response(200)
+        self.session.get.side_effect = [self.response(429, '2'), ok]
+        self.assertIs(self.transport.get(self.url), ok)
+        self.assertEqual(self.slept(), [2.0])
+
+    def test_retry_after_date_is_capped(self):
+        later = http_date(time.time() + 60)
+        self.session.get.side_effect = [self.response(503, later), self.response(200)]
+        self.transport.get(self.url)
+        self.assertEqual(self.slept(), [8])
+
+    def test_connection_errors_retry_with_exponential_backoff(self):
+        ok = self.response(200)
+        self.session.get.side_effect = [requests.ConnectionError('reset'), requests.Timeout('slow'), self.response(502), ok]
+        self.assertIs(self.transport.get(self.url), ok)
+        self.assertEqual(self.slept(), [0.5, 1.0, 2.0])
+
+    def test_gives_up_after_max_retries(self):
+        self.session.get.side_effect = requests.ConnectionError('down')
+        with self.assertRaises(requests.ConnectionError):
+            self.transport.get(self.url)
+        self.assertEqual(self.session.get.call_count, 4)
+
+        self.session.get.side_effect = None
+        self.session.get.reset_mock()
+        self.session.get.return_value = self.response(503)
+        self.assertEqual(self.transport.get(self.url).status_code, 503)
+        self.assertEqual(self.session.get.call_count, 4)
+
+    def test_backoff_that_would_overrun_the_budget_gives_up(self):
+        self.session.get.return_value = self.response(429, '5')
+        with latency_budget(1.0):
+            with self.assertRaisesMessage(BudgetExhausted, 'no budget left to retry'):
+                self.transport.get(self.url)
+        self.assertEqual(self.session.get.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_attempts_are_clamped_to_the_budget(self):
+        self.session.get.return_value = self.response(200)
+        with latency_budget(1.0):
+            self.transport.get(self.url)
+        connect, read = self.session.get.call_args.kwargs['timeout']
+        self.assertLessEqual(max(connect, read), 1.0)
+
+        with latency_budget(0):
+            with self.assertRaises(BudgetExhausted):
+                self.transport.get(self.url)
+        self.assertEqual(self.session.get.call_count, 1)
+
+
+class ImportCorpusTests(TestCase):
+    rows = [
+        ('Matthew', 5, 3, 'Blessed are the poor in spirit'),
+        ('MAT', 5, 4, 'Blessed are they that mourn'),
+        ('Matthew', 5, 4, 'A duplicate of 5:4'),
+        ('Genesis', 1, 1, 'In the beginning'),
+        ('Nowhere', 1, 1, 'Not a book'),
+        ('Matthew', 5, 5, '   '),
+    ]
+
+    def setUp(self):
+        self.matthew = Book.objects.create(api_id='MAT', name='Matthew', canonical_order=40)
+        self.quote = Quote.objects.create(book=self.matthew, reference='5:3-4')
+        self.quote.set_verse_ids_list(['MAT.5.3', 'MAT.5.4'])
+        renditions.refresh([self.quote.id])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def objects(self):
+        return [{'book': book, 'chapter': chapter, 'verse': verse, 'text': text} for book, chapter, verse, text in self.rows]
+
+    def load(self, path, **options):
+        out = io.StringIO()
+        call_command('import_corpus', path, stdout=out, **options)
+        self.assertEqual(
+            list(CachedVerse.objects.order_by('ordinal').values_list('verse_id', 'text', 'reference', 'ordinal')), [
+                ('MAT.5.3', 'Blessed are the poor in spirit', 'Matthew 5:3', versification.pack('MAT', 5, 3)),
+                ('MAT.5.4', 'Blessed are they that mourn', 'Matthew 5:4', versification.pack('MAT', 5, 4)),
+            ])
+        return out.getvalue()
+
+    def test_json(self):
+        output = self.load(self.write('kjv.json', json.dumps(self.objects(), indent=1)))
+        # Genesis has no quotes, Nowhere is not a book, 5:5 is blank; the duplicate 5:4 is dropped
+        self.assertIn('Skipped 3 rows', output)
+        self.assertIn('Imported 2 verses', output)
+
+    def test_json_array_is_decoded_across_read_chunks(self):
+        path = self.write('kjv.json', json.dumps(self.objects()))
+        rows = list(ImportCorpusCommand().read_json(path, chunk_size=16))
+        self.assertEqual(rows, [tuple(row) for row in self.rows])
+
+    def test_jsonl(self):
+        self.load(self.write('kjv.jsonl', '\n'.join(json.dumps(row) for row in self.objects()) + '\n\n'))
+
+    def test_csv_and_tsv(self):
+        lines = ['Book,Chapter,Verse,Text'] + [f'{book},{chapter},{verse},"{text}"' for book, chapter, verse, text in self.rows]
+        self.load(self.write('kjv.csv', '\n'.join(lines)))
+        CachedVerse.objects.all().delete()
+        lines = ['book_name\tchapter\tverse_number\ttext'] + ['\t'.join(map(str, row)) for row in self.rows]
+        self.load(self.write('kjv.tsv', '\n'.join(lines)))
+
+    def test_osis_containers_and_milestones(self):
+        self.load(self.write('kjv.xml', (
+            '<osis xmlns="http://www.bibletechnologies.net/2003/OSIS/namespace"><div type="book" osisID="Matt">'
+            '<chapter osisID="Matt.5"><verse osisID="Matt.5.3">Blessed are the poor <note>footnote</note>in spirit</verse>'
+            '<p><verse sID="v4" osisID="Matt.5.4"/>Blessed are <w>they</w> that mourn<note>n</note><verse eID="v4"/></p>'
+            '</chapter></div></osis>'
+        )), format='osis')
+
+    def test_import_refreshes_the_quote_renditions(self):
+        self.assertEqual(QuoteRendition.objects.get().missing_count, 2)
+        self.load(self.write('kjv.jsonl', '\n'.join(json.dumps(row) for row in self.objects())))
+        rendition = QuoteRendition.objects.get()
+        self.assertEqual((rendition.cached_count, rendition.missing_count), (2, 0))
+        self.assertEqual(rendition.text, 'Blessed are the poor in spirit Blessed are they that mourn')
+
+    def test_unreadable_or_empty_corpus_is_an_error(self):
+        with self.assertRaisesMessage(CommandError, 'Could not read'):
+            call_command('import_corpus', self.write('kjv.json', '{"not": "an array"}'), stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'No verses for MAT'):
+            call_command('import_corpus', self.write('kjv.jsonl', json.dumps(self.objects()[3])), stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'Cannot guess the format'):
+            call_command('import_corpus', self.write('kjv.txt', ''), stdout=io.StringIO())
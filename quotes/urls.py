@@ -6,6 +6,8 @@ app_name = 'quotes'
 urlpatterns = [
     path('', views.home, name='home'),
     path('quote/<int:quote_id>/', views.quote_detail, name='detail'),
+    path('quote/<int:quote_id>/verses/', views.quote_verses, name='quote_verses'),
     path('api/quotes/', views.api_quotes, name='api_quotes'),
+    path('api/resolve/', views.api_resolve, name='api_resolve'),
     path('api/cache-verses/', views.cache_verses_view, name='cache_verses'),
 ]
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""KJV versification for the books our quotes come from.
+
+Every verse maps to a packed integer ordinal:
+
+    book_number * 1_000_000 + chapter * 1_000 + verse
+
+where book_number is the book's position in the 66-book Protestant canon
+(Matthew = 40). Ordinals sort in canonical order, so "all verses of
+Matthew 5" is a single indexed BETWEEN on CachedVerse.ordinal.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+BOOK_FACTOR = 1_000_000
+CHAPTER_FACTOR = 1_000
+
+BookInfo = namedtuple('BookInfo', [
+    'api_id',  # API.Bible id, e.g. "1CO"
+    'number',  # position in the 66-book canon
+    'order',  # position among our books (Book.canonical_order)
+    'name',  # display name, e.g. "1 Corinthians"
+    'slug',  # CDN book slug, e.g. "1-corinthians"
+    'osis',  # OSIS id, e.g. "1Cor"
+    'quotes_key',  # key in quotes_data.QUOTES, e.g. "1_corinthians"
+    'verse_counts',  # verses per chapter, index 0 = chapter 1
+])
+
+BOOKS = [
+    BookInfo('MAT', 40, 1, 'Matthew', 'matthew', 'Matt', 'matthew', (
+        25, 23, 17, 25, 48, 34, 29, 34, 38, 42, 30, 50, 58, 36, 39, 28, 27, 35, 30, 34,
+        46, 46, 39, 51, 46, 75, 66, 20)),
+    BookInfo('MRK', 41, 2, 'Mark', 'mark', 'Mark', 'mark', (
+        45, 28, 35, 41, 43, 56, 37, 38, 50, 52, 33, 44, 37, 72, 47, 20)),
+    BookInfo('LUK', 42, 3, 'Luke', 'luke', 'Luke', 'luke', (
+        80, 52, 38, 44, 39, 49, 50, 56, 62, 42, 54, 59, 35, 35, 32, 31, 37, 43, 48, 47,
+        38, 71, 56, 53)),
+    BookInfo('JHN', 43, 4, 'John', 'john', 'John', 'john', (
+        51, 25, 36, 54, 47, 71, 53, 59, 41, 42, 57, 50, 38, 31, 27, 33, 26, 40, 42, 31,
+        25)),
+    BookInfo('ACT', 44, 5, 'Acts', 'acts', 'Acts', 'acts', (
+        26, 47, 26, 37, 42, 15, 60, 40, 43, 48, 30, 25, 52, 28, 41, 40, 34, 28, 41, 38,
+        40, 30, 35, 27, 27, 32, 44, 31)),
+    BookInfo('1CO', 46, 6, '1 Corinthians', '1-corinthians', '1Cor', '1_corinthians', (
+        31, 16, 23, 21, 13, 20, 40, 13, 27, 33, 34, 31, 13, 40, 58, 24)),
+    BookInfo('2CO', 47, 7, '2 Corinthians', '2-corinthians', '2Cor', '2_corinthians', (
+        24, 17, 18, 18, 21, 18, 16, 24, 15, 18, 33, 21, 14)),
+    BookInfo('REV', 66, 8, 'Revelation', 'revelation', 'Rev', 'revelation', (
+        20, 29, 22, 11, 14, 17, 17, 13, 21, 11, 19, 17, 18, 20, 8, 21, 18, 24, 21, 15,
+        27, 21)),
+]
+
+BY_API_ID = {book.api_id: book for book in BOOKS}
+BY_NUMBER = {book.number: book for book in BOOKS}
+BY_SLUG = {book.slug: book for book in BOOKS}
+BY_QUOTES_KEY = {book.quotes_key: book for book in BOOKS}
+
+
+def normalize_name(value):
+    """Lower-case a book name/id and strip spaces, dashes, underscores and dots"""
+    return re.sub(r'[\s\-_.]', '', str(value)).lower()
+
+
+# Every spelling we accept: API.Bible id, OSIS id, slug, display name, QUOTES key
+BY_ALIAS = {}
+for _book in BOOKS:
+    for _alias in (_book.api_id, _book.osis, _book.slug, _book.name, _book.quotes_key):
+        BY_ALIAS[normalize_name(_alias)] = _book
+
+
+def find_book(value):
+    """BookInfo for any accepted spelling of a book, or None"""
+    if value is None:
+        return None
+    return BY_API_ID.get(value) or BY_ALIAS.get(normalize_name(value))
+
+
+def chapter_count(api_id):
+    return len(BY_API_ID[api_id].verse_counts)
+
+
+def verse_count(api_id, chapter):
+    """Number of verses in a chapter (0 for chapters the book does not have)"""
+    counts = BY_API_ID[api_id].verse_counts
+    return counts[chapter - 1] if 1 <= chapter <= len(counts) else 0
+
+
+def exists(api_id, chapter, verse):
+    """True when the verse is part of the KJV text of a registered book"""
+    return api_id in BY_API_ID and 1 <= verse <= verse_count(api_id, chapter)
+
+
+def pack(api_id, chapter, verse):
+    """Ordinal for a verse"""
+    return BY_API_ID[api_id].number * BOOK_FACTOR + chapter * CHAPTER_FACTOR + verse
+
+
+def unpack(ordinal):
+    """(api_id, chapter, verse) for an ordinal"""
+    number, rest = divmod(ordinal, BOOK_FACTOR)
+    chapter, verse = divmod(rest, CHAPTER_FACTOR)
+    return BY_NUMBER[number].api_id, chapter, verse
+
+
+def parse_verse_id(verse_id):
+    """Split an API.Bible verse id ('MAT.5.3') into (api_id, chapter, verse), or None"""
+    parts = (verse_id or '').split('.')
+    if len(parts) < 3:
+        return None
+    try:
+        return parts[0], int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def verse_id(api_id, chapter, verse):
+    return f"{api_id}.{chapter}.{verse}"
+
+
+def ordinal_for_verse_id(value):
+    """Ordinal for an API.Bible verse id, or None for ids outside the registry"""
+    parsed = parse_verse_id(value)
+    if parsed is None or parsed[0] not in BY_API_ID:
+        return None
+    return pack(*parsed)
+
+
+def verse_id_for_ordinal(ordinal):
+    return verse_id(*unpack(ordinal))
+
+
+def chapter_range(api_id, chapter):
+    """(first, last) ordinals bounding a chapter, for ordinal__range lookups"""
+    base = pack(api_id, chapter, 0)
+    return base, base + CHAPTER_FACTOR - 1
+
+
+def book_range(api_id):
+    """(first, last) ordinals bounding a whole book"""
+    base = BY_API_ID[api_id].number * BOOK_FACTOR
+    return base, base + BOOK_FACTOR - 1
+
+
+def reference(api_id, chapter, verse):
+    """Display reference, e.g. 'Matthew 5:3'"""
+    return f"{BY_API_ID[api_id].name} {chapter}:{verse}"
+
+
+def compact(ordinals):
+    """Collapse ordinals into sorted (start, end) runs of consecutive verses"""
+    runs = []
+    for ordinal in sorted(set(ordinals)):
+        if runs and ordinal == runs[-1][1] + 1:
+            runs[-1][1] = ordinal
+        else:
+            runs.append([ordinal, ordinal])
+    return [tuple(run) for run in runs]
+
+
+# ---------- Reference parsing ----------
+
+# "Matthew 5:3-12", "1 Cor 13:4", "John 3" -> book part and location part
+REFERENCE_RE = re.compile(r'^(?P<book>(?:[1-3]\s*)?[A-Za-z][A-Za-z\s.]*?)?\s*(?P<location>\d[\d\s:,\-]*)$')
+
+
+def parse_reference(text, book=None, strict=True):
+    """Ordinal ranges for a reference such as "Matthew 5:3-12, 14; John 3:16".
+
+    Passages are separated by ";", items within a passage by ",". Items
+    are a verse ("5:3", or "14" after a chapter:verse), a verse range
+    ("3-12"), a cross-chapter range ("5:3-7:29") or whole chapters ("5",
+    "5-7") when no verse was given yet. `book` (any spelling accepted by
+    find_book) applies to passages without their own book name. API.Bible
+    verse ids ("MAT.5.3") are accepted as passages too. Returns a tuple of
+    (start, end) ordinal pairs, one or more per passage, in the order
+    given; raises ValueError for anything it cannot resolve. With
+    strict=False verses past the end of a KJV chapter are kept (some
+    quote references in quotes_data overshoot by a verse or two).
+    """
+    return _parse_reference(' '.join(str(text).replace('\u2013', '-').split()), book, strict)
+
+
+@lru_cache(maxsize=4096)
+def _parse_reference(text, book, strict):
+    ranges = []
+    for passage in text.split(';'):
+        passage = passage.strip()
+        if not passage:
+            continue
+
+        parsed = parse_verse_id(passage)
+        if parsed is not None and parsed[0] in BY_API_ID:
+            ranges.extend(_span(*parsed, parsed[1], parsed[2], strict))
+            continue
+
+        match = REFERENCE_RE.match(passage)
+        if match is None:
+            raise ValueError(f"Cannot parse reference '{passage}'")
+        book_name = (match.group('book') or '').strip() or book
+        info = find_book(book_name)
+        if info is None:
+            raise ValueError(f"Unknown book in '{passage}'")
+        ranges.extend(_parse_location(info.api_id, match.group('location'), strict))
+
+    if not ranges:
+        raise ValueError(f"Empty reference '{text}'")
+    return tuple(ranges)
+
+
+def _parse_location(api_id, location, strict):
+    """Ordinal ranges for the "5:3-12, 14" part of a reference"""
+    ranges = []
+    chapter = None  # set once an item names a chapter:verse
+    for item in location.replace(' ', '').split(','):
+        if not item:
+            continue
+        start, _, end = item.partition('-')
+        if ':' in start:
+            chapter, first = (int(n) for n in start.split(':', 1))
+        elif chapter is not None:
+            first = int(start)
+        else:
+            # Whole chapters ("5" or "5-7")
+            last_chapter = int(end) if end else int(start)
+            for whole in range(int(start), last_chapter + 1):
+                ranges.extend(_span(api_id, whole, 1, whole, verse_count(api_id, whole), strict))
+            continue
+
+        if not end:
+            ranges.extend(_span(api_id, chapter, first, chapter, first, strict))
+        elif ':' in end:
+            end_chapter, last = (int(n) for n in end.split(':', 1))
+            ranges.extend(_span(api_id, chapter, first, end_chapter, last, strict))
+            chapter = end_chapter
+        else:
+            ranges.extend(_span(api_id, chapter, first, chapter, int(end), strict))
+    return ranges
+
+
+def _span(api_id, chapter, verse, end_chapter, end_verse, strict=True):
+    """Per-chapter ordinal ranges from chapter:verse to end_chapter:end_verse inclusive"""
+    if (end_chapter, end_verse) < (chapter, verse):
+        raise ValueError(f"Backwards range in {api_id} {chapter}:{verse}-{end_chapter}:{end_verse}")
+    for c, v in ((chapter, verse), (end_chapter, end_verse)):
+        if not verse_count(api_id, c) or v < 1 or (strict and not exists(api_id, c, v)):
+            raise ValueError(f"{reference(api_id, c, v)} is not in the KJV")
+
+    ranges = []
+    for c in range(chapter, end_chapter + 1):
+        first = verse if c == chapter else 1
+        last = end_verse if c == end_chapter else verse_count(api_id, c)
+        ranges.append((pack(api_id, c, first), pack(api_id, c, last)))
+    return ranges
+
+
+def parse_reference_ids(text, book=None, strict=True):
+    """Verse ids for a reference, in order (see parse_reference)"""
+    return [
+        verse_id_for_ordinal(ordinal)
+        for start, end in parse_reference(text, book, strict)
+        for ordinal in range(start, end + 1)
+    ]
@@ -1,32 +1,22 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
-from django.core.paginator import Paginator
-from django.db.models import Q, Prefetch
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib import messages
-from django.core.cache import cache
-from .models import Book, Quote, CachedVerse, SearchCache
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.views.decorators.cache import never_cache
+from django.conf import settings
+from .models import Quote, QuoteRendition, SearchCache, attach_verses
 from .bible_api import BibleAPIClient
-from .tasks import verse_cache
-import random
-import time
-
-def get_chapter_verse_from_quote(quote):
-    """Parse chapter:verse format into chapter and list of verses"""
-    parts = quote.split(":")
-    chapter = parts[0]
-    verse_parts = parts[1].split(",")
-    
-    verses = []
-    for verse_part in verse_parts:
-        verse_part = verse_part.strip()
-        if "-" in verse_part:
-            start, end = verse_part.split("-")
-            verses.extend(range(int(start), int(end) + 1))
-        else:
-            verses.append(int(verse_part))
-    
-    return chapter, verses
+from . import versification
+from .tasks import job_queue, PRIORITY_REQUESTED, PRIORITY_VIEWER
+from .index import quote_index
+from . import pagination
+from . import conditional
+from . import fragments
+import json
 
+@conditional.cache_policy('listing')
+@condition(etag_func=conditional.listing_etag, last_modified_func=conditional.listing_last_modified)
 def home(request):
     """Home page with Jesus quotes and search"""
     client = BibleAPIClient()
@@ -37,10 +27,11 @@ def home(request):
     view_mode = request.GET.get('mode', 'quotes')
     
     context = {
-        'books': Book.objects.all(),
+        'books': fragments.book_list(conditional.content_version_key(request)),
         'current_book': book_filter,
         'search_query': search_query,
-        'view_mode': view_mode
+        'view_mode': view_mode,
+        'fragment_ttl': fragments.ttl()
     }
     
     if search_query and view_mode == 'search':
@@ -49,12 +40,15 @@ def home(request):
             page = int(request.GET.get('page', 1))
             limit = 20
             offset = (page - 1) * limit
+            sort = request.GET.get('sort', 'canonical')
+            if sort not in ('canonical', 'relevance'):
+                sort = 'canonical'
             
             search_results = client.search_verses(
                 query=search_query,
                 limit=limit,
                 offset=offset,
-                sort='canonical'
+                sort=sort
             )
             
             verses = search_results.get('verses', [])
@@ -66,9 +60,11 @@ def home(request):
             context.update({
                 'search_results': verses,
                 'search_total': total,
+                'search_partial': search_results.get('partial', False),
                 'has_next': has_next,
                 'has_previous': has_previous,
                 'current_page': page,
+                'search_sort': sort,
                 'next_page': page + 1 if has_next else None,
                 'previous_page': page - 1 if has_previous else None,
             })
@@ -79,110 +75,113 @@ def home(request):
     
     else:
         # Show Jesus quotes with smart caching
-        quotes = Quote.objects.select_related('book').prefetch_related(
-            Prefetch(
-                'cached_verses',
-                queryset=CachedVerse.objects.order_by('verse_number')
-            )
-        )
+        # Previews come from the materialized rendition: one narrow query per page;
+        # the cards themselves are cached fragments keyed by the rendition stamp
+        quotes = Quote.objects.select_related('book', 'rendition').defer('rendition__text')
         
-        if book_filter:
-            quotes = quotes.filter(book__name=book_filter)
+        # Keyset pagination: ?after= / ?before= cursors instead of page numbers
+        after = pagination.decode_cursor(request.GET.get('after'))
+        before = pagination.decode_cursor(request.GET.get('before'))
         
         if search_query:
-            quotes = quotes.filter(
-                Q(cached_verses__text__icontains=search_query) |
-                Q(book__name__icontains=search_query) |
-                Q(reference__icontains=search_query)
-            ).distinct()
-        
-        paginator = Paginator(quotes, 20)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        
-        # Cache some quotes on-demand (only occasionally)
-        cache_key = 'last_cache_attempt'
-        last_cache = cache.get(cache_key, 0)
-        current_time = time.time()
-        
-        # Cache every 5 minutes at most, and only 20% of the time
-        if (current_time - last_cache > 300) and random.random() < 0.2:
-            try:
-                verse_cache.cache_random_quotes(2)  # Cache 2 quotes
-                cache.set(cache_key, current_time, 600)  # Remember for 10 minutes
-            except:
-                pass  # Ignore errors
+            # Filter in memory; ids come back in listing order so only one page is loaded
+            quote_ids = quote_index.search(search_query, book=book_filter)
+            page_obj = pagination.paginate_ids(quote_ids, quote_index.position, after=after, before=before)
+            quotes_by_id = quotes.in_bulk(page_obj.object_list)
+            page_obj.object_list = [quotes_by_id[quote_id] for quote_id in page_obj.object_list if quote_id in quotes_by_id]
+            total_quotes = len(quote_ids)
+        else:
+            if book_filter:
+                quotes = quotes.filter(book__name=book_filter)
+            
+            page_obj = pagination.paginate_quotes(quotes, after=after, before=before)
+            # Shares the version query with the ETag
+            total_quotes = pagination.quote_total(book_filter, conditional.content_version_key(request))
         
         context.update({
             'page_obj': page_obj,
-            'total_quotes': quotes.count()
+            'total_quotes': total_quotes
         })
     
     return render(request, 'quotes/home.html', context)
 
+@conditional.cache_policy('detail', revalidate=conditional.detail_incomplete)
+@condition(etag_func=conditional.detail_etag, last_modified_func=conditional.detail_last_modified)
 def quote_detail(request, quote_id):
-    """Detail view - cache this quote immediately"""
-    quote = get_object_or_404(Quote, id=quote_id)
+    """Detail view - renders the cached verses now and fills the rest in the background"""
+    quote = get_object_or_404(Quote.objects.select_related('book', 'rendition'), id=quote_id)
     
-    # Cache this specific quote if not cached
-    cached_verses = quote.cached_verses.all().order_by('verse_number')
+    # Fully cached quotes reuse their rendered verse list until the rendition changes
+    verses = fragments.get_verses(quote)
+    if verses is not None:
+        return render(request, 'quotes/detail.html', {'quote': quote, 'verses': verses})
     
-    if not cached_verses.exists():
-        try:
-            verse_cache.cache_quote_immediately(quote)
-            cached_verses = quote.cached_verses.all().order_by('verse_number')
-        except Exception as e:
-            messages.warning(request, "Loading verses, please refresh if needed.")
+    verses = detail_verses(quote.verses())
+    rendition = getattr(quote, 'rendition', None)
+    loading = not verses or (rendition is not None and rendition.missing_count > 0)
     
-    # Build verses list
-    verses = []
-    for cached_verse in cached_verses:
-        verses.append({
+    if loading:
+        # Never fetch from the API on the request thread: queue the fill ahead of
+        # background warming (run_workers picks it up) and let the page poll quote_verses
+        job_queue.enqueue([quote.id], priority=PRIORITY_VIEWER)
+    else:
+        fragments.set_verses(quote, verses)
+    
+    context = {
+        'quote': quote,
+        'verses': verses,
+        'loading': loading,
+        'poll_interval': getattr(settings, 'DETAIL_POLL_INTERVAL', 2),
+    }
+    return render(request, 'quotes/detail.html', context)
+
+def detail_verses(cached_verses):
+    """Template/JSON rows for a quote's cached verses, in order"""
+    return [
+        {
             'id': cached_verse.verse_id,
             'reference': cached_verse.reference,
             'text': cached_verse.text,
             'verse_number': cached_verse.verse_number,
             'cached': True
-        })
-    
-    # If still no verses, try to load a few immediately
-    if not verses:
-        client = BibleAPIClient()
-        verse_ids = quote.get_verse_ids_list()[:5]  # First 5 verses only
-        
-        for verse_id in verse_ids:
-            try:
-                verse_data = client.get_verse(verse_id)
-                if verse_data:
-                    verse_number = int(verse_id.split('.')[-1])
-                    verses.append({
-                        'id': verse_id,
-                        'reference': verse_data['reference'],
-                        'text': verse_data['text'],
-                        'verse_number': verse_number,
-                        'cached': False
-                    })
-            except:
-                continue
+        }
+        for cached_verse in cached_verses
+    ]
+
+@never_cache
+def quote_verses(request, quote_id):
+    """Polling endpoint for the detail page: the verses cached so far and what is still missing"""
+    quote = get_object_or_404(Quote.objects.select_related('rendition'), id=quote_id)
+    verses = detail_verses(quote.verses())
+    rendition = getattr(quote, 'rendition', None)
+    missing = rendition.missing_count if rendition is not None else None
+    complete = bool(verses) and not missing
     
-    # Sort by verse number
-    verses.sort(key=lambda x: x.get('verse_number', 0))
+    job = job_queue.status_of(quote.id)
+    if not complete and job not in ('queued', 'running'):
+        # The fill failed or was pruned: queue it again (enqueue holds off for JOB_REQUEUE_AFTER)
+        job_queue.enqueue([quote.id], priority=PRIORITY_VIEWER)
+        job = job_queue.status_of(quote.id)
     
-    context = {
-        'quote': quote,
-        'verses': verses
-    }
-    return render(request, 'quotes/detail.html', context)
+    return JsonResponse({
+        'verses': verses,
+        'missing_count': missing,
+        'complete': complete,
+        'job': job,  # the page stops polling once the job is done or failed
+    })
 
 def cache_verses_view(request):
-    """AJAX endpoint to cache verses on demand"""
+    """AJAX endpoint to queue a few uncached quotes for the cache workers"""
     if request.method == 'POST':
         try:
-            cached_count = verse_cache.cache_random_quotes(3)
+            quote_ids = Quote.objects.uncached().exclude(
+                cache_job__status__in=['queued', 'running']
+            ).values_list('id', flat=True)[:3]
+            queued_count = job_queue.enqueue(quote_ids, priority=PRIORITY_REQUESTED)
             return JsonResponse({
                 'success': True,
-                'cached_count': cached_count,
-                'message': f'Cached {cached_count} quotes'
+                'queued_count': queued_count,
+                'message': f'Queued {queued_count} quotes'
             })
         except Exception as e:
             return JsonResponse({
@@ -192,41 +191,181 @@ def cache_verses_view(request):
     
     return JsonResponse({'success': False, 'error': 'POST required'})
 
+# Fields api_quotes can return, and the ones it returns when ?fields= is not given
+# (the original payload, which existing clients read; trimming is opt-in)
+QUOTE_FIELDS = ('id', 'book', 'reference', 'text', 'verse_count', 'cached_count', 'missing_count', 'updated_at', 'verses')
+DEFAULT_QUOTE_FIELDS = ('book', 'reference', 'verses')
+
+@conditional.cache_policy('api')
+@condition(etag_func=conditional.api_etag, last_modified_func=conditional.api_last_modified)
 def api_quotes(request):
-    """API endpoint for quotes data"""
+    """API endpoint for quotes data, streamed in keyset batches.
+    
+    Every quote has book, reference and verses unless ?fields= picks others
+    (e.g. ?fields=book,reference,text,missing_count; verses=1 adds the verses
+    to any selection), ?limit=N&after=<cursor> pages through the quotes and
+    ?format=ndjson streams one quote per line, each with its resume cursor.
+    """
     book_name = request.GET.get('book', '')
     search_query = request.GET.get('q', '')
+    include_verses = request.GET.get('verses') == '1'
     
     if search_query:
         client = BibleAPIClient()
         try:
             results = client.search_verses(search_query, limit=50)
+            # True when upstream search failed and only the cached verses were searched
+            results['partial'] = results.get('partial', False)
             return JsonResponse(results)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     
+    fields = [field for field in request.GET.get('fields', '').split(',') if field] or list(DEFAULT_QUOTE_FIELDS)
+    if include_verses and 'verses' not in fields:
+        fields.append('verses')
+    unknown = [field for field in fields if field not in QUOTE_FIELDS]
+    if unknown:
+        return JsonResponse({'error': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+    
+    try:
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+    except ValueError:
+        limit = 0
+    if limit is not None and limit < 1:
+        return JsonResponse({'error': 'limit must be a positive integer'}, status=400)
+    after = pagination.decode_cursor(request.GET.get('after'))
+    
+    quotes = Quote.objects.select_related('book', 'rendition')
+    if 'text' not in fields:
+        quotes = quotes.defer('rendition__text')
+    if book_name:
+        quotes = quotes.filter(book__name=book_name)
+    
+    rows = export_quotes(quotes, fields, after, limit)
+    if request.GET.get('format') == 'ndjson':
+        return StreamingHttpResponse(ndjson_lines(rows), content_type='application/x-ndjson')
+    return StreamingHttpResponse(json_envelope(rows), content_type='application/json')
+
+def export_quotes(quotes, fields, after=None, limit=None):
+    """Yield (quote dict, cursor) for each quote, then (None, next page cursor or None)"""
+    page = None
+    for page in pagination.iter_pages(quotes, after=after, limit=limit):
+        batch = attach_verses(page.object_list) if 'verses' in fields else page.object_list
+        for quote in batch:
+            yield quote_data(quote, fields), pagination.encode_cursor(pagination.quote_key(quote))
+    yield None, page.next_cursor if page is not None else None
+
+def quote_data(quote, fields):
+    """JSON-ready dict of the requested fields of one quote"""
+    try:
+        rendition = quote.rendition
+    except QuoteRendition.DoesNotExist:
+        rendition = QuoteRendition(quote=quote)
+    
+    values = {
+        'id': quote.id,
+        'book': quote.book.name,
+        'reference': quote.reference,
+        'text': rendition.text if 'text' in fields else '',
+        'verse_count': rendition.verse_count,
+        'cached_count': rendition.cached_count,
+        'missing_count': rendition.missing_count,
+        'updated_at': rendition.updated_at.isoformat(),
+    }
+    if 'verses' in fields:
+        values['verses'] = [
+            {'verse': verse.verse_number, 'text': verse.text, 'reference': verse.reference}
+            for verse in quote.verses()
+        ]
+    return {field: values[field] for field in fields}
+
+def json_envelope(rows):
+    """Stream {"quotes": [...], "next": cursor} one quote at a time"""
+    yield '{"quotes": ['
+    separator = ''
+    for data, cursor in rows:
+        if data is None:
+            yield f'], "next": {json.dumps(cursor)}}}'
+            return
+        yield separator + json.dumps(data)
+        separator = ', '
+
+def ndjson_lines(rows):
+    """Stream one quote per line, each carrying the cursor to resume after it"""
+    for data, cursor in rows:
+        if data is not None:
+            data['cursor'] = cursor
+            yield json.dumps(data) + '\n'
+
+# Limits for one api_resolve call
+RESOLVE_MAX_REFS = 50
+RESOLVE_MAX_VERSES = 1000
+
+@csrf_exempt  # read-only lookup, POST only so long ref lists fit in a body
+def api_resolve(request):
+    """Resolve many verse ids or references in one call, answered in request order.
+    
+    GET ?ref=Matthew 5:3-12; John 3:16&ref=MAT.5.3 (repeatable), ?ids=MAT.5.3,JHN.3.16
+    and ?book=MAT for references without a book name; or POST a JSON body
+    {"refs": [...], "book": "MAT"}.
+    """
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+        refs = body.get('refs') if isinstance(body, dict) else None
+        book = body.get('book') if isinstance(body, dict) else None
+        if not isinstance(refs, list) or not all(isinstance(ref, str) for ref in refs):
+            return JsonResponse({'error': 'refs must be a list of strings'}, status=400)
+        if book is not None and not isinstance(book, str):
+            return JsonResponse({'error': 'book must be a string'}, status=400)
+        book = book or None
     else:
-        quotes = Quote.objects.select_related('book').prefetch_related('cached_verses')
-        if book_name:
-            quotes = quotes.filter(book__name=book_name)
-        
-        data = []
-        for quote in quotes:
-            verses_data = []
-            for verse in quote.cached_verses.all().order_by('verse_number'):
-                verses_data.append({
-                    'verse': verse.verse_number,
-                    'text': verse.text,
-                    'reference': verse.reference
-                })
-            
-            data.append({
-                'book': quote.book.name,
-                'reference': quote.reference,
-                'verses': verses_data
-            })
-        
-        return JsonResponse({'quotes': data})
+        refs = request.GET.getlist('ref')
+        refs += [verse_id for verse_id in request.GET.get('ids', '').split(',') if verse_id.strip()]
+        book = request.GET.get('book') or None
+    
+    if not refs:
+        return JsonResponse({'error': 'Pass at least one ref or id'}, status=400)
+    if len(refs) > RESOLVE_MAX_REFS:
+        return JsonResponse({'error': f'At most {RESOLVE_MAX_REFS} refs per request'}, status=400)
+    
+    # Parse everything first so the lookup below covers all refs at once
+    parsed = []
+    for ref in refs:
+        try:
+            parsed.append(versification.parse_reference(ref, book))
+        except ValueError as e:
+            parsed.append(str(e))
+    all_ranges = [verse_range for ranges in parsed if not isinstance(ranges, str) for verse_range in ranges]
+    if sum(end - start + 1 for start, end in all_ranges) > RESOLVE_MAX_VERSES:
+        return JsonResponse({'error': f'At most {RESOLVE_MAX_VERSES} verses per request'}, status=400)
+    
+    found = BibleAPIClient().resolve_ranges(all_ranges)
+    
+    results = []
+    for ref, ranges in zip(refs, parsed):
+        if isinstance(ranges, str):
+            results.append({'query': ref, 'error': ranges})
+            continue
+        verses = []
+        missing = []
+        for start, end in ranges:
+            for ordinal in range(start, end + 1):
+                verse = found.get(ordinal)
+                if verse is None:
+                    missing.append(versification.verse_id_for_ordinal(ordinal))
+                else:
+                    verses.append({
+                        'id': verse['id'],
+                        'reference': verse['reference'],
+                        'text': verse['text'],
+                        'verse': verse['verse_number']
+                    })
+        results.append({'query': ref, 'verses': verses, 'missing': missing})
+    
+    return JsonResponse({'results': results})
 
 def custom_permission_denied(request, exception=None):
     return render(request, "403.html", status=403)
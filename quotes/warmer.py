@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import connection
+from .bible_api import BibleAPIClient
+from . import planner
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    """Chapters a warm has already fetched, saved to a JSON file so an interrupted run resumes.
+
+    Cached verses are skipped by the plan anyway; the checkpoint also covers
+    chapters the upstream returned short (their missing verses never appear),
+    so a resumed run does not fetch those again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if data.get('version') == CHECKPOINT_VERSION:
+            self.done = {tuple(chapter) for chapter in data.get('done', [])}
+        return self
+
+    def mark(self, chapter, every=5.0):
+        """Record a fetched chapter; the file is rewritten at most every `every` seconds"""
+        with self._lock:
+            self.done.add(chapter)
+            if time.monotonic() - self._saved_at >= every:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        # Write then rename, so a kill mid-write never leaves a truncated checkpoint
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'version': CHECKPOINT_VERSION, 'done': sorted(self.done)}, f)
+        os.replace(temp_path, self.path)
+        self._saved_at = time.monotonic()
+
+    def clear(self):
+        self.done = set()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def warm(calls, concurrency=8, checkpoint=None, progress=None):
+    """Run planned calls on a thread pool (rate limits apply per upstream host in the transport).
+
+    Calls progress(done, failed, total, started_at) after every call and
+    returns (fetched, failed) lists of (api_id, chapter) pairs.
+    """
+    client = BibleAPIClient()
+    fetched, failed = [], []
+    started_at = time.monotonic()
+
+    def fetch(call):
+        try:
+            return planner.execute(client, call)
+        finally:
+            connection.close()
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='cache-warm')
+    futures = {pool.submit(fetch, call): call for call in calls}
+    try:
+        for future in as_completed(futures):
+            call = futures[future]
+            chapter = (call.api_id, call.chapter)
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"Error warming {call.api_id}.{call.chapter}: {e}")
+                ok = False
+            if ok:
+                fetched.append(chapter)
+                if checkpoint is not None:
+                    checkpoint.mark(chapter)
+            else:
+                failed.append(chapter)
+            if progress is not None:
+                progress(len(fetched), len(failed), len(calls), started_at)
+    finally:
+        # On Ctrl-C queued chapters are dropped, the ones in flight finish
+        pool.shutdown(wait=True, cancel_futures=True)
+        if checkpoint is not None:
+            checkpoint.save()
+    return fetched, failed
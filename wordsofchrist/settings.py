@@ -39,6 +39,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'quotes.middleware.LatencyBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'wordsofchrist.urls'
@@ -70,6 +71,10 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
         'OPTIONS': {
             'timeout': 60,  # 60 second timeout
+            # Take the write lock when a transaction starts, so concurrent writers (cache
+            # workers, request threads) wait on the timeout instead of failing with
+            # "database is locked" when a read transaction tries to upgrade
+            'transaction_mode': 'IMMEDIATE',
         }
     }
 }
@@ -79,6 +84,99 @@ API_BIBLE_KEY = '47b3f2f5a2cf5e70e2f5dba5265e44f1'
 API_BIBLE_BASE_URL = 'https://api.scripture.api.bible/v1'
 BIBLE_ID = 'de4e12af7f28f599-02' 
 
+# Shared HTTP transport for the Bible APIs (quotes/http.py)
+BIBLE_HTTP_POOL_SIZE = 10  # keep-alive connections per upstream host
+BIBLE_HTTP_CONNECT_TIMEOUT = 3.05  # seconds
+BIBLE_HTTP_READ_TIMEOUT = 10  # seconds
+BIBLE_HTTP_MAX_RETRIES = 3  # retries on 429/5xx and connection errors
+BIBLE_HTTP_BACKOFF_BASE = 0.5  # seconds, doubled per attempt (with jitter)
+BIBLE_HTTP_BACKOFF_MAX = 8  # seconds, also caps Retry-After
+
+# Token-bucket rate limits per upstream host (quotes/resilience.py), per process:
+# (requests per second, burst). Hosts not listed are not limited.
+BIBLE_RATE_LIMITS = {
+    'cdn.jsdelivr.net': (10, 20),
+    'api.scripture.api.bible': (2, 5),
+}
+
+# 'chapter' fetches a whole chapter per cache miss and bulk-caches it; 'verse' fetches one verse file
+BIBLE_FETCH_MODE = 'chapter'
+
+# Set once `manage.py import_corpus <file>` has loaded a local KJV corpus:
+# verse lookups are then answered from CachedVerse only and never hit the network
+BIBLE_OFFLINE_CORPUS = False
+
+# In-memory quote search index (quotes/index.py): full rebuild interval in seconds,
+# so workers also pick up verses cached by other processes
+QUOTE_INDEX_MAX_AGE = 300
+
+# Per-book quote totals for the listing (quotes/pagination.py), cached instead of a COUNT per page
+QUOTE_TOTALS_TTL = 3600
+
+# Lifetime of cached page fragments (quotes/fragments.py, {% cache %} in home.html); keys carry
+# the quote's rendition stamp, so changed quotes miss immediately and old entries just expire
+FRAGMENT_CACHE_TTL = 24 * 3600
+
+# Seconds between the detail page's polls for verses still being cached in the background
+DETAIL_POLL_INTERVAL = 2
+
+# Cache-fill job queue (quotes/tasks.py, CacheJob table), consumed by `manage.py run_workers`
+CACHE_WORKERS = 4  # consumer threads per run_workers process
+JOB_POLL_INTERVAL = 2  # seconds an idle worker waits before looking for jobs again
+JOB_LEASE_SECONDS = 300  # a job whose worker died is picked up again after this
+JOB_MAX_ATTEMPTS = 5  # failed fills are retried this many times, then marked failed
+JOB_RETRY_BACKOFF = 30  # seconds before the first retry, doubled per attempt...
+JOB_RETRY_BACKOFF_MAX = 3600  # ...up to this
+JOB_REQUEUE_AFTER = 300  # seconds before a done/failed job can be queued again
+
+# Cross-process leases on cache-fill work (quotes/leases.py): one worker per chapter/quote at a time
+LEASE_TTL = 60  # seconds before a lease whose holder died can be taken over (live holders renew every TTL/3)
+LEASE_WAIT = 5  # seconds a chapter fetch waits for another worker's lease before serving the cache
+
+# `manage.py cache_all_quotes`: chapters fetched in parallel, progress file for resuming
+WARM_CONCURRENCY = 8
+WARM_CHECKPOINT_FILE = BASE_DIR / 'cache_warm.checkpoint.json'
+
+# Default file for `manage.py export_cache` / `import_cache`: copy it to a new node instead of
+# warming its cache from the APIs again
+CACHE_SNAPSHOT_FILE = BASE_DIR / 'cache_snapshot.jsonl.gz'
+
+# Cache-Control max-age (seconds) per view kind (quotes/conditional.py); every response also
+# carries an ETag/Last-Modified from the quote data, so repeats revalidate with a 304
+HTTP_CACHE_MAX_AGE = {
+    'listing': 60,
+    'detail': 300,
+    'api': 60,
+}
+
+# API.Bible search cache (quotes/search_cache.py); prune with `manage.py prune_search_cache`
+SEARCH_CACHE_WINDOW = 100  # results fetched and stored per query window, pages are sliced from it
+SEARCH_CACHE_TTL = 24 * 3600  # seconds a window is served as fresh
+SEARCH_CACHE_STALE_TTL = 7 * 24 * 3600  # seconds a window is served stale while refreshing
+SEARCH_CACHE_MAX_ROWS = 5000
+SEARCH_CACHE_MAX_BYTES = 20 * 1024 * 1024
+
+# Negative cache for failed upstream lookups (quotes/negative_cache.py), TTLs in seconds per reason
+NEGATIVE_CACHE_TTLS = {
+    'not_found': 7 * 24 * 3600,
+    'unknown_book': 30 * 24 * 3600,
+    'network': 60,
+    'upstream_error': 300,
+}
+NEGATIVE_CACHE_MAX_ROWS = 10000
+
+# Per-upstream circuit breakers (quotes/resilience.py)
+BIBLE_BREAKER_WINDOW = 20  # recent calls considered
+BIBLE_BREAKER_MIN_CALLS = 5  # calls needed before the breaker can trip
+BIBLE_BREAKER_FAILURE_RATE = 0.5  # trip when half the window failed...
+BIBLE_BREAKER_SLOW_CALL = 5.0  # ...or when calls slower than this (seconds)
+BIBLE_BREAKER_SLOW_RATE = 0.8  # make up this share of the window
+BIBLE_BREAKER_COOLDOWN = 30  # seconds open before a half-open probe
+
+# Seconds a web request may spend on upstream Bible API calls (LatencyBudgetMiddleware);
+# after that views serve what is cached. None disables the budget.
+BIBLE_REQUEST_BUDGET = 2.5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators